@@ -0,0 +1,258 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Plugin Developer Documenter by RogueProeliator <rp@rogueproeliator.com>
+# 	Command line tool that converts the descriptor files (Actions, Devices, Events,
+#	MenuItems and PluginConfig) of one or more .indigoPlugin bundles between XML and
+#	the badgerfish JSON read by PluginBase, using the same conversion as the plugin's
+#	convertXmlFileToJson shell utility. Files are converted in parallel worker processes
+#	and a file is only converted again once its source has changed:
+#
+#		python descriptorConverter.py --to-json "My Plugin.indigoPlugin"
+#		python descriptorConverter.py --to-xml --skip hash --jobs 8 build/
+#
+#	A folder that is not itself a bundle is searched for the .indigoPlugin bundles it
+#	holds. The converted file is written next to its source; note that PluginBase reads
+#	the .json version of a descriptor whenever one exists.
+#
+#	Skip modes:
+#		mtime	skips a file when its output is at least as new as the source
+#		hash	skips a file when its SHA-1 matches the one recorded in the bundle's
+#				manifest (.descriptorConverter.json) after the last conversion and its
+#				output still exists
+#		none	converts every file
+#
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Python imports
+#/////////////////////////////////////////////////////////////////////////////////////////
+import argparse
+import collections
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import xml.etree.ElementTree as xmlTree
+from xmljson import badgerfish as badgerfish
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Constants
+#/////////////////////////////////////////////////////////////////////////////////////////
+kDescriptorBasenames = [u"Actions", u"Devices", u"Events", u"MenuItems", u"PluginConfig"]
+kManifestFilename = u".descriptorConverter.json"
+kManifestFormatVersion = 1
+
+# Same comment stripping as PluginBase._stripJsonComments
+kJsonTextWithoutCommentsRegex = re.compile(r'''[^/"']*(?:(?:"[^\\"]*(?:\\.[^\\"]*)*"|'[^\\']*(?:\\.[^\\']*)*')[^/"']*)*''', re.DOTALL)
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Conversion (run in the worker processes)
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+def stripJsonComments(input):
+	if "/" not in input:
+		return input
+
+	skipText = kJsonTextWithoutCommentsRegex.match
+	inputLength = len(input)
+	outputParts = []
+	copyStart = 0
+	pos = 0
+	while True:
+		pos = skipText(input, pos).end()
+		if pos >= inputLength:
+			break
+		if input.startswith("//", pos):
+			commentEnd = input.find("\n", pos + 2)
+			if commentEnd == -1:
+				commentEnd = inputLength
+		elif input.startswith("/*", pos):
+			commentEnd = input.find("*/", pos + 2)
+			if commentEnd == -1:
+				pos += 1
+				continue
+			commentEnd += 2
+		else:
+			pos += 1
+			continue
+		outputParts.append(input[copyStart:pos])
+		outputParts.append(" ")
+		copyStart = pos = commentEnd
+
+	if copyStart == 0:
+		return input
+	outputParts.append(input[copyStart:])
+	return "".join(outputParts)
+
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+# Returns the JSON text for the contents of an XML descriptor, as written by
+# convertXmlFileToJson
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+def convertXmlToJson(rawContents):
+	return json.dumps(badgerfish.data(xmlTree.XML(rawContents)), indent=4)
+
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+# Returns the (indented) XML text for the contents of a JSON descriptor; the order of
+# the JSON object keys is kept so that the elements come out in the order written
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+def convertJsonToXml(rawContents):
+	jsonTree = json.loads(stripJsonComments(rawContents), object_pairs_hook=collections.OrderedDict)
+	elemTreeList = badgerfish.etree(jsonTree)
+	if len(elemTreeList) != 1:
+		raise ValueError(u"JSON descriptor must have exactly one root element (found %d)" % (len(elemTreeList)))
+	indentElement(elemTreeList[0])
+	return "<?xml version=\"1.0\"?>\n" + xmlTree.tostring(elemTreeList[0], encoding="UTF-8").split("\n", 1)[1] + "\n"
+
+def indentElement(elem, level=0):
+	childIndent = "\n" + "\t" * (level + 1)
+	if len(elem) > 0:
+		if elem.text is None or len(elem.text.strip()) == 0:
+			elem.text = childIndent
+		for child in elem:
+			indentElement(child, level + 1)
+			child.tail = childIndent
+		child.tail = "\n" + "\t" * level
+
+def getFileHash(rawContents):
+	return hashlib.sha1(rawContents).hexdigest()
+
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+# Converts a single file; returns (sourcePath, status, sourceHash, message) where status
+# is "converted", "skipped" or "failed". recordedHash is the hash from the manifest in
+# hash mode (None otherwise)
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+def convertFile(task):
+	(sourcePath, outputPath, toJson, skipMode, recordedHash) = task
+	try:
+		if skipMode == "mtime" and os.path.isfile(outputPath) and os.path.getmtime(outputPath) >= os.path.getmtime(sourcePath):
+			return (sourcePath, "skipped", None, u"")
+
+		f = file(sourcePath, 'r')
+		rawContents = f.read()
+		f.close()
+		sourceHash = getFileHash(rawContents)
+		if skipMode == "hash" and sourceHash == recordedHash and os.path.isfile(outputPath):
+			return (sourcePath, "skipped", sourceHash, u"")
+
+		if toJson:
+			outputContents = convertXmlToJson(rawContents)
+		else:
+			outputContents = convertJsonToXml(rawContents)
+
+		# write to a temporary file and rename it so that a plugin (or another build)
+		# never reads a partially written file
+		tempPath = "%s.%d.tmp" % (outputPath, os.getpid())
+		f = file(tempPath, 'w')
+		f.write(outputContents)
+		f.close()
+		os.rename(tempPath, outputPath)
+		return (sourcePath, "converted", sourceHash, u"")
+	except Exception, e:
+		return (sourcePath, "failed", None, unicode(e))
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Bundle handling (run in the main process)
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+def findPluginBundles(paths):
+	bundlePaths = []
+	for path in paths:
+		path = os.path.abspath(path)
+		if path.rstrip("/").endswith(".indigoPlugin"):
+			bundlePaths.append(path)
+		elif os.path.isdir(path):
+			for (folderPath, folderNames, filenames) in os.walk(path):
+				for folderName in sorted(folderNames):
+					if folderName.endswith(".indigoPlugin"):
+						bundlePaths.append(os.path.join(folderPath, folderName))
+				# bundles are not nested in one another
+				folderNames[:] = [folderName for folderName in folderNames if not folderName.endswith(".indigoPlugin")]
+		else:
+			print("not a plugin bundle or folder: %s" % (path))
+	return bundlePaths
+
+def loadManifest(manifestPath):
+	try:
+		f = file(manifestPath, 'r')
+		manifest = json.load(f)
+		f.close()
+		if manifest.get(u"version") == kManifestFormatVersion:
+			return manifest.get(u"files", {})
+	except (IOError, ValueError):
+		pass
+	return {}
+
+def saveManifest(manifestPath, fileHashes):
+	tempPath = "%s.%d.tmp" % (manifestPath, os.getpid())
+	f = file(tempPath, 'w')
+	json.dump({u"version" : kManifestFormatVersion, u"files" : fileHashes}, f, indent=4, sort_keys=True)
+	f.close()
+	os.rename(tempPath, manifestPath)
+
+def main(argv):
+	parser = argparse.ArgumentParser(description=u"Converts the descriptor files of Indigo plugin bundles between XML and JSON.")
+	directionGroup = parser.add_mutually_exclusive_group(required=True)
+	directionGroup.add_argument("--to-json", dest="toJson", action="store_true", help=u"convert the .xml descriptors to .json")
+	directionGroup.add_argument("--to-xml", dest="toJson", action="store_false", help=u"convert the .json descriptors to .xml")
+	parser.add_argument("--skip", choices=["mtime", "hash", "none"], default="mtime", help=u"how to find the files that need no conversion (default: mtime)")
+	parser.add_argument("--jobs", type=int, default=multiprocessing.cpu_count(), help=u"number of worker processes (default: one per CPU)")
+	parser.add_argument("paths", nargs="+", help=u".indigoPlugin bundles, or folders holding them")
+	args = parser.parse_args(argv)
+
+	(sourceExtension, outputExtension) = (".xml", ".json") if args.toJson else (".json", ".xml")
+	startTime = time.time()
+
+	# the manifest is per bundle and per direction, keyed by the source file's name
+	manifests = dict()
+	tasks = []
+	for bundlePath in findPluginBundles(args.paths):
+		serverPluginFolder = os.path.join(bundlePath, "Contents", "Server Plugin")
+		manifestPath = os.path.join(serverPluginFolder, kManifestFilename)
+		if args.skip == "hash":
+			manifests[manifestPath] = loadManifest(manifestPath)
+		for basename in kDescriptorBasenames:
+			sourcePath = os.path.join(serverPluginFolder, basename + sourceExtension)
+			if not os.path.isfile(sourcePath):
+				continue
+			recordedHash = None
+			if args.skip == "hash":
+				recordedHash = manifests[manifestPath].get(basename + sourceExtension, None)
+			tasks.append((sourcePath, os.path.join(serverPluginFolder, basename + outputExtension), args.toJson, args.skip, recordedHash))
+
+	statusCounts = collections.Counter()
+	if len(tasks) > 0:
+		pool = multiprocessing.Pool(max(1, min(args.jobs, len(tasks))))
+		try:
+			for (sourcePath, status, sourceHash, message) in pool.imap_unordered(convertFile, tasks):
+				statusCounts[status] += 1
+				if status == "failed":
+					print("FAILED %s: %s" % (sourcePath, message))
+				elif status == "converted":
+					print("converted %s" % (sourcePath))
+				if sourceHash is not None and args.skip == "hash":
+					manifestPath = os.path.join(os.path.dirname(sourcePath), kManifestFilename)
+					manifests[manifestPath][os.path.basename(sourcePath)] = sourceHash
+		finally:
+			pool.close()
+			pool.join()
+
+	for (manifestPath, fileHashes) in manifests.iteritems():
+		saveManifest(manifestPath, fileHashes)
+
+	print("%d converted, %d skipped, %d failed in %.2f sec" % (statusCounts["converted"], statusCounts["skipped"], statusCounts["failed"], time.time() - startTime))
+	return 1 if statusCounts["failed"] > 0 else 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
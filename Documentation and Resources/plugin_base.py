@@ -4,15 +4,23 @@
 # Copyright (c) 2017, Perceptive Automation, LLC. All rights reserved.
 # http://www.indigodomo.com
 
+import collections
+import copy
+import cPickle
 import errno
+import hashlib
 import json
 import logging
 import logging.handlers
 import os
 import re
+import resource
 import select
+import shutil
 import string
+import subprocess
 import sys
+import tempfile
 import threading
 import time
 import traceback
@@ -33,8 +41,44 @@ kDevicesFilename = u"Devices"				# + .xml or .json
 kEventsFilename = u"Events"					# + .xml or .json
 kActionsFilename = u"Actions"				# + .xml or .json
 
+kDescriptorCacheFilename = u".descriptorCache.pickle"	# compiled MenuItems/Devices/Events/Actions, prefixed with "." + plugin ID
+kDescriptorCacheFormatVersion = 3
+
+# Matches the longest run of JSON text that holds no comment: anything but '/' and
+# quotes, along with complete string literals (which may themselves contain '/')
+kJsonTextWithoutCommentsRegex = re.compile(r'''[^/"']*(?:(?:"[^\\"]*(?:\\.[^\\"]*)*"|'[^\\']*(?:\\.[^\\']*)*')[^/"']*)*''', re.DOTALL)
+
+# %%v:varId%% and %%d:devId:stateKey%% markers replaced by substitute()
+kSubstituteVariableRegex = re.compile("\%%v:([0-9]*)%%")
+kSubstituteDeviceStateRegex = re.compile("\%%d:([0-9]*):([A-z0-9\.]*)%%")
+
 kPluginDebugMode_debugShell = 200	# Mirrored from CPlugin.h
 
+# Run by the descriptor loading benchmarks in a fresh interpreter (see
+# _loadDevicesInChildProcess): imports this file with a stand-in for the indigo module
+# (the parser only needs its Dict, List, kTriggerKeyType, server.version and
+# host.resourcesFolderPath) and writes the pickled result to stdout, or the traceback to
+# stderr with a non-zero exit status
+kDescriptorLoadChildScript = r'''
+import cPickle, imp, sys, traceback, types
+try:
+	(pluginBasePath, hostPath, serverVersion, resourcesFolderPath, folder, attributes, aliases) = cPickle.load(sys.stdin)
+	sys.path[0:0] = [path for path in hostPath if path not in sys.path]
+	indigo = types.ModuleType("indigo")
+	indigo.Dict = type("Dict", (dict,), {})
+	indigo.List = type("List", (list,), {})
+	indigo.kTriggerKeyType = type("kTriggerKeyType", (object,), dict((name, value) for (value, name) in enumerate(["Label", "Number", "String", "Enumeration", "BoolOnOff", "BoolYesNo", "BoolOneZero", "BoolTrueFalse"])))
+	indigo.server = type("server", (object,), {"version": serverVersion})
+	indigo.host = type("host", (object,), {"resourcesFolderPath": resourcesFolderPath})
+	sys.modules["indigo"] = indigo
+	pluginBase = imp.load_source("plugin_base", pluginBasePath)
+	result = pluginBase.PluginBase._loadDevicesForBenchmark(folder, attributes, aliases)
+	sys.stdout.write(cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL))
+except BaseException:
+	traceback.print_exc()
+	sys.exit(1)
+'''
+
 ################################################################################
 ################################################################################
 # Logging additions
@@ -77,6 +121,10 @@ class IndigoLogHandler(logging.Handler, object):
 		self.displayName = displayName
 
 	def emit(self, record):
+		(type_string, is_error) = self._getRecordLogType(record)
+		indigo.server.log(message=self.format(record), type=type_string, isError=is_error)
+
+	def _getRecordLogType(self, record):
 		# First, determine if it needs to be an Indigo error
 		is_error = False
 		if record.levelno in (logging.ERROR, logging.CRITICAL):
@@ -86,8 +134,170 @@ class IndigoLogHandler(logging.Handler, object):
 		# the debug level (i.e. Critical, Warning, Debug, etc) to the type string
 		if record.levelno not in (logging.INFO, logging.ERROR):
 			type_string += u" %s" % record.levelname.title()
-		# Then we write the message
-		indigo.server.log(message=self.format(record), type=type_string, isError=is_error)
+		return (type_string, is_error)
+
+################################################################################
+# Queue-backed version of the IndigoLogHandler. Calling threads format the
+# record (so that its arguments are rendered with the values they have when
+# logged, as logging.handlers.QueueHandler.prepare does in Python 3) and append
+# it to a bounded queue; a background thread sends them to IndigoServer.
+#
+# With combineRecords (the default) consecutive records that share the same
+# type/error flag are joined with newlines into a single indigo.server.log()
+# call, one IPC round-trip per batch instead of one per record. They then show
+# up in the Indigo log as one entry with one timestamp; pass
+# combineRecords=False to send each record as an entry of its own.
+#
+# When the queue is full the overflow policy decides what is discarded:
+#	kLogOverflowDropDebugFirst - the oldest queued DEBUG (or lower) record is
+#		dropped to make room; if there is none the new record is dropped
+#	kLogOverflowDropNewest - the new record is dropped
+#	kLogOverflowDropOldest - the oldest queued non-error record is dropped
+# ERROR and CRITICAL records are never dropped, even if the queue is full.
+################################################################################
+kLogOverflowDropDebugFirst = u"dropDebugFirst"
+kLogOverflowDropNewest = u"dropNewest"
+kLogOverflowDropOldest = u"dropOldest"
+
+class QueuedIndigoLogHandler(IndigoLogHandler):
+	def __init__(self, displayName, level=logging.NOTSET, maxQueueSize=2000, batchSize=50, overflowPolicy=kLogOverflowDropDebugFirst, combineRecords=True):
+		super(QueuedIndigoLogHandler, self).__init__(displayName, level)
+		self.maxQueueSize = maxQueueSize
+		self.batchSize = batchSize
+		self.overflowPolicy = overflowPolicy
+		self.combineRecords = combineRecords
+
+		# Counters (read them any time; they are only approximate while records are in flight)
+		self.queuedCount = 0
+		self.droppedCount = 0
+		self.sentCount = 0
+
+		self._queue = collections.deque()
+		self._queueCondition = threading.Condition(threading.Lock())
+		self._inFlightCount = 0
+		self._lowPriorityCount = 0
+		self._stopping = False
+		self._senderThread = threading.Thread(target=self._senderThreadRun)
+		self._senderThread.setName("indigoLogSenderThread")
+		self._senderThread.setDaemon(True)
+		self._senderThread.start()
+
+	@property
+	def pendingCount(self):
+		return len(self._queue) + self._inFlightCount
+
+	def emit(self, record):
+		try:
+			record = self._prepareRecord(record)
+		except Exception:
+			self.handleError(record)
+			return
+		with self._queueCondition:
+			if len(self._queue) >= self.maxQueueSize and record.levelno < logging.ERROR:
+				if not self._makeRoomForRecord(record):
+					self.droppedCount += 1
+					return
+			self._queue.append(record)
+			if record.levelno <= logging.DEBUG:
+				self._lowPriorityCount += 1
+			self.queuedCount += 1
+			self._queueCondition.notify()
+
+	def _prepareRecord(self, record):
+		# Returns a copy of the record holding the formatted message and no arguments or
+		# exception info, leaving the original intact for the other handlers
+		message = self.format(record)
+		record = copy.copy(record)
+		record.msg = message
+		record.args = None
+		record.exc_info = None
+		record.exc_text = None
+		return record
+
+	def _makeRoomForRecord(self, record):
+		# Called with the queue lock held and the queue full. Returns True if a queued
+		# record was discarded in favor of the new one.
+		if self.overflowPolicy == kLogOverflowDropDebugFirst:
+			if self._lowPriorityCount == 0 or record.levelno <= logging.DEBUG:
+				return False
+			for queuedRecord in self._queue:
+				if queuedRecord.levelno <= logging.DEBUG:
+					self._queue.remove(queuedRecord)
+					self._lowPriorityCount -= 1
+					self.droppedCount += 1
+					return True
+		elif self.overflowPolicy == kLogOverflowDropOldest:
+			for queuedRecord in self._queue:
+				if queuedRecord.levelno < logging.ERROR:
+					self._queue.remove(queuedRecord)
+					if queuedRecord.levelno <= logging.DEBUG:
+						self._lowPriorityCount -= 1
+					self.droppedCount += 1
+					return True
+		return False
+
+	def _senderThreadRun(self):
+		while True:
+			with self._queueCondition:
+				while len(self._queue) == 0 and not self._stopping:
+					self._queueCondition.wait()
+				if len(self._queue) == 0:
+					return		# stopping and fully drained
+				batch = []
+				while len(self._queue) > 0 and len(batch) < self.batchSize:
+					record = self._queue.popleft()
+					if record.levelno <= logging.DEBUG:
+						self._lowPriorityCount -= 1
+					batch.append(record)
+				self._inFlightCount = len(batch)
+			try:
+				self._sendBatch(batch)
+			finally:
+				with self._queueCondition:
+					self._inFlightCount = 0
+					self.sentCount += len(batch)
+					self._queueCondition.notifyAll()
+
+	def _sendBatch(self, batch):
+		messages = []
+		batchType = None
+		for record in batch:
+			# the message was formatted by emit
+			message = record.msg
+			recordType = self._getRecordLogType(record)
+			if (recordType != batchType or not self.combineRecords) and len(messages) > 0:
+				self._sendMessages(messages, batchType)
+				messages = []
+			batchType = recordType
+			messages.append(message)
+		if len(messages) > 0:
+			self._sendMessages(messages, batchType)
+
+	def _sendMessages(self, messages, batchType):
+		(type_string, is_error) = batchType
+		try:
+			indigo.server.log(message=u"\n".join(messages), type=type_string, isError=is_error)
+		except Exception:
+			pass	# IndigoServer connection may already be gone during shutdown; nowhere left to log it
+
+	def flush(self, timeout=5.0):
+		# Blocks until everything queued so far has been sent to IndigoServer (or the
+		# timeout expires).
+		stopTime = time.time() + timeout
+		with self._queueCondition:
+			while self.pendingCount > 0 and self._senderThread.isAlive():
+				remaining = stopTime - time.time()
+				if remaining <= 0.0:
+					break
+				self._queueCondition.wait(remaining)
+
+	def close(self):
+		self.flush()
+		with self._queueCondition:
+			self._stopping = True
+			self._queueCondition.notifyAll()
+		self._senderThread.join(1.0)
+		super(QueuedIndigoLogHandler, self).close()
 
 ################################################################################
 ################################################################################
@@ -175,6 +385,197 @@ fieldTypeTemplates = {
 	u"serialport": u"_configUiField_serialPort.json"
 }
 
+################################################################################
+# Read-only stand-in for an ElementTree element over JSON descriptor data that
+# follows the badgerfish convention: "@name" keys are attributes, "$" is the text
+# and every other key is a child element (several, if its value is a list). The
+# descriptor parsers only read tags, attributes, text and children, which are
+# answered straight from the json.loads() data; toElement() builds the same
+# element badgerfish.etree() would for the parts that must be serialized as XML,
+# such as a ConfigUI.
+class BadgerfishJsonElement(object):
+	__slots__ = ("tag", "text", "_value")
+
+	def __init__(self, tag, value):
+		self.tag = tag
+		self.text = None
+		if isinstance(value, dict) and u"$" in value:
+			self.text = self._toString(value[u"$"])
+		self._value = value
+
+	# Returns the root element of a json.loads() result, or None if it is empty
+	@staticmethod
+	def fromJson(jsonTree):
+		rootElems = list(BadgerfishJsonElement(None, jsonTree))
+		if len(rootElems) == 0:
+			return None
+		return rootElems[0]
+
+	@staticmethod
+	def _toString(value):
+		# Same conversion as xmljson's for attribute and text values
+		if value is True:
+			return u"true"
+		elif value is False:
+			return u"false"
+		elif value is None:
+			return u""
+		return unicode(value)
+
+	@staticmethod
+	def _childValues(value):
+		if not isinstance(value, list):
+			value = [value]
+		return [childValue if isinstance(childValue, (dict, list)) else {u"$": childValue} for childValue in value]
+
+	@property
+	def attrib(self):
+		return self.toElement().attrib
+
+	def get(self, key, default=None):
+		if not isinstance(self._value, dict) or (u"@" + key) not in self._value:
+			return default
+		value = self._value[u"@" + key]
+		if isinstance(value, dict):
+			raise ValueError(u"XML namespaces not yet supported")
+		return self._toString(value)
+
+	def findall(self, tag):
+		# Children with a given tag all come from the key of that name
+		if isinstance(self._value, dict):
+			if tag.startswith(u"@") or tag == u"$" or tag not in self._value:
+				return []
+			return [BadgerfishJsonElement(tag, childValue) for childValue in self._childValues(self._value[tag])]
+		return [child for child in self if child.tag == tag]
+
+	def __iter__(self):
+		if isinstance(self._value, dict):
+			for (key, value) in self._value.iteritems():
+				if not key.startswith(u"@") and key != u"$":
+					for childValue in self._childValues(value):
+						yield BadgerfishJsonElement(key, childValue)
+		else:
+			# badgerfish turns a list nested directly in a list into an empty element named
+			# after the list
+			yield BadgerfishJsonElement(self._toString(self._value), {})
+
+	def toElement(self):
+		return self._buildElement(self.tag, self._value)
+
+	# Builds the element exactly as badgerfish.etree() does
+	@staticmethod
+	def _buildElement(tag, value):
+		elem = xmlTree.Element(tag)
+		if isinstance(value, dict):
+			for (key, childValue) in value.iteritems():
+				if key.startswith(u"@"):
+					if isinstance(childValue, dict):
+						raise ValueError(u"XML namespaces not yet supported")
+					elem.set(key.lstrip(u"@"), BadgerfishJsonElement._toString(childValue))
+				elif key == u"$":
+					elem.text = BadgerfishJsonElement._toString(childValue)
+				else:
+					for childValue in BadgerfishJsonElement._childValues(childValue):
+						elem.append(BadgerfishJsonElement._buildElement(key, childValue))
+		else:
+			elem.append(xmlTree.Element(BadgerfishJsonElement._toString(value)))
+		return elem
+
+################################################################################
+# A substitution string (such as "%%v:1234%% is %%d:5678:temperature%%") broken
+# into its literal text and its variable and device state tokens, so that it can
+# be rendered any number of times without searching it again. The tokens are found
+# as substitute() always found them: variables first, then device states in the
+# text between the variables. The values inserted are not searched for tokens.
+class SubstitutionTemplate(object):
+	kLiteral = 0
+	kVariable = 1
+	kDeviceState = 2
+
+	def __init__(self, inString):
+		self.parts = []
+		literalStart = 0
+		for variableMatch in kSubstituteVariableRegex.finditer(inString):
+			self._addLiteralText(inString[literalStart:variableMatch.start()])
+			self.parts.append((SubstitutionTemplate.kVariable, variableMatch.group(1), None))
+			literalStart = variableMatch.end()
+		self._addLiteralText(inString[literalStart:])
+		self.isLiteral = (len(self.parts) == 0 or (len(self.parts) == 1 and self.parts[0][0] == SubstitutionTemplate.kLiteral))
+
+	def _addLiteralText(self, literalText):
+		literalStart = 0
+		for stateMatch in kSubstituteDeviceStateRegex.finditer(literalText):
+			if stateMatch.start() > literalStart:
+				self.parts.append((SubstitutionTemplate.kLiteral, literalText[literalStart:stateMatch.start()], None))
+			self.parts.append((SubstitutionTemplate.kDeviceState, stateMatch.group(1), stateMatch.group(2)))
+			literalStart = stateMatch.end()
+		if len(literalText) > literalStart:
+			self.parts.append((SubstitutionTemplate.kLiteral, literalText[literalStart:], None))
+
+	# getVariableValue(variableIdString) and getStateValue(deviceIdString, stateKey)
+	# return the text inserted for each token
+	def render(self, getVariableValue, getStateValue):
+		renderedParts = []
+		for (partType, value, stateKey) in self.parts:
+			if partType == SubstitutionTemplate.kLiteral:
+				renderedParts.append(value)
+			elif partType == SubstitutionTemplate.kVariable:
+				renderedParts.append(getVariableValue(value))
+			else:
+				renderedParts.append(getStateValue(value, stateKey))
+		return "".join(renderedParts)
+
+################################################################################
+# The variables and devices fetched from the server while substituting, each fetched
+# at most once however many tokens (or strings rendered with the same snapshot)
+# refer to it; the values substituted are those of the first fetch.
+class SubstitutionSnapshot(object):
+	def __init__(self, logger, variables=None, devices=None):
+		self.logger = logger
+		self.variables = indigo.variables if variables is None else variables
+		self.devices = indigo.devices if devices is None else devices
+		self.fetchCount = 0
+		self._fetchedVariables = {}
+		self._fetchedDevices = {}
+
+	# Returns the variable (or device) with the given ID, None if it does not exist
+	def getVariable(self, varId):
+		if varId not in self._fetchedVariables:
+			self.fetchCount += 1
+			self._fetchedVariables[varId] = self.variables.get(varId, None)
+		return self._fetchedVariables[varId]
+
+	def getDevice(self, devId):
+		if devId not in self._fetchedDevices:
+			self.fetchCount += 1
+			self._fetchedDevices[devId] = self.devices.get(devId, None)
+		return self._fetchedDevices[devId]
+
+	# Adds a copy of a variable (or device) already at hand, such as one passed to a
+	# change notification, so that it is not fetched
+	def addVariable(self, var):
+		self._fetchedVariables[var.id] = var
+
+	def addDevice(self, dev):
+		self._fetchedDevices[dev.id] = dev
+
+	# Return the text substituted for a variable or device state token
+	def getVariableValue(self, varIdString):
+		try:
+			theVarValue = self.getVariable(int(varIdString)).value
+		except:
+			theVarValue = ""
+			self.logger.error(u"Variable id " + varIdString + u" not found for substitution")
+		return theVarValue
+
+	def getStateValue(self, devIdString, stateKey):
+		try:
+			theStateValue = unicode(self.getDevice(int(devIdString)).states[stateKey])
+		except:
+			theStateValue = ""
+			self.logger.error(u"Device id " + devIdString + u" or state id " + stateKey + u" not found for substitution")
+		return theStateValue
+
 ################################################################################
 ################################################################################
 # Class PluginBase, defined below, will be automatically inserted into the
@@ -209,6 +610,44 @@ class PluginBase(object):
 	eventsTypeDict = indigo.Dict()
 	actionsTypeDict = indigo.Dict()
 
+	# The parsed MenuItems, Devices, Events and Actions files are saved to a cache file next
+	# to the plugin's bundle (.<plugin ID>.descriptorCache.pickle; not inside it, as the
+	# bundle is replaced as a whole on update and may be read-only) and loaded from it on
+	# the next start if none of the files (nor any template they use) have changed; a
+	# subclass may set this to False to always parse.
+	descriptorCacheEnabled = True
+
+	# Number of compiled substitution strings kept by substitute(), least recently used
+	# strings are dropped first
+	substitutionCacheSize = 256
+
+	# XML descriptor files at least this size (in bytes) are read with iterparse, one
+	# <Device>, <Event>, etc. at a time, instead of building the whole document tree
+	descriptorStreamingMinSize = 1048576
+
+	# The pluginProps keys that matter to a device's communication (or a trigger's
+	# processing), keyed by device (or event) type ID. Only the listed keys are compared
+	# by didDeviceCommPropertyChange (didTriggerProcessingPropertyChange) so that other
+	# changes do not restart the device (trigger); all keys are compared for types not
+	# listed. Entries here take precedence over the <CommPropertyKeys> (Devices.xml) and
+	# <ProcessingPropertyKeys> (Events.xml) elements.
+	deviceCommPropertyKeys = {}
+	eventProcessingPropertyKeys = {}
+
+	# At startup, shutdown, sleep and wake deviceStartComm (deviceStopComm) is called for
+	# each of the plugin's devices in turn. With deviceCommConcurrency above 1 the calls
+	# are made from up to that many threads at once instead, and a call that has not
+	# returned after deviceCommTimeout seconds is logged and no longer waited for (its
+	# thread is left to finish on its own). Such a hung call keeps holding its thread's
+	# place until it returns, also in later enumerations, but hung calls never hold more
+	# than deviceCommConcurrency - 1 places so that the other devices still get their
+	# calls; each hung call beyond that adds a thread. Note that a deviceStartComm that is
+	# still running is not waited for either: deviceStopComm may then be called for the
+	# same device while its deviceStartComm has not yet returned. The time taken for each
+	# device is kept in deviceCommReport either way.
+	deviceCommConcurrency = 1
+	deviceCommTimeout = 30.0
+
 	########################################
 	def __init__(self, pluginId, pluginDisplayName, pluginVersion, pluginPrefs):
 		##################
@@ -226,7 +665,56 @@ class PluginBase(object):
 
 		self.deviceFactoryXml = None
 
-		self.jsonStripTokenizer = None
+		# Comm/processing related pluginProps keys by type ID; see deviceCommPropertyKeys
+		self._deviceCommPropertyKeys = {}
+		self._eventProcessingPropertyKeys = {}
+
+		# Debounce/rate limits declared with <FiringLimits> in Events.xml, by event type ID;
+		# see getEventFiringLimits
+		self._eventFiringLimits = {}
+
+		# Compiled ConfigUI XML (templates swapped in and serialized) is cached and served
+		# from memory for as long as the files it was compiled from are unchanged. Set
+		# configUiCacheEnabled to False while editing the XML/JSON files of a running plugin
+		# so that every ConfigUI request is compiled from the files on disk.
+		self.configUiCacheEnabled = True
+		self.configUiCacheHitCount = 0
+		self.configUiCacheMissCount = 0
+		self._configUiCache = {}
+		self._configUiCacheLock = threading.RLock()
+		self._configUiSourceFiles = None
+
+		# Parsed template files, keyed by path; see _getTemplateTree
+		self._templateCache = {}
+
+		# Compiled substitution strings, most recently used last; see substitute
+		self.substitutionCacheHitCount = 0
+		self.substitutionCacheMissCount = 0
+		self._substitutionCache = collections.OrderedDict()
+		self._substitutionCacheLock = threading.Lock()
+
+		# Registered substitutions, indexed by the variable IDs and device state keys they
+		# use; see registerSubstitution
+		self.registeredSubstitutionRenderCount = 0
+		self._registeredSubstitutions = {}
+		self._substitutionVariableDependents = {}
+		self._substitutionDeviceDependents = {}
+		self._substitutionRegistryLock = threading.RLock()
+		self._nextSubstitutionRegistrationId = 1
+		self._subscribedToVariableChanges = False
+		self._subscribedToDeviceChanges = False
+
+		# Seconds taken by the last deviceStartComm and deviceStopComm enumerations, keyed by
+		# method name: (total seconds, [(device name, seconds or None if timed out)])
+		self.deviceCommReport = {}
+
+		# Threads of deviceStartComm/deviceStopComm calls that timed out and are still
+		# running; see deviceCommConcurrency
+		self._deviceCommCondition = threading.Condition(threading.Lock())
+		self._abandonedDeviceCommThreads = set()
+
+		# Files read while parsing the descriptor files; see _saveDescriptorCache
+		self._descriptorSourceFiles = None
 
 		##################
 		# Set up logging first (before parsing XML or anything else that might need to log).
@@ -236,7 +724,11 @@ class PluginBase(object):
 		# We set the level to THREADDEBUG so everything gets to each handler - the handlers can then
 		# filter messages at the levels they want
 		self.logger.setLevel(logging.THREADDEBUG)
-		self.indigo_log_handler = IndigoLogHandler(pluginDisplayName, logging.INFO)
+		# The Indigo handler queues records and sends them to IndigoServer from its own thread
+		# so that logging never blocks the calling thread on IPC. Its maxQueueSize, batchSize
+		# and overflowPolicy attributes may be adjusted by the plugin, and its queuedCount,
+		# droppedCount and sentCount counters show how much log traffic the plugin generates.
+		self.indigo_log_handler = QueuedIndigoLogHandler(pluginDisplayName, logging.INFO)
 		ifmt = logging.Formatter('%(message)s')
 		self.indigo_log_handler.setFormatter(ifmt)
 		# The Indigo handler gets set to INFO so only INFO or greater messages get logged (no debugging)
@@ -269,10 +761,21 @@ class PluginBase(object):
 		##################
 		# Parse the XML files and store the pieces we or other clients will need later.
 		try:
-			self._parseMenuItemsXML(kMenuItemsFilename)
-			self._parseDevicesXML(kDevicesFilename)
-			self._parseEventsXML(kEventsFilename)
-			self._parseActionsXML(kActionsFilename)
+			if not self._loadDescriptorCache():
+				self._descriptorSourceFiles = []
+				try:
+					self._parseMenuItemsXML(kMenuItemsFilename)
+					self._parseDevicesXML(kDevicesFilename)
+					self._parseEventsXML(kEventsFilename)
+					self._parseActionsXML(kActionsFilename)
+					sourceFiles = self._descriptorSourceFiles
+				finally:
+					self._descriptorSourceFiles = None
+				self._saveDescriptorCache(sourceFiles)
+			for (typeId, keys) in self.deviceCommPropertyKeys.iteritems():
+				self._deviceCommPropertyKeys[typeId] = tuple(keys)
+			for (typeId, keys) in self.eventProcessingPropertyKeys.iteritems():
+				self._eventProcessingPropertyKeys[typeId] = tuple(keys)
 		except Exception, e:
 			# The parse methods are good about giving verbose information regarding XML syntax errors
 			# in the exception, so just log the exception here:
@@ -378,6 +881,7 @@ class PluginBase(object):
 		self.stopConcurrentThread()
 		self._triggerEnumAndStopProcessing()
 		self._deviceEnumAndStopComm()
+		self.indigo_log_handler.flush()
 		if self.consoleThread is not None:
 			if self.consoleThread.isAlive():
 				self.logger.info(u"waiting for interactive console window to close")
@@ -479,9 +983,16 @@ class PluginBase(object):
 				raise ValueError(u"required XML attribute '%s' is missing or empty in <%s> of file %s" % (attrName,elem.tag,filename))
 			return default
 		elif errorIfNotAscii and attrStr[0] not in string.ascii_letters:
-			raise ValueError(u"XML attribute '%s' in file %s has a value that starts with invalid characters: '%s' (should begin with A-Z or a-z):\n%s" % (attrName,filename,attrStr,xmlTree.tostring(elem, method="xml")))
+			raise ValueError(u"XML attribute '%s' in file %s has a value that starts with invalid characters: '%s' (should begin with A-Z or a-z):\n%s" % (attrName,filename,attrStr,xmlTree.tostring(PluginBase._asXmlElement(elem), method="xml")))
 		return attrStr
 
+	@staticmethod
+	def _asXmlElement(elem):
+		# Elements of JSON descriptors are only converted when they are serialized
+		if isinstance(elem, BadgerfishJsonElement):
+			return elem.toElement()
+		return elem
+
 	@staticmethod
 	def _getElementValueByTagName2(elem, tagName, required=True, default=None, filename=u"unknown"):
 		child = PluginBase._getChildSingleElementByTagName2(elem, tagName, required=required, default=None, filename=filename)
@@ -495,55 +1006,86 @@ class PluginBase(object):
 		return value
 
 	###################
-	def _parseMenuItemsXML(self, filename):
-		if not self._xmlOrJsonFileExist(filename):
+	def _parseMenuItemsXML(self, basename):
+		if not self._xmlOrJsonFileExist(basename):
 			return
-		(menuItemsTree, filename) = self._xmlOrJsonParse(filename)
-		if menuItemsTree.tag != "MenuItems":
-			raise LookupError(u"Incorrect number of <MenuItems> elements found in file %s" % (filename))
-
-		menuItems = self._getChildElementsByTagName2(menuItemsTree, u"MenuItem")
-		for menu in menuItems:
-			serverVers = self._getElementAttribute2(menu, u"_minServerVers", required=False, errorIfNotAscii=False, filename=filename)
-			if serverVers is not None and not PluginBase.serverVersCompatWith(serverVers):
-				continue	# This version of Indigo Server isn't compatible with this object (skip it)
-
-			menuDict = indigo.Dict()
-			menuId = self._getElementAttribute2(menu, u"id", filename=filename)
-			if menuId in self.menuItemsDict:
-				raise LookupError(u"Duplicate menu id (%s) found in file %s" % (menuId, filename))
-
-			menuDict[u"Id"] = menuId
-			menuDict[u"Name"] = self._getElementValueByTagName2(menu, u"Name", False, filename=filename)
-
-			if "Name" in menuDict:
-				menuDict[u"ButtonTitle"] = self._getElementValueByTagName2(menu, u"ButtonTitle", False, filename=filename)
-
-				# Plugin should specify at least a CallbackMethod or ConfigUIRawXml (possibly both)
-				menuDict[u"CallbackMethod"] = self._getElementValueByTagName2(menu, u"CallbackMethod", False, filename=filename)
-				configUi = self._getChildSingleElementByTagName2(menu, u"ConfigUI", required=False, filename=filename)
-				if configUi is not None:
-					menuDict[u"ConfigUIRawXml"] = self._parseConfigUINode(configUi, filename=filename)
-				elif not "CallbackMethod" in menuDict:
-					raise ValueError(u"<MenuItem> elements must contain either a <CallbackMethod> and/or a <ConfigUI> element")
+		(filename, menuElements) = self._iterXmlOrJsonChildren(basename, u"MenuItems")
+		for menu in menuElements:
+			if menu.tag == u"MenuItem":
+				self._parseMenuItemElement(menu, basename, filename)
+
+	def _parseMenuItemElement(self, menu, basename, filename):
+		serverVers = self._getElementAttribute2(menu, u"_minServerVers", required=False, errorIfNotAscii=False, filename=filename)
+		if serverVers is not None and not PluginBase.serverVersCompatWith(serverVers):
+			return	# This version of Indigo Server isn't compatible with this object (skip it)
+
+		menuDict = indigo.Dict()
+		menuId = self._getElementAttribute2(menu, u"id", filename=filename)
+		if menuId in self.menuItemsDict:
+			raise LookupError(u"Duplicate menu id (%s) found in file %s" % (menuId, filename))
 
-			self.menuItemsList.append(menuDict)
-			self.menuItemsDict[menuId] = menuDict
+		menuDict[u"Id"] = menuId
+		menuDict[u"Name"] = self._getElementValueByTagName2(menu, u"Name", False, filename=filename)
+
+		if "Name" in menuDict:
+			menuDict[u"ButtonTitle"] = self._getElementValueByTagName2(menu, u"ButtonTitle", False, filename=filename)
+
+			# Plugin should specify at least a CallbackMethod or ConfigUIRawXml (possibly both)
+			menuDict[u"CallbackMethod"] = self._getElementValueByTagName2(menu, u"CallbackMethod", False, filename=filename)
+			configUi = self._getChildSingleElementByTagName2(menu, u"ConfigUI", required=False, filename=filename)
+			if configUi is not None:
+				menuDict[u"ConfigUIRawXml"] = self._compileConfigUINode(configUi, filename, (basename, menuId))
+			elif not "CallbackMethod" in menuDict:
+				raise ValueError(u"<MenuItem> elements must contain either a <CallbackMethod> and/or a <ConfigUI> element")
+
+		self.menuItemsList.append(menuDict)
+		self.menuItemsDict[menuId] = menuDict
 
 	###################
-	def _swapTemplatedField(self, configUI, refnode, refId, templateFilename, fileInHostBundle):
-		(templateTree, filename) = self._xmlOrJsonParse(templateFilename, fileInHostBundle=fileInHostBundle, templateSwapFieldId=refId)
+	# Templates are parsed once per file (and again only if the file changes) and kept
+	# with their _FIELDID placeholders intact; each reference gets its own copy of the
+	# template's fields with the placeholders replaced by the referencing field's id.
+	def _getTemplateTree(self, templateFilename, fileInHostBundle):
+		parentFolder = "./"
+		if fileInHostBundle:
+			parentFolder = self._getTemplateParentFolder()
+		(filename, isXml) = self._resolveXmlOrJsonFilename(templateFilename, parentFolder)
+		templatePath = parentFolder + filename
+		signature = self._getFileSignature(templatePath)
+
+		cacheEntry = self._templateCache.get(templatePath, None)
+		if cacheEntry is not None and cacheEntry[0] == signature:
+			if self._configUiSourceFiles is not None:
+				self._configUiSourceFiles.append(templatePath)
+			return (cacheEntry[1], filename)
+
+		(templateTree, filename) = self._xmlOrJsonParse(templateFilename, fileInHostBundle=fileInHostBundle)
+		self._templateCache[templatePath] = (signature, templateTree)
+		return (templateTree, filename)
+
+	@staticmethod
+	def _swapTemplateFieldId(value, fieldId):
+		if value is None or fieldId is None or "_FIELDID" not in value:
+			return value
+		return value.replace("_FIELDID", fieldId)
+
+	@staticmethod
+	def _copyTemplateElement(elem, fieldId):
+		swap = PluginBase._swapTemplateFieldId
+		elemCopy = xmlTree.Element(swap(elem.tag, fieldId), dict((swap(key, fieldId), swap(value, fieldId)) for (key, value) in elem.attrib.iteritems()))
+		elemCopy.text = swap(elem.text, fieldId)
+		elemCopy.tail = swap(elem.tail, fieldId)
+		for child in elem:
+			elemCopy.append(PluginBase._copyTemplateElement(child, fieldId))
+		return elemCopy
+
+	def _getTemplateFields(self, refId, templateFilename, fileInHostBundle):
+		(templateTree, filename) = self._getTemplateTree(templateFilename, fileInHostBundle)
 		if templateTree.tag != "Template":
 			raise LookupError(u"XML template file %s must have one root level <Template> node" % (filename))
 
 		importFieldList = self._getChildElementsByTagName2(templateTree, u"Field")
-		insertIndex = list(configUI).index(refnode)
-		for importField in importFieldList:
-			configUI.insert(insertIndex, importField)
-			insertIndex += 1
-
-		configUI.remove(refnode)
-		return configUI
+		return [self._copyTemplateElement(importField, refId) for importField in importFieldList]
 
 	def _parseConfigUINode(self, configUI, filename=u"unknown", returnXml=True):
 		# Parse all of the config Field nodes looking for any template
@@ -551,21 +1093,30 @@ class PluginBase(object):
 		# type="serialport" are substituted with the XML from file
 		# _configUiField_serialPort.xml to provide a more complete multi-
 		# field control that allows local serial ports and IP based
-		# serial connections.
-		fieldList = self._getChildElementsByTagName2(configUI, u"Field")
-		for refnode in fieldList:
-			typeVal = self._getElementAttribute2(refnode, u"type", filename=filename).lower()
-			if typeVal in fieldTypeTemplates:
-				templatename = fieldTypeTemplates[typeVal]
-				refId = self._getElementAttribute2(refnode, u"id", False, filename=templatename)
-				self._swapTemplatedField(configUI, refnode, refId, templatename, True)
-
-		fieldList = self._getChildElementsByTagName2(configUI, u"Template")
-		for refnode in fieldList:
-			templatename = self._getElementAttribute2(refnode, u"file", filename=filename)
-			if templatename:
-				refId = self._getElementAttribute2(refnode, u"id", False, filename=templatename)
-				self._swapTemplatedField(configUI, refnode, refId, templatename, False)
+		# serial connections. <Template file="..."> nodes are likewise
+		# replaced by the fields of the plugin's own template file.
+		#
+		# The new list of children is built in a single pass and assigned
+		# once, rather than searching for and inserting into the child list
+		# for every templated node; fields brought in from a template are
+		# not themselves expanded.
+		newChildren = []
+		for refnode in configUI:
+			if refnode.tag == u"Field":
+				typeVal = self._getElementAttribute2(refnode, u"type", filename=filename).lower()
+				if typeVal in fieldTypeTemplates:
+					templatename = fieldTypeTemplates[typeVal]
+					refId = self._getElementAttribute2(refnode, u"id", False, filename=templatename)
+					newChildren.extend(self._getTemplateFields(refId, templatename, True))
+					continue
+			elif refnode.tag == u"Template":
+				templatename = self._getElementAttribute2(refnode, u"file", filename=filename)
+				if templatename:
+					refId = self._getElementAttribute2(refnode, u"id", False, filename=templatename)
+					newChildren.extend(self._getTemplateFields(refId, templatename, False))
+					continue
+			newChildren.append(refnode)
+		configUI[:] = newChildren
 
 		# self.logger.debug(u"configUI:\n" + xmlTree.tostring(configUI, encoding="UTF-8", method="xml") + "\n")
 		if returnXml:
@@ -574,41 +1125,72 @@ class PluginBase(object):
 			return configUI
 
 	########################################
+	# Replaces each // and /* */ comment outside of a string literal with a single space.
+	# The text between comments is skipped by one regex match and copied only when a
+	# comment was found; input without any '/' is returned as is. Text that is not valid
+	# (a /* or a quote that is never closed) is left alone just as the former regex
+	# substitution left it.
 	def _stripJsonComments(self, input, strip_space=False):
-		def replacer(match):
-			ss = match.group(0)
-			return " " if ss.startswith('/') else ss
-
-		if self.jsonStripTokenizer is None:
-			self.jsonStripTokenizer = re.compile(
-				r'//.*?$|/\*.*?\*/|\'(?:\\.|[^\\\'])*\'|"(?:\\.|[^\\"])*"',
-				re.DOTALL | re.MULTILINE
-	    	)
-		return re.sub(self.jsonStripTokenizer, replacer, input)
+		if "/" not in input:
+			return input
+
+		skipText = kJsonTextWithoutCommentsRegex.match
+		inputLength = len(input)
+		outputParts = []
+		copyStart = 0
+		pos = 0
+		while True:
+			pos = skipText(input, pos).end()
+			if pos >= inputLength:
+				break
+			if input.startswith("//", pos):
+				commentEnd = input.find("\n", pos + 2)
+				if commentEnd == -1:
+					commentEnd = inputLength
+			elif input.startswith("/*", pos):
+				commentEnd = input.find("*/", pos + 2)
+				if commentEnd == -1:
+					pos += 1
+					continue
+				commentEnd += 2
+			else:
+				# a '/' that does not start a comment or an unterminated string
+				pos += 1
+				continue
+			outputParts.append(input[copyStart:pos])
+			outputParts.append(" ")
+			copyStart = pos = commentEnd
+
+		if copyStart == 0:
+			return input
+		outputParts.append(input[copyStart:])
+		return "".join(outputParts)
 
 	def _xmlOrJsonFileExist(self, basename):
 		return os.path.isfile(basename + ".xml") or os.path.isfile(basename + ".json")
 
-	def _xmlOrJsonParse(self, basename, fileInHostBundle=False, templateSwapFieldId=None):
+	@staticmethod
+	def _resolveXmlOrJsonFilename(basename, parentFolder):
 		# .json file version takes priority, but if it isn't found we'll try for the .xml version.
+		if basename.endswith('.json'):
+			return (basename, False)
+		elif basename.endswith('.xml'):
+			return (basename, True)
+		elif os.path.isfile(parentFolder + basename + ".json"):
+			return (basename + ".json", False)
+		return (basename + ".xml", True)
+
+	def _xmlOrJsonParse(self, basename, fileInHostBundle=False, templateSwapFieldId=None):
 		# Note if files aren't found then an empty xml ElementTree element is returned.
 		parentFolder = "./"
 		if fileInHostBundle:
 			parentFolder = self._getTemplateParentFolder()
+		(filename, isXml) = self._resolveXmlOrJsonFilename(basename, parentFolder)
 
-		if basename.endswith('.json'):
-			isXml = False
-			filename = basename
-		elif basename.endswith('.xml'):
-			isXml = True
-			filename = basename
-		else:
-			filename = basename + ".json"
-			if os.path.isfile(parentFolder + filename):
-				isXml = False
-			else:
-				isXml = True
-				filename = basename + ".xml"
+		if self._configUiSourceFiles is not None:
+			self._configUiSourceFiles.append(parentFolder + filename)
+		if self._descriptorSourceFiles is not None:
+			self._descriptorSourceFiles.append(parentFolder + filename)
 
 		try:
 			elemTree = None
@@ -639,6 +1221,75 @@ class PluginBase(object):
 			self.logger.error(u"%s has an error: %s" % (filename, unicode(e)))
 			raise LookupError(u"%s is malformed" % (filename))
 
+	# Returns the resolved filename and an iterator over the child elements of the root
+	# element of a descriptor file (which must be rootTag). Large XML files are streamed:
+	# each child is returned as soon as its closing tag has been read and is discarded
+	# once the caller moves on, so only one child needs to be held in memory at a time.
+	def _iterXmlOrJsonChildren(self, basename, rootTag):
+		(filename, isXml) = self._resolveXmlOrJsonFilename(basename, "./")
+		fileSize = 0
+		if isXml and os.path.isfile("./" + filename):
+			fileSize = os.path.getsize("./" + filename)
+		if not isXml:
+			(elemTree, filename) = self._parseJsonDescriptor(basename)
+			if elemTree.tag != rootTag:
+				raise LookupError(u"Incorrect number of <%s> elements found in file %s" % (rootTag, filename))
+			return (filename, list(elemTree))
+		elif fileSize == 0 or fileSize < self.descriptorStreamingMinSize:
+			(elemTree, filename) = self._xmlOrJsonParse(basename)
+			if elemTree.tag != rootTag:
+				raise LookupError(u"Incorrect number of <%s> elements found in file %s" % (rootTag, filename))
+			return (filename, list(elemTree))
+
+		if self._descriptorSourceFiles is not None:
+			self._descriptorSourceFiles.append("./" + filename)
+		return (filename, self._streamXmlChildren("./" + filename, filename, rootTag))
+
+	# JSON descriptor files (MenuItems, Devices, Events and Actions) are read without
+	# building an ElementTree: the returned root is a BadgerfishJsonElement over the
+	# json.loads() data, and only the ConfigUI elements are converted when compiled.
+	def _parseJsonDescriptor(self, basename):
+		(filename, isXml) = self._resolveXmlOrJsonFilename(basename, "./")
+		if self._descriptorSourceFiles is not None:
+			self._descriptorSourceFiles.append("./" + filename)
+
+		try:
+			rootElem = None
+			rawContents = self._getFileContents("./" + filename)
+			if len(rawContents) > 0:
+				rootElem = BadgerfishJsonElement.fromJson(json.loads(self._stripJsonComments(rawContents)))
+			if rootElem is None:
+				rootElem = BadgerfishJsonElement(u"Empty", {})
+			return (rootElem, filename)
+		except Exception, e:
+			self.logger.error(u"%s has an error: %s" % (filename, unicode(e)))
+			raise LookupError(u"%s is malformed" % (filename))
+
+	def _streamXmlChildren(self, path, filename, rootTag):
+		depth = 0
+		rootElem = None
+		parseEvents = xmlTree.iterparse(path, events=("start", "end"))
+		while True:
+			try:
+				(event, elem) = next(parseEvents)
+			except StopIteration:
+				return
+			except Exception, e:
+				self.logger.error(u"%s has an error: %s" % (filename, unicode(e)))
+				raise LookupError(u"%s is malformed" % (filename))
+
+			if event == "start":
+				depth += 1
+				if depth == 1:
+					rootElem = elem
+					if elem.tag != rootTag:
+						raise LookupError(u"Incorrect number of <%s> elements found in file %s" % (rootTag, filename))
+			else:
+				depth -= 1
+				if depth == 1:
+					yield elem
+					rootElem.remove(elem)
+
 	# This isn't called from anywhere in here, but is just a handy utility function
 	# that developers can call from their plugin's interfactive shell like this:
 	#
@@ -671,6 +1322,377 @@ class PluginBase(object):
 		print("File converted and saved to: %s" % (jsonFilename))
 		print("Note for the .json version of the file to be used the .xml version must be renamed or deleted.")
 
+	# Another utility for the interactive shell: times _parseConfigUINode on a generated
+	# ConfigUI of fieldCount fields (every tenth a serialport field) against the former
+	# approach of locating and inserting into the child list once per templated field:
+	#
+	#	self.benchmarkConfigUIParsing(3000)
+	#
+	def benchmarkConfigUIParsing(self, fieldCount=3000):
+		def buildConfigUI(count):
+			configUI = xmlTree.Element(u"ConfigUI")
+			for index in range(count):
+				if index % 10 == 0:
+					xmlTree.SubElement(configUI, u"Field", {u"id": u"port%d" % index, u"type": u"serialport"})
+				else:
+					xmlTree.SubElement(configUI, u"Field", {u"id": u"field%d" % index, u"type": u"textfield"})
+			return configUI
+
+		def legacyParseConfigUINode(configUI):
+			for refnode in self._getChildElementsByTagName2(configUI, u"Field"):
+				typeVal = refnode.get(u"type").lower()
+				if typeVal in fieldTypeTemplates:
+					insertIndex = list(configUI).index(refnode)
+					for importField in self._getTemplateFields(refnode.get(u"id"), fieldTypeTemplates[typeVal], True):
+						configUI.insert(insertIndex, importField)
+						insertIndex += 1
+					configUI.remove(refnode)
+			return xmlTree.tostring(configUI, encoding="UTF-8", method="xml")
+
+		# prime the template cache so that only the substitution itself is timed
+		self._getTemplateFields(u"prime", fieldTypeTemplates[u"serialport"], True)
+		for count in (fieldCount / 4, fieldCount / 2, fieldCount):
+			configUI = buildConfigUI(count)
+			startTime = time.time()
+			legacyXml = legacyParseConfigUINode(configUI)
+			legacyTime = time.time() - startTime
+
+			configUI = buildConfigUI(count)
+			startTime = time.time()
+			singlePassXml = self._parseConfigUINode(configUI, filename=u"benchmark")
+			singlePassTime = time.time() - startTime
+
+			print("%5d fields: former %8.1f ms, single pass %8.1f ms, identical output: %s" % (count, legacyTime * 1000.0, singlePassTime * 1000.0, legacyXml == singlePassXml))
+
+	# Generates a Devices.xml of about targetMegabytes in a temporary folder and reports the
+	# time and the peak memory needed to load it, first as a complete document tree and then
+	# streamed; each load runs in a fresh Python process so that one load's memory does not
+	# hide the other's and the plugin's own device types are left untouched:
+	#
+	#	self.benchmarkDescriptorLoading(50)
+	#
+	def benchmarkDescriptorLoading(self, targetMegabytes=50):
+		benchmarkFolder = tempfile.mkdtemp()
+		try:
+			optionsXml = "".join('<Option value="value%d">Value %d</Option>' % (x, x) for x in range(20))
+			f = file(os.path.join(benchmarkFolder, "Devices.xml"), 'w')
+			f.write('<?xml version="1.0"?>\n<Devices>\n')
+			deviceCount = 0
+			while f.tell() < targetMegabytes * 1048576:
+				f.write('<Device type="custom" id="benchmarkDevice%d"><Name>Benchmark Device %d</Name>'
+					'<ConfigUI><Field id="address" type="textfield"><Label>Address:</Label></Field></ConfigUI><States>'
+					'<State id="mode"><ValueType><List>%s</List></ValueType><TriggerLabel>Mode Changed</TriggerLabel><ControlPageLabel>Mode</ControlPageLabel></State>'
+					'<State id="level"><ValueType>Number</ValueType><TriggerLabel>Level Changed</TriggerLabel><ControlPageLabel>Level</ControlPageLabel></State>'
+					'</States></Device>\n' % (deviceCount, deviceCount, optionsXml))
+				deviceCount += 1
+			f.write('</Devices>\n')
+			fileSize = f.tell()
+			f.close()
+			print("Generated Devices.xml: %d device types, %.1f MB" % (deviceCount, fileSize / 1048576.0))
+
+			for (loadName, streamingMinSize) in (("document tree", sys.maxint), ("streamed", 0)):
+				result = self._loadDevicesInChildProcess(benchmarkFolder, attributes={"descriptorStreamingMinSize": streamingMinSize})
+				if result is None:
+					print("%s: load failed" % (loadName))
+				else:
+					print("%s: %.1f sec, peak memory +%.1f MB" % (loadName, result[0], result[1]))
+		finally:
+			shutil.rmtree(benchmarkFolder, True)
+
+	# Generates a Devices.xml with deviceCount device types, converts it to JSON the same
+	# way convertXmlFileToJson does and compares loading the JSON file directly with the
+	# former route through badgerfish.etree(); both results are checked against the device
+	# types loaded from the XML file:
+	#
+	#	self.benchmarkJsonDescriptorLoading(2000)
+	#
+	def benchmarkJsonDescriptorLoading(self, deviceCount=2000):
+		xmlFolder = tempfile.mkdtemp()
+		jsonFolder = tempfile.mkdtemp()
+		try:
+			optionsXml = "".join('<Option value="value%d">Value %d</Option>' % (x, x) for x in range(10))
+			f = file(os.path.join(xmlFolder, "Devices.xml"), 'w')
+			f.write('<?xml version="1.0"?>\n<Devices>\n')
+			f.write('<DeviceFactory><Name>Define Device Group...</Name><ButtonTitle>Close</ButtonTitle>'
+				'<ConfigUI><Field id="label" type="label"><Label>Benchmark device factory</Label></Field></ConfigUI></DeviceFactory>\n')
+			for deviceIndex in range(deviceCount):
+				f.write('<Device type="custom" id="benchmarkDevice%d"><Name>Benchmark Device %d</Name>'
+					'<ConfigUI><Field id="address" type="textfield" defaultValue="1"><Label>Address:</Label></Field>'
+					'<Field id="enabled" type="checkbox"><Label>Enabled:</Label></Field></ConfigUI><States>'
+					'<State id="mode"><ValueType><List>%s</List></ValueType><TriggerLabel>Mode Changed</TriggerLabel><ControlPageLabel>Mode</ControlPageLabel></State>'
+					'<State id="onOff"><ValueType boolType="OnOff">Boolean</ValueType><TriggerLabel>On/Off Changed</TriggerLabel><ControlPageLabel>On/Off</ControlPageLabel></State>'
+					'</States></Device>\n' % (deviceIndex, deviceIndex, optionsXml))
+			f.write('</Devices>\n')
+			f.close()
+
+			f = file(os.path.join(jsonFolder, "Devices.json"), 'w')
+			f.write(json.dumps(badgerfish.data(xmlTree.parse(os.path.join(xmlFolder, "Devices.xml")).getroot()), indent=4))
+			f.close()
+
+			xmlResult = self._loadDevicesInChildProcess(xmlFolder)
+			badgerfishResult = self._loadDevicesInChildProcess(jsonFolder, aliases={"_parseJsonDescriptor": "_xmlOrJsonParse"})
+			directResult = self._loadDevicesInChildProcess(jsonFolder)
+			if xmlResult is None or badgerfishResult is None or directResult is None:
+				print("load failed")
+				return
+
+			# json.loads() does not keep the order of an object's keys, so only the device types
+			# (and not the order of the <DeviceFactory> children) can be compared with the XML
+			print("Devices.xml: %.1f ms" % (xmlResult[0] * 1000.0))
+			print("Devices.json through badgerfish.etree(): %.1f ms, same device types as XML: %s" % (badgerfishResult[0] * 1000.0, badgerfishResult[2] == xmlResult[2]))
+			print("Devices.json read directly: %.1f ms, same device types as XML: %s, same as badgerfish.etree(): %s" % (directResult[0] * 1000.0, directResult[2] == xmlResult[2], directResult[2:] == badgerfishResult[2:]))
+		finally:
+			shutil.rmtree(xmlFolder, True)
+			shutil.rmtree(jsonFolder, True)
+
+	# Parses the Devices file of folder in a fresh Python process and returns the elapsed
+	# time, the peak memory increase in MB, the device types found and the device factory
+	# XML; None (after printing the reason) if the load failed. attributes are set on the
+	# parser before loading and each of aliases names a method to use in place of another.
+	# Forking the plugin host instead is not safe: the child could inherit a lock held by
+	# one of the host's other threads (logging, IPC) and hang.
+	def _loadDevicesInChildProcess(self, folder, attributes=None, aliases=None):
+		# inside the plugin host sys.executable is the host itself; use the system Python
+		# that the host is built on in that case
+		pythonPath = sys.executable
+		if not os.path.basename(pythonPath).lower().startswith("python"):
+			pythonPath = "/usr/bin/python"
+		childInput = cPickle.dumps((os.path.abspath(os.path.splitext(__file__)[0] + ".py"), sys.path, indigo.server.version, indigo.host.resourcesFolderPath, folder, attributes or {}, aliases or {}), cPickle.HIGHEST_PROTOCOL)
+		try:
+			child = subprocess.Popen([pythonPath, "-c", kDescriptorLoadChildScript], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+			(resultData, errorText) = child.communicate(childInput)
+		except OSError, e:
+			print("unable to start %s: %s" % (pythonPath, unicode(e)))
+			return None
+		if child.returncode != 0:
+			print("load failed (exit status %d):\n%s" % (child.returncode, errorText))
+			return None
+		return cPickle.loads(resultData)
+
+	# Runs in the child process started by _loadDevicesInChildProcess; the parser is set up
+	# with only the state __init__ gives the descriptor parsing (no logging handlers,
+	# threads or server connection)
+	@staticmethod
+	def _loadDevicesForBenchmark(folder, attributes, aliases):
+		parser = PluginBase.__new__(PluginBase)
+		parser.logger = logging.getLogger("Plugin")
+		parser.deviceFactoryXml = None
+		parser.devicesTypeDict = indigo.Dict()
+		parser._deviceCommPropertyKeys = {}
+		parser._eventProcessingPropertyKeys = {}
+		parser._eventFiringLimits = {}
+		parser.configUiCacheEnabled = True
+		parser._configUiCache = {}
+		parser._configUiCacheLock = threading.RLock()
+		parser._configUiSourceFiles = None
+		parser._templateCache = {}
+		parser._descriptorSourceFiles = None
+		for (name, value) in attributes.iteritems():
+			setattr(parser, name, value)
+		for (name, methodName) in aliases.iteritems():
+			setattr(parser, name, getattr(parser, methodName))
+
+		os.chdir(folder)
+		startPeak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		startTime = time.time()
+		parser._parseDevicesXML(kDevicesFilename)
+		elapsed = time.time() - startTime
+		peakIncrease = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - startPeak
+		# ru_maxrss is reported in bytes on OS X but in kilobytes on Linux
+		if sys.platform == "darwin":
+			peakMegabytes = peakIncrease / 1048576.0
+		else:
+			peakMegabytes = peakIncrease / 1024.0
+		return (elapsed, peakMegabytes, PluginBase._toNativeTypes(parser.devicesTypeDict), parser.deviceFactoryXml)
+
+	# Checks _stripJsonComments against a set of tricky inputs (and against the regex
+	# substitution it replaced), then reports its throughput on a generated Devices.json
+	# with comments, on the same file without comments and that of the former regex:
+	#
+	#	self.benchmarkJsonCommentStripping(3000)
+	#
+	def benchmarkJsonCommentStripping(self, deviceCount=3000):
+		legacyTokenizer = re.compile(r'//.*?$|/\*.*?\*/|\'(?:\\.|[^\\\'])*\'|"(?:\\.|[^\\"])*"', re.DOTALL | re.MULTILINE)
+		def legacyStripJsonComments(input):
+			return legacyTokenizer.sub(lambda match: " " if match.group(0).startswith('/') else match.group(0), input)
+
+		testCases = [
+			('{"a": 1}', '{"a": 1}'),
+			('{"url": "http://example.com"} // trailing', '{"url": "http://example.com"}  '),
+			('{"q": "say \\"hi\\" // still a string"} // gone', '{"q": "say \\"hi\\" // still a string"}  '),
+			('{"path": "C:\\\\"} // gone\n', '{"path": "C:\\\\"}  \n'),
+			('{"a": "/* not a comment */"}', '{"a": "/* not a comment */"}'),
+			('/* outer /* inner */ */ {}', '  */ {}'),
+			('/**/{}/*/ */', ' {} '),
+			("{'single': '// kept'} // gone", "{'single': '// kept'}  "),
+			('{"a": "x"}//one\n//two\n', '{"a": "x"} \n \n'),
+			('{"a": 1}\r\n// windows line end\r\n', '{"a": 1}\r\n \n'),
+			('{"a": 1 /* never closed', '{"a": 1 /* never closed'),
+			('{"a": 1 /* never closed // but this is\n}', '{"a": 1 /* never closed  \n}'),
+			('"never closed // comment', '"never closed  '),
+			('{"a": "multi\\\nline // string"}', '{"a": "multi\\\nline // string"}'),
+			('{"a": 1 / 2}', '{"a": 1 / 2}'),
+			('//', ' '),
+			('/', '/'),
+			('', ''),
+		]
+		failures = 0
+		for (input, expected) in testCases:
+			output = self._stripJsonComments(input)
+			legacyOutput = legacyStripJsonComments(input)
+			if output != expected or output != legacyOutput:
+				failures += 1
+				print("FAILED: %r gave %r (expected %r, former regex %r)" % (input, output, expected, legacyOutput))
+		print("%d of %d test cases passed" % (len(testCases) - failures, len(testCases)))
+
+		devices = []
+		for deviceIndex in range(deviceCount):
+			devices.append({"@id": "benchmarkDevice%d" % deviceIndex, "@type": "custom", "Name": {"$": "Benchmark \"Device\" %d/%d" % (deviceIndex, deviceCount)},
+				"States": {"State": [{"@id": "state%d" % stateIndex, "TriggerLabel": {"$": "State %d Changed" % stateIndex}, "ControlPageLabel": {"$": "State %d" % stateIndex}} for stateIndex in range(5)]}})
+		jsonLines = json.dumps({"Devices": {"Device": devices}}, indent=4).split("\n")
+		commentedJson = "/* Generated by benchmarkJsonCommentStripping */\n" + "\n".join(line + ("    // comment %d" % lineIndex if lineIndex % 20 == 0 else "") for (lineIndex, line) in enumerate(jsonLines))
+		plainJson = "\n".join(jsonLines).replace("/", "")
+		megabytes = len(commentedJson) / 1048576.0
+		print("Generated Devices.json: %.1f MB, %d comments" % (megabytes, len(jsonLines) / 20 + 1))
+
+		startTime = time.time()
+		legacyOutput = legacyStripJsonComments(commentedJson)
+		legacyTime = time.time() - startTime
+		startTime = time.time()
+		output = self._stripJsonComments(commentedJson)
+		stripTime = time.time() - startTime
+		startTime = time.time()
+		plainOutput = self._stripJsonComments(plainJson)
+		plainTime = time.time() - startTime
+
+		print("former regex: %.1f MB/s" % (megabytes / legacyTime))
+		print("single pass: %.1f MB/s, same output: %s" % (megabytes / stripTime, output == legacyOutput))
+		print("single pass, no comments: %.1f MB/s, input returned: %s" % (len(plainJson) / 1048576.0 / max(plainTime, 1e-6), plainOutput is plainJson))
+
+	# Renders renderCount notification strings (cycling through templateCount distinct
+	# strings) with the former regex substitution, with compiled SubstitutionTemplates and
+	# with compiled templates rendered substituteMany-style in batches sharing one snapshot.
+	# The variables and devices are in-memory stand-ins which count how often they are
+	# fetched, so that only the substitution itself is timed:
+	#
+	#	self.benchmarkSubstitution(20000)
+	#
+	def benchmarkSubstitution(self, renderCount=20000, templateCount=100, batchSize=50):
+		class BenchmarkVariable(object):
+			def __init__(self, value):
+				self.value = value
+
+		class BenchmarkDevice(object):
+			def __init__(self, states):
+				self.states = states
+
+		class CountingCollection(dict):
+			fetchCount = 0
+			def __getitem__(self, key):
+				self.fetchCount += 1
+				return dict.__getitem__(self, key)
+			def get(self, key, default=None):
+				self.fetchCount += 1
+				return dict.get(self, key, default)
+
+		variables = CountingCollection((varId, BenchmarkVariable(u"value %d" % varId)) for varId in range(100, 150))
+		devices = CountingCollection((devId, BenchmarkDevice({u"temperature" : devId * 1.5, u"onOffState" : True, u"sensor.value" : devId})) for devId in range(200, 250))
+		benchmarkLogger = logging.getLogger("Plugin.benchmarkSubstitution")
+		benchmarkLogger.propagate = False
+		if len(benchmarkLogger.handlers) == 0:
+			benchmarkLogger.addHandler(NullHandler())
+
+		# the former substitute(): both loops over the "%%" parts fetched every variable and
+		# device referenced and each regex was compiled and applied, fetching them again
+		def insertVariableValue(matchobj):
+			try:
+				return variables[int(matchobj.group(1))].value
+			except:
+				return ""
+		def insertStateValue(matchobj):
+			try:
+				return unicode(devices[int(matchobj.group(1))].states[matchobj.group(2)])
+			except:
+				return ""
+		def legacySubstitute(inString):
+			for substr in inString.split("%%"):
+				if substr[0:2] == "v:":
+					varIdString = substr.split(":")[1]
+					if varIdString.find(" ") < 0:
+						try:
+							variables.get(int(varIdString), None)
+						except:
+							pass
+			p = re.compile("\%%v:([0-9]*)%%")
+			inString = p.sub(insertVariableValue, inString)
+			for substr in inString.split("%%"):
+				if substr[0:2] == "d:":
+					devParts = substr.split(":")
+					if len(devParts) == 3 and devParts[1].find(" ") < 0:
+						try:
+							theDevice = devices.get(int(devParts[1]), None)
+							if theDevice is not None:
+								theDevice.states[devParts[2]]
+						except:
+							pass
+			p = re.compile("\%%d:([0-9]*):([A-z0-9\.]*)%%")
+			return p.sub(insertStateValue, inString)
+
+		templates = [
+			u"%%v:100%%",
+			u"Nothing to substitute here",
+			u"%%v:101%%%%d:201:temperature%%%%v:102%%",
+			u"%%d:202:sensor.value%% and %%v:%% and %%d:x:onOffState%% and %%v:999%% and %%d:999:temperature%%",
+			u"%%d:203:temperature%%v:103%%",
+			u"%%v:104%% unterminated %%d:204:temperature",
+			u"%%d:205:temperature%% %%d:205:onOffState%% %%d:205:sensor.value%% %%d:205:temperature%% %%d:205:onOffState%%",
+		]
+		for templateIndex in range(len(templates), templateCount):
+			templates.append(u"Notification %d: %%%%v:%d%%%% is %%%%d:%d:temperature%%%%, switch %%%%d:%d:onOffState%%%% (%%%%v:%d%%%%)" % (templateIndex, 100 + templateIndex % 50, 200 + templateIndex % 50, 249 - templateIndex % 50, 149 - templateIndex % 50))
+		compiledTemplates = dict((template, SubstitutionTemplate(template)) for template in templates)
+		def compiledSubstitute(inString, snapshot):
+			return compiledTemplates[inString].render(snapshot.getVariableValue, snapshot.getStateValue)
+
+		mismatches = [template for template in templates if compiledSubstitute(template, SubstitutionSnapshot(benchmarkLogger, variables, devices)) != legacySubstitute(template)]
+		for template in mismatches:
+			print("DIFFERENT: %r" % (template))
+		print("%d of %d strings rendered the same" % (len(templates) - len(mismatches), len(templates)))
+
+		sameDeviceTemplate = templates[6]
+		fetchCount = variables.fetchCount + devices.fetchCount
+		legacySubstitute(sameDeviceTemplate)
+		legacyFetchCount = variables.fetchCount + devices.fetchCount - fetchCount
+		snapshot = SubstitutionSnapshot(benchmarkLogger, variables, devices)
+		compiledSubstitute(sameDeviceTemplate, snapshot)
+		print("one device used 5 times: former %d fetches, compiled %d" % (legacyFetchCount, snapshot.fetchCount))
+
+		variables.fetchCount = devices.fetchCount = 0
+		startTime = time.time()
+		for renderIndex in range(renderCount):
+			legacySubstitute(templates[renderIndex % templateCount])
+		legacyTime = time.time() - startTime
+		legacyFetchCount = variables.fetchCount + devices.fetchCount
+
+		variables.fetchCount = devices.fetchCount = 0
+		startTime = time.time()
+		for renderIndex in range(renderCount):
+			compiledSubstitute(templates[renderIndex % templateCount], SubstitutionSnapshot(benchmarkLogger, variables, devices))
+		compiledTime = time.time() - startTime
+		compiledFetchCount = variables.fetchCount + devices.fetchCount
+
+		variables.fetchCount = devices.fetchCount = 0
+		startTime = time.time()
+		for batchStart in range(0, renderCount, batchSize):
+			snapshot = SubstitutionSnapshot(benchmarkLogger, variables, devices)
+			for renderIndex in range(batchStart, min(batchStart + batchSize, renderCount)):
+				compiledSubstitute(templates[renderIndex % templateCount], snapshot)
+		batchTime = time.time() - startTime
+		batchFetchCount = variables.fetchCount + devices.fetchCount
+
+		print("former regex substitution: %.0f strings/sec, %d fetches" % (renderCount / legacyTime, legacyFetchCount))
+		print("compiled templates: %.0f strings/sec, %d fetches" % (renderCount / compiledTime, compiledFetchCount))
+		print("compiled templates, %d per snapshot: %.0f strings/sec, %d fetches" % (batchSize, renderCount / batchTime, batchFetchCount))
+
 	###################
 	def _getDeviceStateDictForType(self, type, stateId, triggerLabel, controlPageLabel, disabled=False):
 		stateDict = indigo.Dict()
@@ -716,217 +1738,463 @@ class PluginBase(object):
 		stateDict[u"StateLabel"] = stateDict[u"StateLabel"] + u" (true or false)"
 		return stateDict
 
-	def _parseDevicesXML(self, filename):
-		if not self._xmlOrJsonFileExist(filename):
+	def _parseDevicesXML(self, basename):
+		if not self._xmlOrJsonFileExist(basename):
 			return
-		(devicesTree, filename) = self._xmlOrJsonParse(filename)
-		if devicesTree.tag != "Devices":
-			raise LookupError(u"Incorrect number of <Devices> elements found in file %s" % (filename))
+		(filename, deviceElements) = self._iterXmlOrJsonChildren(basename, u"Devices")
 
 		# Look for a DeviceFactory element - that will be used to create devices
 		# rather than creating them directly using the <Device> XML. This allows
 		# a plugin to discover device types rather than forcing the user to select
 		# the type up-front (like how INSTEON devices are added).
 		self.deviceFactoryXml = None
-		deviceFactory = self._getChildSingleElementByTagName2(devicesTree, u"DeviceFactory", required=False, filename=filename)
-		if deviceFactory is not None:
-			# Test to make sure Name, ButtonTitle, and ConfigUI all exist:
-			nameElem = self._getChildSingleElementByTagName2(deviceFactory, u"Name", required=True, filename=filename)
-			buttonElem = self._getChildSingleElementByTagName2(deviceFactory, u"ButtonTitle", required=True, filename=filename)
-			configElem = self._getChildSingleElementByTagName2(deviceFactory, u"ConfigUI", required=True, filename=filename)
-			if configElem is not None:
-				replaceIndex = list(deviceFactory).index(configElem)
-				deviceFactory.remove(configElem)
-				deviceFactory.insert(replaceIndex, self._parseConfigUINode(configElem, filename=filename, returnXml=False))
-			self.deviceFactoryXml = xmlTree.tostring(deviceFactory, encoding="UTF-8", method="xml")
-
+		deviceFactoryCount = 0
 		sortIndex = 0
-		deviceElemList = self._getChildElementsByTagName2(devicesTree, u"Device")
-		for device in deviceElemList:
-			serverVers = self._getElementAttribute2(device, u"_minServerVers", required=False, errorIfNotAscii=False, filename=filename)
-			if serverVers is not None and not PluginBase.serverVersCompatWith(serverVers):
-				continue	# This version of Indigo Server isn't compatible with this object (skip it)
-
-			deviceDict = indigo.Dict()
-			deviceTypeId = self._getElementAttribute2(device, u"id", filename=filename)
-			if deviceTypeId in self.devicesTypeDict:
-				raise LookupError(u"Duplicate device type id (%s) found in file %s" % (deviceTypeId, filename))
-			deviceDict[u"Type"] = self._getElementAttribute2(device, u"type", filename=filename)
-			if deviceDict[u"Type"] not in validDeviceTypes:
-				raise LookupError(u"Unknown device type in file %s" % (filename))
-			deviceDict[u"Name"] = self._getElementValueByTagName2(device, u"Name", filename=filename)
-			deviceDict[u"DisplayStateId"] = self._getElementValueByTagName2(device, u"UiDisplayStateId", required=False, default=u"", filename=filename)
-			deviceDict[u"SortOrder"] = sortIndex
-			sortIndex += 1
-
-			configUi = self._getChildSingleElementByTagName2(device, u"ConfigUI", required=False, filename=filename)
-			if configUi is not None:
-				deviceDict[u"ConfigUIRawXml"] = self._parseConfigUINode(configUi, filename=filename)
-
-			statesList = indigo.List()
-			deviceStateList = self._getChildSingleElementByTagName2(device, u"States", required=False, filename=filename)
-			if deviceStateList is not None:
-				deviceStateElements = self._getChildElementsByTagName2(deviceStateList, u"State")
-				for state in deviceStateElements:
-					stateId = self._getElementAttribute2(state, u"id", filename=filename)
-					triggerLabel = self._getElementValueByTagName2(state, u"TriggerLabel", required=False, default=u"", filename=filename)
-					controlPageLabel = self._getElementValueByTagName2(state, u"ControlPageLabel", required=False, default=u"", filename=filename)
-
-					disabled = False	# ToDo: need to read this?
-					stateValueType = self._getChildSingleElementByTagName2(state, u"ValueType", required=True, filename=filename)
-					stateValueList = self._getChildSingleElementByTagName2(stateValueType, u"List", required=False, filename=filename)
-					if stateValueList is not None:
-						# It must have a TriggerLabel and a ControlPageLabel
+		for elem in deviceElements:
+			if elem.tag == u"DeviceFactory":
+				deviceFactoryCount += 1
+				if deviceFactoryCount > 1:
+					raise ValueError(u"found %d <DeviceFactory> XML elements inside <Devices> in file %s (should only be one)" % (deviceFactoryCount, filename))
+				self._parseDeviceFactoryElement(elem, filename)
+			elif elem.tag == u"Device":
+				if self._parseDeviceElement(elem, basename, filename, sortIndex):
+					sortIndex += 1
+
+	def _parseDeviceFactoryElement(self, deviceFactory, filename):
+		deviceFactory = self._asXmlElement(deviceFactory)
+		# Test to make sure Name, ButtonTitle, and ConfigUI all exist:
+		nameElem = self._getChildSingleElementByTagName2(deviceFactory, u"Name", required=True, filename=filename)
+		buttonElem = self._getChildSingleElementByTagName2(deviceFactory, u"ButtonTitle", required=True, filename=filename)
+		configElem = self._getChildSingleElementByTagName2(deviceFactory, u"ConfigUI", required=True, filename=filename)
+		if configElem is not None:
+			replaceIndex = list(deviceFactory).index(configElem)
+			deviceFactory.remove(configElem)
+			deviceFactory.insert(replaceIndex, self._parseConfigUINode(configElem, filename=filename, returnXml=False))
+		self.deviceFactoryXml = xmlTree.tostring(deviceFactory, encoding="UTF-8", method="xml")
+
+	def _parseDeviceElement(self, device, basename, filename, sortIndex):
+		serverVers = self._getElementAttribute2(device, u"_minServerVers", required=False, errorIfNotAscii=False, filename=filename)
+		if serverVers is not None and not PluginBase.serverVersCompatWith(serverVers):
+			return False	# This version of Indigo Server isn't compatible with this object (skip it)
+
+		deviceDict = indigo.Dict()
+		deviceTypeId = self._getElementAttribute2(device, u"id", filename=filename)
+		if deviceTypeId in self.devicesTypeDict:
+			raise LookupError(u"Duplicate device type id (%s) found in file %s" % (deviceTypeId, filename))
+		deviceDict[u"Type"] = self._getElementAttribute2(device, u"type", filename=filename)
+		if deviceDict[u"Type"] not in validDeviceTypes:
+			raise LookupError(u"Unknown device type in file %s" % (filename))
+		deviceDict[u"Name"] = self._getElementValueByTagName2(device, u"Name", filename=filename)
+		deviceDict[u"DisplayStateId"] = self._getElementValueByTagName2(device, u"UiDisplayStateId", required=False, default=u"", filename=filename)
+		deviceDict[u"SortOrder"] = sortIndex
+
+		configUi = self._getChildSingleElementByTagName2(device, u"ConfigUI", required=False, filename=filename)
+		if configUi is not None:
+			deviceDict[u"ConfigUIRawXml"] = self._compileConfigUINode(configUi, filename, (basename, deviceTypeId))
+
+		statesList = indigo.List()
+		deviceStateList = self._getChildSingleElementByTagName2(device, u"States", required=False, filename=filename)
+		if deviceStateList is not None:
+			deviceStateElements = self._getChildElementsByTagName2(deviceStateList, u"State")
+			for state in deviceStateElements:
+				stateId = self._getElementAttribute2(state, u"id", filename=filename)
+				triggerLabel = self._getElementValueByTagName2(state, u"TriggerLabel", required=False, default=u"", filename=filename)
+				controlPageLabel = self._getElementValueByTagName2(state, u"ControlPageLabel", required=False, default=u"", filename=filename)
+
+				disabled = False	# ToDo: need to read this?
+				stateValueType = self._getChildSingleElementByTagName2(state, u"ValueType", required=True, filename=filename)
+				stateValueList = self._getChildSingleElementByTagName2(stateValueType, u"List", required=False, filename=filename)
+				if stateValueList is not None:
+					# It must have a TriggerLabel and a ControlPageLabel
+					if (triggerLabel == "") or (controlPageLabel == ""):
+						raise LookupError(u"State elements must have both a TriggerLabel and a ControlPageLabel in file %s" % (filename))
+					# It's an enumeration -- add an enum type for triggering off of any changes
+					# to this enumeration type:
+					stateDict = self.getDeviceStateDictForEnumType(stateId, triggerLabel, controlPageLabel, disabled)
+					statesList.append(stateDict)
+
+					# And add individual true/false types for triggering off every enumeration
+					# value possiblity (as specified by the Option list):
+					triggerLabelPrefix = self._getElementValueByTagName2(state, u"TriggerLabelPrefix", required=False, default=u"", filename=filename)
+					controlPageLabelPrefix = self._getElementValueByTagName2(state, u"ControlPageLabelPrefix", required=False, default=u"", filename=filename)
+
+					valueOptions = self._getChildElementsByTagName2(stateValueList, u"Option")
+					if len(valueOptions) < 1:
+						raise LookupError(u"<List> elements must have at least one <Option> element in file %s" % (filename))
+					for option in valueOptions:
+						if option.text is None:
+							continue
+						subStateId = stateId + u"." + self._getElementAttribute2(option, u"value", filename=filename)
+
+						if len(triggerLabelPrefix) > 0:
+							subTriggerLabel = triggerLabelPrefix + u" " + option.text
+						else:
+							subTriggerLabel = option.text
+
+						if len(controlPageLabelPrefix) > 0:
+							subControlPageLabel = controlPageLabelPrefix + u" " + option.text
+						else:
+							subControlPageLabel = option.text
+
+						subDisabled = False		# ToDo: need to read this?
+						subStateDict = self.getDeviceStateDictForBoolTrueFalseType(subStateId, subTriggerLabel, subControlPageLabel, subDisabled)
+						statesList.append(subStateDict)
+				elif stateValueType.text is not None:
+					# It's not an enumeration
+					stateDict = None
+					valueType = stateValueType.text.lower()
+					# It must have a TriggerLabel and a ControlPageLabel if it's not a separator
+					if (valueType != u"separator"):
 						if (triggerLabel == "") or (controlPageLabel == ""):
 							raise LookupError(u"State elements must have both a TriggerLabel and a ControlPageLabel in file %s" % (filename))
-						# It's an enumeration -- add an enum type for triggering off of any changes
-						# to this enumeration type:
-						stateDict = self.getDeviceStateDictForEnumType(stateId, triggerLabel, controlPageLabel, disabled)
+					if valueType == u"boolean":
+						boolType = stateValueType.get("boolType")
+						boolType = boolType.lower() if boolType is not None else u""
+						if boolType == u"onoff":
+							stateDict = self.getDeviceStateDictForBoolOnOffType(stateId, triggerLabel, controlPageLabel, disabled)
+						elif boolType == u"yesno":
+							stateDict = self.getDeviceStateDictForBoolYesNoType(stateId, triggerLabel, controlPageLabel, disabled)
+						elif boolType == u"onezero":
+							stateDict = self.getDeviceStateDictForBoolOneZeroType(stateId, triggerLabel, controlPageLabel, disabled)
+						else:
+							stateDict = self.getDeviceStateDictForBoolTrueFalseType(stateId, triggerLabel, controlPageLabel, disabled)
+					elif valueType == u"number" or valueType == u"float" or valueType == u"integer":
+						stateDict = self.getDeviceStateDictForNumberType(stateId, triggerLabel, controlPageLabel, disabled)
+					elif valueType == u"string":
+						stateDict = self.getDeviceStateDictForStringType(stateId, triggerLabel, controlPageLabel, disabled)
+					elif valueType == u"separator":
+						stateDict = self.getDeviceStateDictForSeparator(stateId)
+
+					if stateDict:
 						statesList.append(stateDict)
+				else:
+					raise LookupError(u"State elements <ValueType> empty in file %s" % (filename))
+		deviceDict[u"States"] = statesList
 
-						# And add individual true/false types for triggering off every enumeration
-						# value possiblity (as specified by the Option list):
-						triggerLabelPrefix = self._getElementValueByTagName2(state, u"TriggerLabelPrefix", required=False, default=u"", filename=filename)
-						controlPageLabelPrefix = self._getElementValueByTagName2(state, u"ControlPageLabelPrefix", required=False, default=u"", filename=filename)
-
-						valueOptions = self._getChildElementsByTagName2(stateValueList, u"Option")
-						if len(valueOptions) < 1:
-							raise LookupError(u"<List> elements must have at least one <Option> element in file %s" % (filename))
-						for option in valueOptions:
-							if option.text is None:
-								continue
-							subStateId = stateId + u"." + self._getElementAttribute2(option, u"value", filename=filename)
-
-							if len(triggerLabelPrefix) > 0:
-								subTriggerLabel = triggerLabelPrefix + u" " + option.text
-							else:
-								subTriggerLabel = option.text
-
-							if len(controlPageLabelPrefix) > 0:
-								subControlPageLabel = controlPageLabelPrefix + u" " + option.text
-							else:
-								subControlPageLabel = option.text
-
-							subDisabled = False		# ToDo: need to read this?
-							subStateDict = self.getDeviceStateDictForBoolTrueFalseType(subStateId, subTriggerLabel, subControlPageLabel, subDisabled)
-							statesList.append(subStateDict)
-					elif stateValueType.text is not None:
-						# It's not an enumeration
-						stateDict = None
-						valueType = stateValueType.text.lower()
-						# It must have a TriggerLabel and a ControlPageLabel if it's not a separator
-						if (valueType != u"separator"):
-							if (triggerLabel == "") or (controlPageLabel == ""):
-								raise LookupError(u"State elements must have both a TriggerLabel and a ControlPageLabel in file %s" % (filename))
-						if valueType == u"boolean":
-							boolType = stateValueType.get("boolType")
-							boolType = boolType.lower() if boolType is not None else u""
-							if boolType == u"onoff":
-								stateDict = self.getDeviceStateDictForBoolOnOffType(stateId, triggerLabel, controlPageLabel, disabled)
-							elif boolType == u"yesno":
-								stateDict = self.getDeviceStateDictForBoolYesNoType(stateId, triggerLabel, controlPageLabel, disabled)
-							elif boolType == u"onezero":
-								stateDict = self.getDeviceStateDictForBoolOneZeroType(stateId, triggerLabel, controlPageLabel, disabled)
-							else:
-								stateDict = self.getDeviceStateDictForBoolTrueFalseType(stateId, triggerLabel, controlPageLabel, disabled)
-						elif valueType == u"number" or valueType == u"float" or valueType == u"integer":
-							stateDict = self.getDeviceStateDictForNumberType(stateId, triggerLabel, controlPageLabel, disabled)
-						elif valueType == u"string":
-							stateDict = self.getDeviceStateDictForStringType(stateId, triggerLabel, controlPageLabel, disabled)
-						elif valueType == u"separator":
-							stateDict = self.getDeviceStateDictForSeparator(stateId)
-
-						if stateDict:
-							statesList.append(stateDict)
-					else:
-						raise LookupError(u"State elements <ValueType> empty in file %s" % (filename))
-			deviceDict[u"States"] = statesList
+		commPropertyKeys = self._getChildSingleElementByTagName2(device, u"CommPropertyKeys", required=False, filename=filename)
+		if commPropertyKeys is not None:
+			self._deviceCommPropertyKeys[deviceTypeId] = self._parsePropertyKeysElement(commPropertyKeys, filename)
+
+		self.devicesTypeDict[deviceTypeId] = deviceDict
+		return True
 
-			self.devicesTypeDict[deviceTypeId] = deviceDict
+	# Returns the <Key> values of a <CommPropertyKeys> or <ProcessingPropertyKeys> element
+	def _parsePropertyKeysElement(self, keysElem, filename):
+		keys = []
+		for keyElem in self._getChildElementsByTagName2(keysElem, u"Key"):
+			if keyElem.text is None or len(keyElem.text.strip()) == 0:
+				raise ValueError(u"<%s> elements must only contain non-empty <Key> elements in file %s" % (keysElem.tag, filename))
+			keys.append(keyElem.text.strip())
+		return tuple(keys)
 
 	###################
-	def _parseEventsXML(self, filename):
-		if not self._xmlOrJsonFileExist(filename):
+	def _parseEventsXML(self, basename):
+		if not self._xmlOrJsonFileExist(basename):
 			return
-		(eventsTree, filename) = self._xmlOrJsonParse(filename)
-		if eventsTree.tag != "Events":
-			raise LookupError(u"Incorrect number of <Events> elements found in file %s" % (filename))
-
+		(filename, eventElements) = self._iterXmlOrJsonChildren(basename, u"Events")
 		sortIndex = 0
-		eventElemList = self._getChildElementsByTagName2(eventsTree, u"Event")
-		for event in eventElemList:
-			serverVers = self._getElementAttribute2(event, u"_minServerVers", required=False, errorIfNotAscii=False, filename=filename)
-			if serverVers is not None and not PluginBase.serverVersCompatWith(serverVers):
-				continue	# This version of Indigo Server isn't compatible with this object (skip it)
-
-			eventDict = indigo.Dict()
-			eventTypeId = self._getElementAttribute2(event, u"id", filename=filename)
-			if eventTypeId in self.eventsTypeDict:
-				raise LookupError(u"Duplicate event type id (%s) found in file %s" % (eventTypeId, filename))
-			try:
-				eventDict[u"Name"] = self._getElementValueByTagName2(event, u"Name", filename=filename)
-			except ValueError:
-				# It's missing <Name> so treat it as a separator
-				eventDict[u"Name"] = u" - "
-			eventDict[u"SortOrder"] = sortIndex
-			sortIndex += 1
+		for event in eventElements:
+			if event.tag == u"Event":
+				if self._parseEventElement(event, basename, filename, sortIndex):
+					sortIndex += 1
+
+	def _parseEventElement(self, event, basename, filename, sortIndex):
+		serverVers = self._getElementAttribute2(event, u"_minServerVers", required=False, errorIfNotAscii=False, filename=filename)
+		if serverVers is not None and not PluginBase.serverVersCompatWith(serverVers):
+			return False	# This version of Indigo Server isn't compatible with this object (skip it)
+
+		eventDict = indigo.Dict()
+		eventTypeId = self._getElementAttribute2(event, u"id", filename=filename)
+		if eventTypeId in self.eventsTypeDict:
+			raise LookupError(u"Duplicate event type id (%s) found in file %s" % (eventTypeId, filename))
+		try:
+			eventDict[u"Name"] = self._getElementValueByTagName2(event, u"Name", filename=filename)
+		except ValueError:
+			# It's missing <Name> so treat it as a separator
+			eventDict[u"Name"] = u" - "
+		eventDict[u"SortOrder"] = sortIndex
 
-			configUi = self._getChildSingleElementByTagName2(event, u"ConfigUI", required=False, filename=filename)
-			if configUi is not None:
-				eventDict[u"ConfigUIRawXml"] = self._parseConfigUINode(configUi, filename=filename)
+		configUi = self._getChildSingleElementByTagName2(event, u"ConfigUI", required=False, filename=filename)
+		if configUi is not None:
+			eventDict[u"ConfigUIRawXml"] = self._compileConfigUINode(configUi, filename, (basename, eventTypeId))
+
+		processingPropertyKeys = self._getChildSingleElementByTagName2(event, u"ProcessingPropertyKeys", required=False, filename=filename)
+		if processingPropertyKeys is not None:
+			self._eventProcessingPropertyKeys[eventTypeId] = self._parsePropertyKeysElement(processingPropertyKeys, filename)
+
+		firingLimits = self._getChildSingleElementByTagName2(event, u"FiringLimits", required=False, filename=filename)
+		if firingLimits is not None:
+			self._eventFiringLimits[eventTypeId] = self._parseFiringLimitsElement(firingLimits, filename)
 
-			self.eventsTypeDict[eventTypeId] = eventDict
+		self.eventsTypeDict[eventTypeId] = eventDict
+		return True
+
+	# <FiringLimits debounce="seconds" edge="leading|trailing|both" maxRate="per second" />
+	def _parseFiringLimitsElement(self, firingLimits, filename):
+		try:
+			debounce = float(self._getElementAttribute2(firingLimits, u"debounce", required=False, default=u"0", errorIfNotAscii=False, filename=filename))
+			maxRate = float(self._getElementAttribute2(firingLimits, u"maxRate", required=False, default=u"0", errorIfNotAscii=False, filename=filename))
+		except ValueError:
+			raise ValueError(u"<FiringLimits> debounce and maxRate attributes must be numbers in file %s" % (filename))
+		edge = self._getElementAttribute2(firingLimits, u"edge", required=False, default=u"leading", filename=filename).lower()
+		if debounce < 0.0 or maxRate < 0.0:
+			raise ValueError(u"<FiringLimits> debounce and maxRate attributes must not be negative in file %s" % (filename))
+		if edge not in (u"leading", u"trailing", u"both"):
+			raise ValueError(u"<FiringLimits> edge attribute must be leading, trailing or both in file %s" % (filename))
+		return {u"debounce": debounce, u"edge": edge, u"maxRate": maxRate}
 
 	###################
-	def _parseActionsXML(self, filename):
-		if not self._xmlOrJsonFileExist(filename):
+	def _parseActionsXML(self, basename):
+		if not self._xmlOrJsonFileExist(basename):
 			return
-		(actionsTree, filename) = self._xmlOrJsonParse(filename)
-		if actionsTree.tag != "Actions":
-			raise LookupError(u"Incorrect number of <Actions> elements found in file %s" % (filename))
-
+		(filename, actionElements) = self._iterXmlOrJsonChildren(basename, u"Actions")
 		sortIndex = 0
-		actionElemList = self._getChildElementsByTagName2(actionsTree, u"Action")
-		for action in actionElemList:
-			serverVers = self._getElementAttribute2(action, u"_minServerVers", required=False, errorIfNotAscii=False, filename=filename)
-			if serverVers is not None and not PluginBase.serverVersCompatWith(serverVers):
-				continue	# This version of Indigo Server isn't compatible with this object (skip it)
+		for action in actionElements:
+			if action.tag == u"Action":
+				if self._parseActionElement(action, basename, filename, sortIndex):
+					sortIndex += 1
+
+	def _parseActionElement(self, action, basename, filename, sortIndex):
+		serverVers = self._getElementAttribute2(action, u"_minServerVers", required=False, errorIfNotAscii=False, filename=filename)
+		if serverVers is not None and not PluginBase.serverVersCompatWith(serverVers):
+			return False	# This version of Indigo Server isn't compatible with this object (skip it)
+
+		actionDict = indigo.Dict()
+		actionTypeId = self._getElementAttribute2(action, u"id", filename=filename)
+		if actionTypeId in self.actionsTypeDict:
+			raise LookupError(u"Duplicate action type id (%s) found in file %s" % (actionTypeId, filename))
+
+		try:
+			actionDict[u"Name"] = self._getElementValueByTagName2(action, u"Name", filename=filename)
+			actionDict[u"CallbackMethod"] = self._getElementValueByTagName2(action, u"CallbackMethod", required=False, default=u"", filename=filename)
+			actionDict[u"DeviceFilter"] = self._getElementAttribute2(action, u"deviceFilter", required=False, default=u"", filename=filename)
+		except ValueError:
+			# It's missing <Name> so treat it as a separator
+			actionDict[u"Name"] = u" - "
+			actionDict[u"CallbackMethod"] = u""
+			actionDict[u"DeviceFilter"] = u""
+		actionDict[u"UiPath"] = self._getElementAttribute2(action, u"uiPath", required=False, filename=filename)
+		actionDict[u"PrivateUiPath"] = self._getElementAttribute2(action, u"privateUiPath", required=False, filename=filename)
+		actionDict[u"SortOrder"] = sortIndex
+
+		configUi = self._getChildSingleElementByTagName2(action, u"ConfigUI", required=False, filename=filename)
+		if configUi is not None:
+			actionDict[u"ConfigUIRawXml"] = self._compileConfigUINode(configUi, filename, (basename, actionTypeId))
+
+		self.actionsTypeDict[actionTypeId] = actionDict
+		return True
 
-			actionDict = indigo.Dict()
-			actionTypeId = self._getElementAttribute2(action, u"id", filename=filename)
-			if actionTypeId in self.actionsTypeDict:
-				raise LookupError(u"Duplicate action type id (%s) found in file %s" % (actionTypeId, filename))
+	########################################
+	# The descriptor cache holds the parsed type dictionaries (converted to native Python
+	# types for pickling) along with the SHA-1 of every file they were parsed from; it is
+	# only used when all of those files, the way each descriptor basename resolves to a
+	# .json or .xml file, the server version and the cache format are unchanged.
+	@staticmethod
+	def _getFileHash(path):
+		if not os.path.isfile(path):
+			return None
+		f = file(path, 'rb')
+		fileHash = hashlib.sha1(f.read()).hexdigest()
+		f.close()
+		return fileHash
+
+	def _getDescriptorFilenames(self):
+		descriptorFilenames = []
+		for basename in (kMenuItemsFilename, kDevicesFilename, kEventsFilename, kActionsFilename):
+			if self._xmlOrJsonFileExist(basename):
+				descriptorFilenames.append((basename, self._resolveXmlOrJsonFilename(basename, "./")[0]))
+			else:
+				descriptorFilenames.append((basename, None))
+		return descriptorFilenames
 
+	@staticmethod
+	def _toNativeTypes(value):
+		if isinstance(value, indigo.Dict):
+			return dict((key, PluginBase._toNativeTypes(item)) for (key, item) in value.items())
+		elif isinstance(value, indigo.List):
+			return [PluginBase._toNativeTypes(item) for item in value]
+		return value
+
+	@staticmethod
+	def _toIndigoTypes(value):
+		if isinstance(value, dict):
+			indigoDict = indigo.Dict()
+			for (key, item) in value.iteritems():
+				indigoDict[key] = PluginBase._toIndigoTypes(item)
+			return indigoDict
+		elif isinstance(value, list):
+			indigoList = indigo.List()
+			for item in value:
+				indigoList.append(PluginBase._toIndigoTypes(item))
+			return indigoList
+		return value
+
+	# The working directory is the bundle's Contents/Server Plugin folder
+	def _getDescriptorCachePath(self):
+		bundlePath = os.path.dirname(os.path.dirname(os.path.abspath(os.getcwd())))
+		return os.path.join(os.path.dirname(bundlePath), u".%s%s" % (self.pluginId, kDescriptorCacheFilename))
+
+	def _loadDescriptorCache(self):
+		cachePath = self._getDescriptorCachePath()
+		if not self.descriptorCacheEnabled or not os.path.isfile(cachePath):
+			return False
+		try:
+			f = file(cachePath, 'rb')
 			try:
-				actionDict[u"Name"] = self._getElementValueByTagName2(action, u"Name", filename=filename)
-				actionDict[u"CallbackMethod"] = self._getElementValueByTagName2(action, u"CallbackMethod", required=False, default=u"", filename=filename)
-				actionDict[u"DeviceFilter"] = self._getElementAttribute2(action, u"deviceFilter", required=False, default=u"", filename=filename)
-			except ValueError:
-				# It's missing <Name> so treat it as a separator
-				actionDict[u"Name"] = u" - "
-				actionDict[u"CallbackMethod"] = u""
-				actionDict[u"DeviceFilter"] = u""
-			actionDict[u"UiPath"] = self._getElementAttribute2(action, u"uiPath", required=False, filename=filename)
-			actionDict[u"PrivateUiPath"] = self._getElementAttribute2(action, u"privateUiPath", required=False, filename=filename)
-			actionDict[u"SortOrder"] = sortIndex
-			sortIndex += 1
-
-			configUi = self._getChildSingleElementByTagName2(action, u"ConfigUI", required=False, filename=filename)
-			if configUi is not None:
-				actionDict[u"ConfigUIRawXml"] = self._parseConfigUINode(configUi, filename=filename)
+				cache = cPickle.load(f)
+			finally:
+				f.close()
+
+			if cache[u"formatVersion"] != kDescriptorCacheFormatVersion or cache[u"serverVersion"] != indigo.server.version:
+				return False
+			if cache[u"descriptorFilenames"] != self._getDescriptorFilenames():
+				return False
+			for (path, fileHash) in cache[u"sourceFiles"]:
+				if self._getFileHash(path) != fileHash:
+					return False
+
+			# convert everything before storing any of it so that a bad cache file cannot
+			# leave the type dictionaries partially filled
+			menuItemsList = [self._toIndigoTypes(menuDict) for menuDict in cache[u"menuItemsList"]]
+			typeDicts = []
+			for (typeDict, cachedTypes) in ((self.devicesTypeDict, cache[u"devicesTypeDict"]), (self.eventsTypeDict, cache[u"eventsTypeDict"]), (self.actionsTypeDict, cache[u"actionsTypeDict"])):
+				typeDicts.append((typeDict, [(typeId, self._toIndigoTypes(typeInfo)) for (typeId, typeInfo) in cachedTypes.iteritems()]))
+			deviceFactoryXml = cache[u"deviceFactoryXml"]
+			deviceCommPropertyKeys = cache[u"deviceCommPropertyKeys"]
+			eventProcessingPropertyKeys = cache[u"eventProcessingPropertyKeys"]
+			eventFiringLimits = cache[u"eventFiringLimits"]
+			configUiCache = cache[u"configUiCache"]
+		except Exception, e:
+			self.logger.debug(u"unable to load %s, parsing the descriptor files: %s" % (cachePath, unicode(e)))
+			return False
+
+		for menuDict in menuItemsList:
+			self.menuItemsList.append(menuDict)
+			self.menuItemsDict[menuDict[u"Id"]] = menuDict
+		for (typeDict, typeItems) in typeDicts:
+			for (typeId, typeInfo) in typeItems:
+				typeDict[typeId] = typeInfo
+		self.deviceFactoryXml = deviceFactoryXml
+		self._deviceCommPropertyKeys.update(deviceCommPropertyKeys)
+		self._eventProcessingPropertyKeys.update(eventProcessingPropertyKeys)
+		self._eventFiringLimits.update(eventFiringLimits)
+		self._configUiCache.update(configUiCache)
+		return True
 
-			self.actionsTypeDict[actionTypeId] = actionDict
+	def _saveDescriptorCache(self, sourceFiles):
+		if not self.descriptorCacheEnabled:
+			return
+		cachePath = self._getDescriptorCachePath()
+		try:
+			cache = {
+				u"formatVersion": kDescriptorCacheFormatVersion,
+				u"serverVersion": indigo.server.version,
+				u"descriptorFilenames": self._getDescriptorFilenames(),
+				u"sourceFiles": [(path, self._getFileHash(path)) for path in sorted(set(sourceFiles))],
+				u"menuItemsList": [self._toNativeTypes(menuDict) for menuDict in self.menuItemsList],
+				u"devicesTypeDict": self._toNativeTypes(self.devicesTypeDict),
+				u"eventsTypeDict": self._toNativeTypes(self.eventsTypeDict),
+				u"actionsTypeDict": self._toNativeTypes(self.actionsTypeDict),
+				u"deviceFactoryXml": self.deviceFactoryXml,
+				u"deviceCommPropertyKeys": self._deviceCommPropertyKeys,
+				u"eventProcessingPropertyKeys": self._eventProcessingPropertyKeys,
+				u"eventFiringLimits": self._eventFiringLimits,
+				u"configUiCache": self._configUiCache
+			}
+			# write to a temporary file and rename it so that a plugin starting at the same
+			# time never reads a partially written cache
+			tempFilename = "%s.%d" % (cachePath, os.getpid())
+			f = file(tempFilename, 'wb')
+			try:
+				cPickle.dump(cache, f, cPickle.HIGHEST_PROTOCOL)
+			finally:
+				f.close()
+			os.rename(tempFilename, cachePath)
+		except Exception, e:
+			self.logger.warn(u"unable to save the descriptor cache %s (the descriptor files will be parsed on every start): %s" % (cachePath, unicode(e)))
 
 	################################################################################
+	########################################
+	# Each compiled ConfigUI is cached under (descriptor basename, item id) along with
+	# the (mtime, size) of every file read to compile it: the descriptor file itself and
+	# any template files swapped in. A cached ConfigUI is served as long as none of those
+	# files has changed; otherwise it is compiled again from the files on disk.
+	@staticmethod
+	def _getFileSignature(path):
+		try:
+			fileStat = os.stat(path)
+		except OSError:
+			return None
+		return (fileStat.st_mtime, fileStat.st_size)
+
+	def _compileConfigUINode(self, configUI, filename, cacheKey):
+		with self._configUiCacheLock:
+			self._configUiSourceFiles = ["./" + filename]
+			try:
+				if configUI is None:
+					rawXml = None
+				else:
+					rawXml = self._parseConfigUINode(self._asXmlElement(configUI), filename=filename)
+				sourceFiles = self._configUiSourceFiles
+			finally:
+				self._configUiSourceFiles = None
+			sourceSignatures = [(path, self._getFileSignature(path)) for path in sourceFiles]
+			self._configUiCache[cacheKey] = (sourceSignatures, rawXml)
+		return rawXml
+
+	def _compileConfigUIFromFile(self, basename, itemTag, itemId):
+		with self._configUiCacheLock:
+			if itemTag is None or self._resolveXmlOrJsonFilename(basename, "./")[1]:
+				(configUiTree, filename) = self._xmlOrJsonParse(basename)
+			else:
+				(configUiTree, filename) = self._parseJsonDescriptor(basename)
+			if itemTag is None:
+				# the file itself is the ConfigUI (PluginConfig)
+				if configUiTree.tag != "PluginConfig":
+					raise LookupError(u"%s file must have one root level <PluginConfig> node" % (filename))
+				configUi = configUiTree
+			else:
+				configUi = None
+				for itemElem in self._getChildElementsByTagName2(configUiTree, itemTag):
+					serverVers = itemElem.get(u"_minServerVers")
+					if serverVers is not None and not PluginBase.serverVersCompatWith(serverVers):
+						continue
+					if itemElem.get(u"id") == itemId:
+						configUi = self._getChildSingleElementByTagName2(itemElem, u"ConfigUI", required=False, filename=filename)
+						break
+			return self._compileConfigUINode(configUi, filename, (basename, itemId))
+
+	def _getCachedConfigUI(self, basename, itemTag=None, itemId=None, itemDict=None):
+		cacheKey = (basename, itemId)
+		cacheEntry = self._configUiCache.get(cacheKey, None)
+		if cacheEntry is None and itemDict is not None:
+			# the item had no ConfigUI when its descriptor file was parsed
+			return itemDict[u"ConfigUIRawXml"]
+
+		if self.configUiCacheEnabled and cacheEntry is not None:
+			for (path, signature) in cacheEntry[0]:
+				if self._getFileSignature(path) != signature:
+					break
+			else:
+				self.configUiCacheHitCount += 1
+				rawXml = cacheEntry[1]
+				if rawXml is None and itemDict is not None:
+					return itemDict[u"ConfigUIRawXml"]
+				return rawXml
+
+		self.configUiCacheMissCount += 1
+		rawXml = self._compileConfigUIFromFile(basename, itemTag, itemId)
+		if rawXml is None and itemDict is not None:
+			# the item (or its ConfigUI) has since been removed from the file
+			return itemDict[u"ConfigUIRawXml"]
+		return rawXml
+
 	########################################
 	def doesPrefsConfigUiExist(self):
 		return self._xmlOrJsonFileExist(kPluginConfigFilename)
 
 	def getPrefsConfigUiXml(self):
-		(configUiTree, filename) = self._xmlOrJsonParse(kPluginConfigFilename)
-		if configUiTree.tag != "PluginConfig":
-			raise LookupError(u"%s file must have one root level <PluginConfig> node" % (filename))
-		return self._parseConfigUINode(configUiTree, filename=filename)
+		return self._getCachedConfigUI(kPluginConfigFilename)
 
 	def getPrefsConfigUiValues(self):
 		valuesDict = self.pluginPrefs
@@ -952,7 +2220,7 @@ class PluginBase(object):
 
 	def getMenuActionConfigUiXml(self, menuId):
 		if menuId in self.menuItemsDict:
-			xmlRaw = self.menuItemsDict[menuId][u"ConfigUIRawXml"]
+			xmlRaw = self._getCachedConfigUI(kMenuItemsFilename, u"MenuItem", menuId, self.menuItemsDict[menuId])
 			return xmlRaw
 		return None
 
@@ -992,7 +2260,7 @@ class PluginBase(object):
 	###################
 	def getDeviceConfigUiXml(self, typeId, devId):
 		if typeId in self.devicesTypeDict:
-			return self.devicesTypeDict[typeId][u"ConfigUIRawXml"]
+			return self._getCachedConfigUI(kDevicesFilename, u"Device", typeId, self.devicesTypeDict[typeId])
 		return None
 
 	def getDeviceConfigUiValues(self, pluginProps, typeId, devId):
@@ -1036,9 +2304,16 @@ class PluginBase(object):
 	def getEventsDict(self):
 		return self.eventsTypeDict
 
+	# Returns the limits declared for the event type with <FiringLimits> in Events.xml as
+	# a dict of debounce (seconds), edge ("leading", "trailing" or "both") and maxRate
+	# (firings per second, 0 for no limit); None if it has none. The plugin enforces them
+	# when it fires its triggers.
+	def getEventFiringLimits(self, typeId):
+		return self._eventFiringLimits.get(typeId, None)
+
 	def getEventConfigUiXml(self, typeId, eventId):
 		if typeId in self.eventsTypeDict:
-			return self.eventsTypeDict[typeId][u"ConfigUIRawXml"]
+			return self._getCachedConfigUI(kEventsFilename, u"Event", typeId, self.eventsTypeDict[typeId])
 		return None
 
 	def getEventConfigUiValues(self, pluginProps, typeId, eventId):
@@ -1067,7 +2342,7 @@ class PluginBase(object):
 
 	def getActionConfigUiXml(self, typeId, devId):
 		if typeId in self.actionsTypeDict:
-			return self.actionsTypeDict[typeId][u"ConfigUIRawXml"]
+			return self._getCachedConfigUI(kActionsFilename, u"Action", typeId, self.actionsTypeDict[typeId])
 		return None
 
 	def getActionConfigUiValues(self, pluginProps, typeId, devId):
@@ -1088,24 +2363,91 @@ class PluginBase(object):
 	################################################################################
 	########################################
 	def _deviceEnumAndStartComm(self):
-		for elem in indigo.devices.iter(self.pluginId):
-			if elem.configured and elem.enabled:
-				try:
-					self.deviceStartComm(elem)
-				except Exception, e:
-					self.logger.error(u"exception in deviceStartComm(%s): %s" % (elem.name, unicode(e)))
-				except:
-					self.logger.error(u"exception in deviceStartComm(%s)" % (elem.name,))
+		self._deviceEnumAndCallComm(u"deviceStartComm")
 
 	def _deviceEnumAndStopComm(self):
-		for elem in indigo.devices.iter(self.pluginId):
-			if elem.configured and elem.enabled:
-				try:
-					self.deviceStopComm(elem)
-				except Exception, e:
-					self.logger.error(u"exception in deviceStopComm(%s): %s" % (elem.name, unicode(e)))
-				except:
-					self.logger.error(u"exception in deviceStopComm(%s)" % (elem.name,))
+		self._deviceEnumAndCallComm(u"deviceStopComm")
+
+	def _deviceEnumAndCallComm(self, methodName):
+		devices = [elem for elem in indigo.devices.iter(self.pluginId) if elem.configured and elem.enabled]
+		startTime = time.time()
+		if self.deviceCommConcurrency > 1 and len(devices) > 1:
+			latencies = self._callDeviceCommInThreads(methodName, devices)
+		else:
+			latencies = []
+			for elem in devices:
+				callStartTime = time.time()
+				self._callDeviceComm(methodName, elem)
+				latencies.append((elem.name, time.time() - callStartTime))
+		elapsed = time.time() - startTime
+		self.deviceCommReport[methodName] = (elapsed, latencies)
+
+		if len(devices) > 0:
+			timedOutCount = len([seconds for (name, seconds) in latencies if seconds is None])
+			slowest = sorted([(seconds, name) for (name, seconds) in latencies if seconds is not None], reverse=True)[:5]
+			self.logger.debug(u"%s called for %d device(s) in %.2f sec (%d timed out); slowest: %s" % (methodName, len(devices), elapsed, timedOutCount, u", ".join([u"%s %.2f sec" % (name, seconds) for (seconds, name) in slowest])))
+
+	def _callDeviceComm(self, methodName, elem):
+		try:
+			getattr(self, methodName)(elem)
+		except Exception, e:
+			self.logger.error(u"exception in %s(%s): %s" % (methodName, elem.name, unicode(e)))
+		except:
+			self.logger.error(u"exception in %s(%s)" % (methodName, elem.name))
+
+	# Calls methodName for the devices from up to deviceCommConcurrency threads at a time;
+	# returns [(device name, seconds or None if timed out)] in the order the calls ended
+	def _callDeviceCommInThreads(self, methodName, devices):
+		# the condition and the set of abandoned threads are shared by every enumeration so
+		# that a call abandoned by an earlier one keeps its place until it returns
+		condition = self._deviceCommCondition
+		abandoned = self._abandonedDeviceCommThreads
+		finished = []
+		def callComm(elem):
+			callStartTime = time.time()
+			self._callDeviceComm(methodName, elem)
+			with condition:
+				abandoned.discard(threading.current_thread())
+				finished.append((threading.current_thread(), time.time() - callStartTime))
+				condition.notifyAll()
+
+		pending = collections.deque(devices)
+		running = {}		# thread -> (device, time started)
+		latencies = []
+		while len(pending) > 0 or len(running) > 0:
+			with condition:
+				abandonedPlaces = min(len(abandoned), self.deviceCommConcurrency - 1)
+			while len(pending) > 0 and len(running) + abandonedPlaces < self.deviceCommConcurrency:
+				elem = pending.popleft()
+				thread = threading.Thread(target=callComm, args=(elem,), name=u"%s(%s)" % (methodName, elem.id))
+				thread.setDaemon(True)
+				running[thread] = (elem, time.time())
+				thread.start()
+
+			timedOutCalls = []
+			with condition:
+				if len(finished) == 0:
+					oldestStartTime = min([callStartTime for (elem, callStartTime) in running.itervalues()])
+					condition.wait(max(0.0, oldestStartTime + self.deviceCommTimeout - time.time()))
+				for (thread, seconds) in finished:
+					callInfo = running.pop(thread, None)
+					if callInfo is not None:		# else it already timed out
+						latencies.append((callInfo[0].name, seconds))
+				del finished[:]
+
+				# a call that has not finished by now is still running, so it is certain to
+				# remove itself from the abandoned threads once it returns
+				now = time.time()
+				for (thread, (elem, callStartTime)) in running.items():
+					if now - callStartTime >= self.deviceCommTimeout:
+						del running[thread]
+						abandoned.add(thread)
+						timedOutCalls.append(elem)
+
+			for elem in timedOutCalls:
+				self.logger.error(u"%s(%s) did not return within %.0f sec; no longer waiting for it" % (methodName, elem.name, self.deviceCommTimeout))
+				latencies.append((elem.name, None))
+		return latencies
 
 	def didDeviceCommPropertyChange(self, origDev, newDev):
 		# Return True if a plugin related property changed from
@@ -1114,11 +2456,23 @@ class PluginBase(object):
 		# are comm related, but plugin can subclass to provide
 		# more specific/optimized testing. The return val of
 		# this method will effect when deviceStartComm() and
-		# deviceStopComm() are called.
+		# deviceStopComm() are called. If the device type lists
+		# its comm related properties (see deviceCommPropertyKeys)
+		# only those are compared.
+		commPropertyKeys = self._deviceCommPropertyKeys.get(newDev.deviceTypeId, None)
+		if commPropertyKeys is not None:
+			return self._didPropertiesChange(origDev.pluginProps, newDev.pluginProps, commPropertyKeys)
 		if origDev.pluginProps != newDev.pluginProps:
 			return True
 		return False
 
+	@staticmethod
+	def _didPropertiesChange(origProps, newProps, keys):
+		for key in keys:
+			if origProps.get(key, None) != newProps.get(key, None):
+				return True
+		return False
+
 	def deviceStartComm(self, dev):
 		# self.logger.debug(u"deviceStartComm: " + dev.name)
 		pass
@@ -1146,6 +2500,8 @@ class PluginBase(object):
 	def deviceUpdated(self, origDev, newDev):
 		# self.logger.debug(u"deviceUpdated orig: \n" + unicode(origDev))
 		# self.logger.debug(u"deviceUpdated new: \n" + unicode(newDev))
+		self._updateSubstitutionsForDevice(origDev, newDev)
+
 		origDevPluginId = origDev.pluginId
 		newDevPluginId = newDev.pluginId
 		if origDevPluginId != self.pluginId and newDevPluginId != self.pluginId:
@@ -1216,7 +2572,12 @@ class PluginBase(object):
 		# are comm related, but plugin can subclass to provide
 		# more specific/optimized testing. The return val of
 		# this method will effect when triggerStartProcessing() and
-		# triggerStopProcessing() are called.
+		# triggerStopProcessing() are called. If the event type lists
+		# its processing related properties (see
+		# eventProcessingPropertyKeys) only those are compared.
+		processingPropertyKeys = self._eventProcessingPropertyKeys.get(self._triggerGetPluginTypeId(newTrigger), None)
+		if processingPropertyKeys is not None:
+			return self._didPropertiesChange(origTrigger.pluginProps, newTrigger.pluginProps, processingPropertyKeys)
 		if origTrigger.pluginProps != newTrigger.pluginProps:
 			return True
 		return False
@@ -1334,7 +2695,7 @@ class PluginBase(object):
 	def variableUpdated(self, origVar, newVar):
 		# self.logger.debug(u"variableUpdated orig: \n" + unicode(origVar))
 		# self.logger.debug(u"variableUpdated new: \n" + unicode(newVar))
-		pass
+		self._updateSubstitutionsForVariable(origVar, newVar)
 
 	################################################################################
 	########################################
@@ -1350,98 +2711,218 @@ class PluginBase(object):
 
 	########################################
 	def _insertVariableValue(self, matchobj):
-		try:
-			theVarValue = indigo.variables[int(matchobj.group(1))].value
-		except:
-			theVarValue = ""
-			self.logger.error(u"Variable id " + matchobj.group(1) + u" not found for substitution")
-		return theVarValue
+		return SubstitutionSnapshot(self.logger).getVariableValue(matchobj.group(1))
 
 	###################
 	def substituteVariable(self, inString, validateOnly=False):
-		validated = True
-		variableValue = None
-		stringParts = inString.split("%%")
-		for substr in stringParts:
-			if substr[0:2] == "v:":
-				varNameTuple = substr.split(":")
-				varIdString = varNameTuple[1]
-				if varIdString.find(" ") < 0:
-					try:
-						varId = int(varIdString)
-						theVariable = indigo.variables.get(varId, None)
-						if theVariable is None:
+		snapshot = SubstitutionSnapshot(self.logger)
+		if validateOnly:
+			validated = True
+			stringParts = inString.split("%%")
+			for substr in stringParts:
+				if substr[0:2] == "v:":
+					varNameTuple = substr.split(":")
+					varIdString = varNameTuple[1]
+					if varIdString.find(" ") < 0:
+						try:
+							varId = int(varIdString)
+							if snapshot.getVariable(varId) is None:
+								validated = False
+						except:
 							validated = False
-						else:
-							variableValue = theVariable.value
-					except:
+					else:
 						validated = False
-				else:
-					validated = False
-		if validateOnly:
 			if validated:
 				return (validated,)
 			else:
 				return (validated, u"Either a variable ID doesn't exist or there's a substitution format error")
 		else:
-			p = re.compile("\%%v:([0-9]*)%%")
-			newString = p.sub(self._insertVariableValue, inString)
+			newString = kSubstituteVariableRegex.sub(lambda matchobj: snapshot.getVariableValue(matchobj.group(1)), inString)
 			return newString
 
 	########################################
 	def _insertStateValue(self, matchobj):
-		try:
-			theStateValue = unicode(indigo.devices[int(matchobj.group(1))].states[matchobj.group(2)])
-		except:
-			theStateValue = ""
-			self.logger.error(u"Device id " + matchobj.group(1) + u" or state id " + matchobj.group(2) + u" not found for substitution")
-		return theStateValue
+		return SubstitutionSnapshot(self.logger).getStateValue(matchobj.group(1), matchobj.group(2))
 
 	###################
 	def substituteDeviceState(self, inString, validateOnly=False):
-		validated = True
-		stateValue = None
-		stringParts = inString.split("%%")
-		for substr in stringParts:
-			if substr[0:2] == "d:":
-				devParts = substr.split(":")
-				if (len(devParts) != 3):
-					validated = False
-				else:
-					devIdString = devParts[1]
-					devStateName = devParts[2]
-					if devIdString.find(" ") < 0:
-						try:
-							devId = int(devIdString)
-							theDevice = indigo.devices.get(devId, None)
-							if theDevice is None:
+		snapshot = SubstitutionSnapshot(self.logger)
+		if validateOnly:
+			validated = True
+			stringParts = inString.split("%%")
+			for substr in stringParts:
+				if substr[0:2] == "d:":
+					devParts = substr.split(":")
+					if (len(devParts) != 3):
+						validated = False
+					else:
+						devIdString = devParts[1]
+						devStateName = devParts[2]
+						if devIdString.find(" ") < 0:
+							try:
+								devId = int(devIdString)
+								theDevice = snapshot.getDevice(devId)
+								if theDevice is None:
+									validated = False
+								else:
+									theDevice.states[devStateName]
+							except:
 								validated = False
-							else:
-								stateValue = theDevice.states[devStateName]
-						except:
+						else:
 							validated = False
-					else:
-						validated = False
-		if validateOnly:
 			if validated:
 				return (validated,)
 			else:
 				return (validated, u"Either a device ID or state doesn't exist or there's a substitution format error")
 		else:
-			p = re.compile("\%%d:([0-9]*):([A-z0-9\.]*)%%")
-			newString = p.sub(self._insertStateValue, inString)
+			newString = kSubstituteDeviceStateRegex.sub(lambda matchobj: snapshot.getStateValue(matchobj.group(1), matchobj.group(2)), inString)
 			return newString
 
 	########################################
+	# Substitutes the variable values and then the device states into inString. Each
+	# distinct string is compiled once into a SubstitutionTemplate (kept in an LRU cache
+	# of substitutionCacheSize strings) which is then rendered in a single pass; the
+	# values inserted for variables are not themselves searched for device state tokens.
+	# Each variable and device is fetched from the server once, however often it is used.
 	def substitute(self, inString, validateOnly=False):
-		results = self.substituteVariable(inString, validateOnly)
-		if isinstance(results, tuple):
-			if results[0]:
-				results = inString
-			else:
+		if validateOnly:
+			results = self.substituteVariable(inString, validateOnly)
+			if not results[0]:
 				return results
-		results = self.substituteDeviceState(results, validateOnly)
-		return results
+			return self.substituteDeviceState(inString, validateOnly)
+		return self._renderSubstitution(inString, SubstitutionSnapshot(self.logger))
+
+	# Substitutes each of the strings in inStrings, returning the list of results; every
+	# variable and device used by any of the strings is fetched only once, so all of the
+	# strings show the same values
+	def substituteMany(self, inStrings):
+		snapshot = SubstitutionSnapshot(self.logger)
+		return [self._renderSubstitution(inString, snapshot) for inString in inStrings]
+
+	def _renderSubstitution(self, inString, snapshot):
+		template = self._getSubstitutionTemplate(inString)
+		if template.isLiteral:
+			return inString
+		return template.render(snapshot.getVariableValue, snapshot.getStateValue)
+
+	########################################
+	# Registers a substitution string to be kept up to date: callback(registrationId, text)
+	# is called with its text right away and again each time a change to one of the
+	# variables or device states it uses changes the text. A change only renders the
+	# strings that use the changed variable or state again, so any number of strings may
+	# be registered. Variable and device change notifications are subscribed to as needed
+	# (register from startup or later); a plugin that overrides variableUpdated or
+	# deviceUpdated must call the base class implementation. Returns the ID to pass to
+	# unregisterSubstitution.
+	def registerSubstitution(self, inString, callback):
+		template = SubstitutionTemplate(inString)
+		variableIds = set()
+		deviceStateKeys = set()
+		for (partType, value, stateKey) in template.parts:
+			try:
+				if partType == SubstitutionTemplate.kVariable:
+					variableIds.add(int(value))
+				elif partType == SubstitutionTemplate.kDeviceState:
+					deviceStateKeys.add((int(value), stateKey))
+			except ValueError:
+				pass	# a token without an ID is never updated
+
+		with self._substitutionRegistryLock:
+			registrationId = self._nextSubstitutionRegistrationId
+			self._nextSubstitutionRegistrationId += 1
+			# [template, callback, last text, variable IDs, (device ID, state key)s]
+			self._registeredSubstitutions[registrationId] = [template, callback, None, variableIds, deviceStateKeys]
+			for varId in variableIds:
+				self._substitutionVariableDependents.setdefault(varId, set()).add(registrationId)
+			for (devId, stateKey) in deviceStateKeys:
+				self._substitutionDeviceDependents.setdefault(devId, {}).setdefault(stateKey, set()).add(registrationId)
+
+			if len(variableIds) > 0 and not self._subscribedToVariableChanges:
+				indigo.variables.subscribeToChanges()
+				self._subscribedToVariableChanges = True
+			if len(deviceStateKeys) > 0 and not self._subscribedToDeviceChanges:
+				indigo.devices.subscribeToChanges()
+				self._subscribedToDeviceChanges = True
+
+		self._renderRegisteredSubstitutions([registrationId], SubstitutionSnapshot(self.logger))
+		return registrationId
+
+	def unregisterSubstitution(self, registrationId):
+		with self._substitutionRegistryLock:
+			registration = self._registeredSubstitutions.pop(registrationId, None)
+			if registration is None:
+				return
+			for varId in registration[3]:
+				dependents = self._substitutionVariableDependents[varId]
+				dependents.discard(registrationId)
+				if len(dependents) == 0:
+					del self._substitutionVariableDependents[varId]
+			for (devId, stateKey) in registration[4]:
+				stateDependents = self._substitutionDeviceDependents[devId]
+				stateDependents[stateKey].discard(registrationId)
+				if len(stateDependents[stateKey]) == 0:
+					del stateDependents[stateKey]
+					if len(stateDependents) == 0:
+						del self._substitutionDeviceDependents[devId]
+
+	def _updateSubstitutionsForVariable(self, origVar, newVar):
+		if origVar.value == newVar.value:
+			return
+		with self._substitutionRegistryLock:
+			dependents = self._substitutionVariableDependents.get(newVar.id, None)
+			if dependents is None:
+				return
+			registrationIds = sorted(dependents)
+		snapshot = SubstitutionSnapshot(self.logger)
+		snapshot.addVariable(newVar)
+		self._renderRegisteredSubstitutions(registrationIds, snapshot)
+
+	def _updateSubstitutionsForDevice(self, origDev, newDev):
+		with self._substitutionRegistryLock:
+			stateDependents = self._substitutionDeviceDependents.get(newDev.id, None)
+			if stateDependents is None:
+				return
+			registrationIds = set()
+			for (stateKey, dependents) in stateDependents.iteritems():
+				if origDev.states.get(stateKey, None) != newDev.states.get(stateKey, None):
+					registrationIds.update(dependents)
+		if len(registrationIds) == 0:
+			return
+		snapshot = SubstitutionSnapshot(self.logger)
+		snapshot.addDevice(newDev)
+		self._renderRegisteredSubstitutions(sorted(registrationIds), snapshot)
+
+	def _renderRegisteredSubstitutions(self, registrationIds, snapshot):
+		for registrationId in registrationIds:
+			with self._substitutionRegistryLock:
+				registration = self._registeredSubstitutions.get(registrationId, None)
+			if registration is None:
+				continue	# unregistered in the meantime
+			self.registeredSubstitutionRenderCount += 1
+			newText = registration[0].render(snapshot.getVariableValue, snapshot.getStateValue)
+			if newText == registration[2]:
+				continue
+			registration[2] = newText
+			try:
+				registration[1](registrationId, newText)
+			except Exception, e:
+				self.logger.error(u"exception in substitution callback for registration %d: %s" % (registrationId, unicode(e)))
+
+	def _getSubstitutionTemplate(self, inString):
+		with self._substitutionCacheLock:
+			template = self._substitutionCache.pop(inString, None)
+			if template is not None:
+				self.substitutionCacheHitCount += 1
+				self._substitutionCache[inString] = template
+				return template
+			self.substitutionCacheMissCount += 1
+
+		template = SubstitutionTemplate(inString)
+		with self._substitutionCacheLock:
+			self._substitutionCache[inString] = template
+			while len(self._substitutionCache) > self.substitutionCacheSize:
+				self._substitutionCache.popitem(last=False)
+		return template
 
 	########################################
 	# Utility method to be called from plugin's validatePrefsConfigUi, validateDeviceConfigUi, etc.
@@ -0,0 +1,94 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Plugin Developer Documenter by RogueProeliator <rp@rogueproeliator.com>
+# 	Supporting module that keeps the most recent lifecycle calls in memory: a "flight
+#	recorder" that can be dumped after the fact instead of writing a debug line (and
+#	paying for its formatting) on every callback. The profiler's wrappers (see
+#	callbackProfiler.py) add a record for each call while a recorder is attached.
+#
+#	The records are packed with struct into one preallocated buffer used as a ring; once
+#	it is full each new record replaces the oldest. A record holds:
+#		timestamp		monotonic clock time the call started (converted when dumped)
+#		callbackId		position of the callback in the profiler's histograms
+#		threadId		thread.get_ident() of the calling thread
+#		duration		seconds the call took
+#		argDigest		the ID of the first argument that is an Indigo object (device,
+#						trigger, variable, etc.) or an integer ID, 0 when there is none
+#
+#	Recording takes no lock: each call takes the next slot from an itertools.count, which
+#	the GIL makes safe. A dump taken while other threads are recording may show the record
+#	that a slot held before the one being written.
+#
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Python imports
+#/////////////////////////////////////////////////////////////////////////////////////////
+import itertools
+import struct
+import thread
+import time
+
+from callbackProfiler import monotonicTime
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Constants
+#/////////////////////////////////////////////////////////////////////////////////////////
+kCallRecordStruct = struct.Struct('=dHQfI')	# timestamp, callbackId, threadId, duration, argDigest (26 bytes)
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# CallRecorder
+#	Fixed capacity ring buffer of lifecycle call records
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+class CallRecorder(object):
+
+	def __init__(self, capacity=4096):
+		self.capacity = capacity
+		self._buffer = bytearray(capacity * kCallRecordStruct.size)
+		self._slotCounter = itertools.count()
+		self.recordedCount = 0
+
+		# monotonic clock times are turned into wall clock times only when dumped
+		self._wallClockOffset = time.time() - monotonicTime()
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Adds the record of one call; startTime must come from callbackProfiler.monotonicTime
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def record(self, startTime, callbackId, duration, args):
+		slot = next(self._slotCounter)
+		kCallRecordStruct.pack_into(self._buffer, (slot % self.capacity) * kCallRecordStruct.size, startTime, callbackId, thread.get_ident(), duration, self._getArgumentDigest(args))
+		if slot >= self.recordedCount:
+			self.recordedCount = slot + 1
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Returns the last count records (all of those held when count is None), oldest first,
+	# as (timestamp, callbackId, threadId, duration, argDigest) with the timestamp in
+	# seconds since the epoch, as time.time() returns it
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def getRecords(self, count=None):
+		recordedCount = self.recordedCount
+		heldCount = min(recordedCount, self.capacity)
+		if count is None or count > heldCount:
+			count = heldCount
+		records = []
+		for slot in xrange(recordedCount - count, recordedCount):
+			(timestamp, callbackId, threadId, duration, argDigest) = kCallRecordStruct.unpack_from(self._buffer, (slot % self.capacity) * kCallRecordStruct.size)
+			records.append((timestamp + self._wallClockOffset, callbackId, threadId, duration, argDigest))
+		return records
+
+	def _getArgumentDigest(self, args):
+		for arg in args:
+			if isinstance(arg, (int, long)) and not isinstance(arg, bool):
+				return arg & 0xFFFFFFFF
+			argId = getattr(arg, 'id', None)
+			if isinstance(argId, (int, long)):
+				return argId & 0xFFFFFFFF
+		return 0
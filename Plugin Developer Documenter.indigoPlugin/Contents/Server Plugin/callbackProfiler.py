@@ -0,0 +1,193 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Plugin Developer Documenter by RogueProeliator <rp@rogueproeliator.com>
+# 	Supporting module that times the plugin's lifecycle callbacks. Every PluginBase
+#	callback that the plugin class overrides (getDeviceConfigUiXml, validateActionConfigUi,
+#	deviceUpdated, variableUpdated, etc.) is replaced on the plugin instance by a wrapper
+#	that measures how long the call took, so that it is easy to see which callbacks keep
+#	the host (and so the Indigo UI and server) waiting.
+#
+#	Each callback has a histogram of fixed size: bucket i counts the calls that took less
+#	than 2^i microseconds (and at least half of that), so the median and 99th percentile
+#	are known to within a factor of two without keeping every duration. Durations come
+#	from a monotonic clock where the platform has one, so that a change of the system
+#	clock does not distort them.
+#
+#	A CallRecorder (see callRecorder.py) may be attached as the profiler's recorder to keep
+#	a record of each of the most recent calls as well.
+#
+#	The wrappers stay installed; while the profiler is not enabled and has no recorder
+#	they only pass the call through. The counters are not locked: the host makes nearly
+#	all of the calls from one thread and a lost update now and then does not matter to
+#	the report.
+#
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Python imports
+#/////////////////////////////////////////////////////////////////////////////////////////
+import array
+import functools
+import sys
+import time
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Constants
+#/////////////////////////////////////////////////////////////////////////////////////////
+kHistogramBucketCount = 32		# the last bucket also holds anything over ~36 minutes
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Monotonic clock
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Python 2 has no time.monotonic; use clock_gettime from the C library when it is there
+# (macOS 10.12 and later, Linux) and time.time otherwise
+def _getMonotonicClock():
+	if hasattr(time, 'monotonic'):
+		return time.monotonic
+	try:
+		import ctypes
+		import ctypes.util
+
+		class timespec(ctypes.Structure):
+			_fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+		clock_gettime = ctypes.CDLL(ctypes.util.find_library('c')).clock_gettime
+		clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+		clockId = 6 if sys.platform == 'darwin' else 1		# CLOCK_MONOTONIC
+		if clock_gettime(clockId, ctypes.byref(timespec())) != 0:
+			return time.time
+
+		def monotonicTime():
+			now = timespec()
+			clock_gettime(clockId, ctypes.byref(now))
+			return now.tv_sec + now.tv_nsec * 1e-9
+		return monotonicTime
+	except Exception:
+		return time.time
+
+monotonicTime = _getMonotonicClock()
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# CallbackTimingHistogram
+#	Call count, total/min/max time and a log2 histogram of the durations of one callback
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+class CallbackTimingHistogram(object):
+
+	def __init__(self, callbackId, name):
+		self.callbackId = callbackId
+		self.name = name
+		self.reset()
+
+	def __repr__(self):
+		return u'CallbackTimingHistogram({0}: {1} call(s))'.format(self.name, self.count)
+
+	def reset(self):
+		self.count = 0
+		self.totalTime = 0.0
+		self.minTime = 0.0
+		self.maxTime = 0.0
+		self.buckets = array.array('L', [0] * kHistogramBucketCount)
+
+	def record(self, duration):
+		if self.count == 0 or duration < self.minTime:
+			self.minTime = duration
+		if duration > self.maxTime:
+			self.maxTime = duration
+		self.count += 1
+		self.totalTime += duration
+		bucket = int(duration * 1000000.0).bit_length()
+		if bucket >= kHistogramBucketCount:
+			bucket = kHistogramBucketCount - 1
+		self.buckets[bucket] += 1
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Returns the duration (in seconds) that the given fraction of the calls did not
+	# exceed; this is the upper edge of the bucket it falls in, kept within min and max
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def getPercentile(self, fraction):
+		if self.count == 0:
+			return 0.0
+		callsNeeded = fraction * self.count
+		callsSeen = 0
+		for (bucket, bucketCount) in enumerate(self.buckets):
+			callsSeen += bucketCount
+			if callsSeen >= callsNeeded:
+				return max(self.minTime, min(self.maxTime, (1 << bucket) / 1000000.0))
+		return self.maxTime
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# CallbackProfiler
+#	Wraps the lifecycle callbacks of a plugin instance and keeps their timings
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+class CallbackProfiler(object):
+
+	# runs for as long as the plugin does, so its timing would say nothing
+	kExcludedCallbacks = frozenset([u'runConcurrentThread'])
+
+	# called by the host when the plugin defines them, but not defined by PluginBase
+	kOptionalCallbacks = frozenset([u'startup', u'shutdown'])
+
+	def __init__(self):
+		self.enabled = False
+		self.recorder = None
+		self.histograms = []
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Replaces each callback of baseClass that the plugin's class overrides (along with
+	# startup and shutdown) with a timed version; the position of a callback in
+	# self.histograms is its callback ID
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def install(self, plugin, baseClass):
+		for name in sorted(vars(type(plugin))):
+			if name.startswith(u'_') or name in self.kExcludedCallbacks:
+				continue
+			if name not in self.kOptionalCallbacks and not callable(getattr(baseClass, name, None)):
+				continue
+			histogram = CallbackTimingHistogram(len(self.histograms), name)
+			self.histograms.append(histogram)
+			setattr(plugin, name, self._profileCallback(getattr(plugin, name), histogram))
+
+	def reset(self):
+		for histogram in self.histograms:
+			histogram.reset()
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Returns (name, count, total, min, p50, p99, max) for each callback that has been
+	# called, times in seconds, the callback with the most total time first
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def getReport(self):
+		report = []
+		for histogram in self.histograms:
+			if histogram.count > 0:
+				report.append((histogram.name, histogram.count, histogram.totalTime, histogram.minTime, histogram.getPercentile(0.5), histogram.getPercentile(0.99), histogram.maxTime))
+		report.sort(key=lambda entry: entry[2], reverse=True)
+		return report
+
+	def _profileCallback(self, callback, histogram):
+		@functools.wraps(callback)
+		def profiledCallback(*args, **kwargs):
+			recorder = self.recorder
+			if not self.enabled and recorder is None:
+				return callback(*args, **kwargs)
+			startTime = monotonicTime()
+			try:
+				return callback(*args, **kwargs)
+			finally:
+				duration = monotonicTime() - startTime
+				if self.enabled:
+					histogram.record(duration)
+				if recorder is not None:
+					recorder.record(startTime, histogram.callbackId, duration, args)
+		return profiledCallback
@@ -0,0 +1,195 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Plugin Developer Documenter by RogueProeliator <rp@rogueproeliator.com>
+# 	Supporting module that filters the device and variable change notifications sent to
+#	the plugin. Once a plugin calls indigo.devices.subscribeToChanges() (or the
+#	variables equivalent) every device in the house is sent to deviceUpdated, each time
+#	with two complete copies of the device; most plugins only care about a few of them.
+#	The filter is installed in front of the plugin's callbacks and drops notifications
+#	that do not pass its stages before any of the plugin's code (logging included) runs.
+#
+#	Filter stages, each applied only when it has been given values; a notification must
+#	pass every stage to be delivered. Devices and variables have stages of their own
+#	(device and variable folders are not the same folders), so narrowing down the
+#	devices does not drop any variable notifications and vice versa:
+#		pluginIds			the device belongs to one of these plugins ("" for built-in devices)
+#		deviceTypeIds		the device is of one of these device types
+#		deviceFolderIds		the device is in one of these device folders
+#		deviceIds			the device has one of these IDs
+#		stateKeys			(deviceUpdated only) one of these states changed
+#		variableFolderIds	the variable is in one of these variable folders
+#		variableIds			the variable has one of these IDs
+#
+#	The plugin's own devices are always delivered so that the base class can start and
+#	stop their communication. Note that a dropped notification does not reach the base
+#	class either, so substitutions registered with registerSubstitution are not updated
+#	for the devices and variables it filters out.
+#
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Python imports
+#/////////////////////////////////////////////////////////////////////////////////////////
+import functools
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# ChangeFilterStage
+#	A single stage of the filter: a set of accepted values and the number of
+#	notifications it delivered to the next stage or dropped
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+class ChangeFilterStage(object):
+
+	def __init__(self, name, values):
+		self.name = name
+		self.values = frozenset(values)
+		self.deliveredCount = 0
+		self.droppedCount = 0
+
+	def __repr__(self):
+		return u'ChangeFilterStage({0}: {1} value(s))'.format(self.name, len(self.values))
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# ChangeNotificationFilter
+#	Decides which device and variable change notifications reach the plugin
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+class ChangeNotificationFilter(object):
+
+	# the order in which the stages are applied, cheapest and most selective first
+	kDeviceStageNames = (u'pluginIds', u'deviceTypeIds', u'deviceFolderIds', u'deviceIds', u'stateKeys')
+	kVariableStageNames = (u'variableFolderIds', u'variableIds')
+
+	def __init__(self, pluginId):
+		self.pluginId = pluginId
+
+		self._stages = dict()
+		self.ownDeviceCount = 0
+		self.deviceDeliveredCount = 0
+		self.deviceDroppedCount = 0
+		self.variableDeliveredCount = 0
+		self.variableDroppedCount = 0
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Sets the values of the stages (see the module notes); a stage that is not given, or
+	# given an empty list, lets everything through. The stages are replaced as a whole
+	# and their counters start over
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def configure(self, pluginIds=None, deviceTypeIds=None, deviceFolderIds=None, deviceIds=None, stateKeys=None, variableFolderIds=None, variableIds=None):
+		stageValues = {u'pluginIds' : pluginIds, u'deviceTypeIds' : deviceTypeIds, u'deviceFolderIds' : deviceFolderIds, u'deviceIds' : deviceIds, u'stateKeys' : stateKeys,
+			u'variableFolderIds' : variableFolderIds, u'variableIds' : variableIds}
+		stages = dict()
+		for (name, values) in stageValues.iteritems():
+			if values:
+				stages[name] = ChangeFilterStage(name, values)
+		self._stages = stages
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Replaces the device and variable callbacks of the plugin instance with versions
+	# that only call the plugin's for notifications that pass the filter
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def install(self, plugin):
+		plugin.deviceCreated = self._filterCallback(plugin.deviceCreated, self.acceptDevice)
+		plugin.deviceDeleted = self._filterCallback(plugin.deviceDeleted, self.acceptDevice)
+		plugin.deviceUpdated = self._filterCallback(plugin.deviceUpdated, self.acceptDeviceUpdate)
+		plugin.variableCreated = self._filterCallback(plugin.variableCreated, self.acceptVariable)
+		plugin.variableDeleted = self._filterCallback(plugin.variableDeleted, self.acceptVariable)
+		plugin.variableUpdated = self._filterCallback(plugin.variableUpdated, self.acceptVariableUpdate)
+
+	def acceptDevice(self, dev):
+		if dev.pluginId == self.pluginId:
+			self.ownDeviceCount += 1
+			return True
+		return self._applyStages(self._stages, dev, None, None)
+
+	def acceptDeviceUpdate(self, origDev, newDev):
+		if newDev.pluginId == self.pluginId or origDev.pluginId == self.pluginId:
+			self.ownDeviceCount += 1
+			return True
+		return self._applyStages(self._stages, newDev, origDev.states, newDev.states)
+
+	def acceptVariable(self, var):
+		return self._applyVariableStages(self._stages, var)
+
+	def acceptVariableUpdate(self, origVar, newVar):
+		return self._applyVariableStages(self._stages, newVar)
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Returns (name, values, delivered, dropped) for each configured stage, device stages
+	# first, in the order the stages are applied
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def getStageStatistics(self):
+		stages = self._stages
+		statistics = []
+		for name in self.kDeviceStageNames + self.kVariableStageNames:
+			stage = stages.get(name, None)
+			if stage is not None:
+				statistics.append((name, len(stage.values), stage.deliveredCount, stage.droppedCount))
+		return statistics
+
+	def _filterCallback(self, callback, acceptFunc):
+		@functools.wraps(callback)
+		def filteredCallback(*args):
+			if acceptFunc(*args):
+				callback(*args)
+		return filteredCallback
+
+	# the stages are passed in so that a configure() running on another thread cannot
+	# swap them in the middle of a notification
+	def _applyStages(self, stages, dev, origStates, newStates):
+		if not self._passDeviceStages(stages, dev, origStates, newStates):
+			self.deviceDroppedCount += 1
+			return False
+		self.deviceDeliveredCount += 1
+		return True
+
+	def _passDeviceStages(self, stages, dev, origStates, newStates):
+		stage = stages.get(u'pluginIds', None)
+		if stage is not None and not self._passStage(stage, dev.pluginId in stage.values):
+			return False
+		stage = stages.get(u'deviceTypeIds', None)
+		if stage is not None and not self._passStage(stage, dev.deviceTypeId in stage.values):
+			return False
+		stage = stages.get(u'deviceFolderIds', None)
+		if stage is not None and not self._passStage(stage, dev.folderId in stage.values):
+			return False
+		stage = stages.get(u'deviceIds', None)
+		if stage is not None and not self._passStage(stage, dev.id in stage.values):
+			return False
+		stage = stages.get(u'stateKeys', None)
+		if stage is not None and origStates is not None:
+			stateChanged = False
+			for stateKey in stage.values:
+				if origStates.get(stateKey, None) != newStates.get(stateKey, None):
+					stateChanged = True
+					break
+			if not self._passStage(stage, stateChanged):
+				return False
+		return True
+
+	def _applyVariableStages(self, stages, var):
+		stage = stages.get(u'variableFolderIds', None)
+		if stage is not None and not self._passStage(stage, var.folderId in stage.values):
+			self.variableDroppedCount += 1
+			return False
+		stage = stages.get(u'variableIds', None)
+		if stage is not None and not self._passStage(stage, var.id in stage.values):
+			self.variableDroppedCount += 1
+			return False
+		self.variableDeliveredCount += 1
+		return True
+
+	def _passStage(self, stage, passed):
+		if passed:
+			stage.deliveredCount += 1
+		else:
+			stage.droppedCount += 1
+		return passed
@@ -0,0 +1,276 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Plugin Developer Documenter by RogueProeliator <rp@rogueproeliator.com>
+# 	Supporting module for the plugin's command queue; this demonstrates including your
+#	own modules within the plugin bundle. Any .py file placed in the Server Plugin
+#	folder may be imported by plugin.py.
+#
+#	The standard Queue.Queue only allows a thread to block on the queue itself, but the
+#	background thread of a plugin must also wake up as soon as Indigo asks it to stop.
+#	PluginBase.sleep() handles the stop request by select()-ing on a pipe which is
+#	written when the plugin is stopped; the queue below adds a second pipe that is
+#	written whenever a command arrives so that the background thread may wait on both
+#	at the same time.
+#
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Python imports
+#/////////////////////////////////////////////////////////////////////////////////////////
+import errno
+import fcntl
+import os
+import Queue
+import select
+import threading
+import time
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# PluginCommandQueue
+#	Queue.Queue that can wake a select() call whenever a command is added; use it in
+#	place of a standard Queue and call waitForCommands from the background thread
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+class PluginCommandQueue(Queue.Queue):
+
+	def __init__(self, maxsize=0):
+		Queue.Queue.__init__(self, maxsize)
+		self._wakePipeIn, self._wakePipeOut = os.pipe()
+		fcntl.fcntl(self._wakePipeIn, fcntl.F_SETFL, fcntl.fcntl(self._wakePipeIn, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Called by Queue.put while holding the queue's lock; the wake pipe only needs to be
+	# written when the queue goes from empty to non-empty as the background thread
+	# empties the queue each time that it wakes
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def _put(self, item):
+		Queue.Queue._put(self, item)
+		if len(self.queue) == 1:
+			os.write(self._wakePipeOut, "*")
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Blocks until a command is waiting, the interruptFd file descriptor becomes readable
+	# (pass the plugin's stop pipe here) or the timeout (seconds; None = forever) expires
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def waitForCommands(self, interruptFd, timeout=None):
+		if not self.empty():
+			return
+		while True:
+			try:
+				readable = select.select([self._wakePipeIn, interruptFd], [], [], timeout)[0]
+				break
+			except select.error, doh:
+				# see PluginBase.sleep -- signals from IndigoServer may interrupt select()
+				if doh[0] != errno.EINTR:
+					raise
+		if self._wakePipeIn in readable:
+			try:
+				os.read(self._wakePipeIn, 4096)
+			except OSError, doh:
+				if doh.errno != errno.EAGAIN:
+					raise
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Removes and returns every command currently waiting in the queue (oldest first)
+	# without blocking; the caller must call task_done() once for each command returned
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def getAllWaiting(self):
+		commands = []
+		while True:
+			try:
+				commands.append(self.get_nowait())
+			except Queue.Empty:
+				return commands
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Command Coalescing
+#	When a control page or script sends many commands for the same device in a short
+#	time there is no need to send each of them to the server; the commands that are
+#	waiting in the queue are folded together so that each device receives a single
+#	state update per pass through the queue
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# counter commands and the amount by which each changes the counter state
+kCounterCommandDeltas = {
+	u'incrementDeviceState': 1,
+	u'decrementDeviceState': -1
+}
+
+# command which sets the display state; only the latest value queued for a device is used
+kSetDisplayStateCommand = u'setCustomDeviceState'
+
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+# All of the counter and display state commands queued for a single device, merged into
+# the net change to apply to the device
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+class CoalescedDeviceCommand(object):
+	__slots__ = ('deviceId', 'queuedTime', 'commandCount', 'counterDelta', 'displayState')
+
+	def __init__(self, deviceId, queuedTime):
+		self.deviceId = deviceId
+		self.queuedTime = queuedTime
+		self.commandCount = 0
+		self.counterDelta = 0
+		self.displayState = None	# (value, uiValue) of the last display state command
+
+	def __repr__(self):
+		return u'CoalescedDeviceCommand(deviceId={0}, commands={1}, counterDelta={2}, displayState={3})'.format(self.deviceId, self.commandCount, self.counterDelta, self.displayState)
+
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+# Folds the (commandName, deviceId, queuedTime, data) tuples in commands into one
+# CoalescedDeviceCommand per device, placed where the first command for that device
+# was found; other commands are returned unchanged and in order. Returns a tuple of the
+# new command list and the number of queued commands that were merged away
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+def coalesceDeviceCommands(commands):
+	coalescedCommands = []
+	deviceCommands = dict()
+	for command in commands:
+		commandName = command[0]
+		if commandName not in kCounterCommandDeltas and commandName != kSetDisplayStateCommand:
+			coalescedCommands.append(command)
+			continue
+
+		deviceCommand = deviceCommands.get(command[1])
+		if deviceCommand is None:
+			deviceCommand = CoalescedDeviceCommand(command[1], command[2])
+			deviceCommands[command[1]] = deviceCommand
+			coalescedCommands.append(deviceCommand)
+		deviceCommand.commandCount += 1
+		if commandName == kSetDisplayStateCommand:
+			deviceCommand.displayState = command[3]
+		else:
+			deviceCommand.counterDelta += kCounterCommandDeltas[commandName]
+
+	return (coalescedCommands, len(commands) - len(coalescedCommands))
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# ShardedCommandPool
+#	Optional pool of worker threads used to execute commands for different devices in
+#	parallel; every command for a given device is sent to the same worker (shard) so
+#	that the commands for a device are still executed one at a time and in the order in
+#	which they were queued, while a slow device only holds up the devices sharing its
+#	worker. A rate limit applies to the pool as a whole, not to each worker
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+class ShardedCommandPool(object):
+
+	# placed on a shard's queue to tell its worker to exit once earlier commands are done
+	_kStopWorker = object()
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# executeFunc is called on a worker thread with each command; errorFunc is called (on
+	# the same thread, from within the except block) if executeFunc raises an exception.
+	# minCommandIntervalFunc, if given, returns the minimum number of seconds between any
+	# two commands executed by the pool (0 for no limit); it is called for each command so
+	# that a change to the limit takes effect right away
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def __init__(self, workerCount, executeFunc, errorFunc, minCommandIntervalFunc=None):
+		self.executeFunc = executeFunc
+		self.errorFunc = errorFunc
+		self.minCommandIntervalFunc = minCommandIntervalFunc
+		self.shards = [CommandShard(self, index) for index in range(workerCount)]
+		self._stopping = threading.Event()
+
+		# the time at which the next command may be executed by any of the workers
+		self._rateLimitLock = threading.Lock()
+		self._nextCommandTime = 0.0
+
+	def start(self):
+		for shard in self.shards:
+			shard.start()
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Queues the command on the worker responsible for the device
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def dispatch(self, deviceId, command):
+		self.shards[hash(deviceId) % len(self.shards)].put(command)
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Blocks until every command dispatched so far has been executed
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def join(self):
+		for shard in self.shards:
+			shard.queue.join()
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Lets each worker finish the commands already dispatched to it (without any further
+	# spacing between commands) and then exit; waits up to drainTimeout seconds in total
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def stop(self, drainTimeout=5.0):
+		self._stopping.set()
+		for shard in self.shards:
+			shard.queue.put(self._kStopWorker)
+		stopTime = time.time() + drainTimeout
+		for shard in self.shards:
+			shard.thread.join(max(0.0, stopTime - time.time()))
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Returns a list of (shard index, commands waiting, most commands ever waiting,
+	# commands executed) tuples
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def getShardStatistics(self):
+		return [(shard.index, shard.queue.qsize(), shard.maxQueueDepth, shard.executedCount) for shard in self.shards]
+
+	# called by a worker before each command; reserves the next free execution time under
+	# the lock and sleeps (outside of it) until then, or until the pool is stopped
+	def _waitForCommandRateLimit(self):
+		if self.minCommandIntervalFunc is None or self._stopping.isSet():
+			return
+		minCommandInterval = self.minCommandIntervalFunc()
+		if minCommandInterval <= 0.0:
+			return
+		with self._rateLimitLock:
+			now = time.time()
+			commandTime = max(now, self._nextCommandTime)
+			self._nextCommandTime = commandTime + minCommandInterval
+		if commandTime > now:
+			self._stopping.wait(commandTime - now)
+
+
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+# A single worker thread of the ShardedCommandPool and its queue of commands
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+class CommandShard(object):
+
+	def __init__(self, pool, index):
+		self.pool = pool
+		self.index = index
+		self.queue = Queue.Queue()
+		self.maxQueueDepth = 0
+		self.executedCount = 0
+		self.thread = threading.Thread(target=self._workerThreadRun)
+		self.thread.setName("commandShard{0}".format(index))
+		self.thread.setDaemon(True)
+
+	def start(self):
+		self.thread.start()
+
+	def put(self, command):
+		self.queue.put(command)
+		self.maxQueueDepth = max(self.maxQueueDepth, self.queue.qsize())
+
+	def _workerThreadRun(self):
+		while True:
+			command = self.queue.get()
+			try:
+				if command is ShardedCommandPool._kStopWorker:
+					return
+				self.pool._waitForCommandRateLimit()
+				try:
+					self.pool.executeFunc(command)
+				except:
+					self.pool.errorFunc()
+				self.executedCount += 1
+			finally:
+				self.queue.task_done()
@@ -0,0 +1,166 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Plugin Developer Documenter by RogueProeliator <rp@rogueproeliator.com>
+# 	Supporting module that keeps a local copy of the plugin's own devices. Each access
+#	of indigo.devices[id] is a round trip to the Indigo Server which returns a complete
+#	copy of the device; a plugin that reads its devices' states for every command may
+#	instead keep the copies delivered to its device callbacks (deviceCreated,
+#	deviceUpdated and deviceDeleted) and read those.
+#
+#	Staleness rules used by the cache:
+#		1. A device is replaced whenever Indigo sends an updated copy to deviceCreated or
+#		   deviceUpdated and removed when it is sent to deviceDeleted
+#		2. States written by the plugin itself are held in an overlay until Indigo echoes
+#		   back a copy of the device showing the written value, since the copy in the
+#		   cache does not change when updateStatesOnServer is called
+#		3. A device older than maxAge seconds is fetched again from the server on its next
+#		   use, as a safety net should a notification be missed; written states that have
+#		   not been confirmed within maxAge are dropped at the same time
+#
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Python imports
+#/////////////////////////////////////////////////////////////////////////////////////////
+import threading
+import time
+
+import indigo
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# PluginDeviceCache
+#	Thread-safe cache of the devices owned by a plugin, keyed by device ID
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+class PluginDeviceCache(object):
+
+	def __init__(self, pluginId, maxAge=300.0):
+		self.pluginId = pluginId
+		self.maxAge = maxAge
+
+		self._lock = threading.Lock()
+		self._devices = dict()
+		self._loadedTimes = dict()
+		self._writtenStates = dict()
+		self._writtenTimes = dict()
+
+		self.hitCount = 0
+		self.missCount = 0
+		self.expiredCount = 0
+		self.refreshCount = 0
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Fills the cache with all of the plugin's devices; call this from startup, devices
+	# are not yet available when the plugin's constructor runs
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def load(self):
+		loadedTime = time.time()
+		with self._lock:
+			self._devices.clear()
+			self._loadedTimes.clear()
+			self._writtenStates.clear()
+			self._writtenTimes.clear()
+			for dev in indigo.devices.iter(self.pluginId):
+				self._devices[dev.id] = dev
+				self._loadedTimes[dev.id] = loadedTime
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Returns the device with the given ID, fetching it from the server only if it is not
+	# cached or has expired. The returned object is shared; do not modify it and read the
+	# states through getState so that the plugin's own pending writes are seen
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def getDevice(self, devId):
+		with self._lock:
+			dev = self._devices.get(devId, None)
+			if dev is not None:
+				if time.time() - self._loadedTimes[devId] < self.maxAge:
+					self.hitCount += 1
+					return dev
+				self.expiredCount += 1
+			else:
+				self.missCount += 1
+
+		# fetch outside of the lock; indigo.devices raises an exception if the device
+		# no longer exists, just as it would for the caller
+		dev = indigo.devices[devId]
+		with self._lock:
+			self._storeDevice(dev)
+			self._confirmWrittenStates(dev, True)
+		return dev
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Returns the value of a device state, including any value written by the plugin that
+	# Indigo has not yet echoed back
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def getState(self, devId, stateKey, default=None):
+		dev = self.getDevice(devId)
+		with self._lock:
+			writtenStates = self._writtenStates.get(devId, None)
+			if writtenStates is not None and stateKey in writtenStates:
+				return writtenStates[stateKey]
+		return dev.states.get(stateKey, default)
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Records states written by the plugin; updatedStates is the list of dictionaries
+	# passed to updateStatesOnServer
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def noteStatesWritten(self, devId, updatedStates):
+		with self._lock:
+			writtenStates = self._writtenStates.setdefault(devId, dict())
+			for updatedState in updatedStates:
+				writtenStates[updatedState['key']] = updatedState['value']
+			self._writtenTimes[devId] = time.time()
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Called from deviceCreated and deviceUpdated with the new copy of the device; devices
+	# belonging to other plugins (sent when subscribed to all device changes) are ignored
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def deviceChanged(self, dev):
+		if dev.pluginId != self.pluginId:
+			return
+		with self._lock:
+			self.refreshCount += 1
+			self._storeDevice(dev)
+			self._confirmWrittenStates(dev, False)
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Called from deviceDeleted; also used to force a device to be fetched again
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def removeDevice(self, devId):
+		with self._lock:
+			self._devices.pop(devId, None)
+			self._loadedTimes.pop(devId, None)
+			self._writtenStates.pop(devId, None)
+			self._writtenTimes.pop(devId, None)
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Returns the number of devices cached and the number with unconfirmed writes
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def getSizes(self):
+		with self._lock:
+			return (len(self._devices), len(self._writtenStates))
+
+	def _storeDevice(self, dev):
+		self._devices[dev.id] = dev
+		self._loadedTimes[dev.id] = time.time()
+
+	# drops the written values that a new copy of the device now reports; the caller
+	# must hold the lock
+	def _confirmWrittenStates(self, dev, dropExpired):
+		writtenStates = self._writtenStates.get(dev.id, None)
+		if writtenStates is None:
+			return
+		if dropExpired and time.time() - self._writtenTimes[dev.id] >= self.maxAge:
+			writtenStates.clear()
+		for stateKey in writtenStates.keys():
+			if dev.states.get(stateKey, None) == writtenStates[stateKey]:
+				del writtenStates[stateKey]
+		if len(writtenStates) == 0:
+			del self._writtenStates[dev.id]
+			del self._writtenTimes[dev.id]
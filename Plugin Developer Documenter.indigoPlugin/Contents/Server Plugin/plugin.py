@@ -30,13 +30,20 @@ import indigo
 
 # any standard python includes from 2.7 may be pulled in; in addition you may include 
 # other modules in your plugin's bundle and import here.
-import inspect
 import logging
 import os
-import Queue
 import sys
+import threading
 import time
 
+from callbackProfiler import CallbackProfiler
+from callRecorder import CallRecorder
+from changeFilter import ChangeNotificationFilter
+from commandQueue import PluginCommandQueue, CoalescedDeviceCommand, ShardedCommandPool, coalesceDeviceCommands
+from deviceCache import PluginDeviceCache
+from stateWriter import DeviceStateWriter
+from triggerRegistry import TriggerRegistry
+
 
 #/////////////////////////////////////////////////////////////////////////////////////////
 #/////////////////////////////////////////////////////////////////////////////////////////
@@ -66,17 +73,80 @@ class Plugin(indigo.PluginBase):
 		self.logMethodParams = pluginPrefs.get("logMethodParams", False)
 		
 		# if the plugin defines Events to send, create a data store for them now so
-		# that we can later trigger when necessary; this is not very common
-		self.indigoEvents = dict()
+		# that we can later trigger when necessary; this is not very common. The registry
+		# (see triggerRegistry.py) may index the triggers of an event type by one of their
+		# properties so that firing the event only looks at the matching triggers, e.g.:
+		#	self.triggerRegistry.setIndex(u'deviceEvent', u'deviceId', int)
+		# and then self.triggerRegistry.fire(u'deviceEvent', dev.id). The triggers are
+		# executed by its own thread, which is started in startup. Any debounce/rate limits
+		# declared with <FiringLimits> in Events.xml are handed to the registry here; only
+		# the PluginBase in "Documentation and Resources" reads them (the host's own base
+		# class has no getEventFiringLimits), otherwise call setFiringLimits directly
+		self.triggerRegistry = TriggerRegistry(self.exceptionLog)
+		if hasattr(self, 'getEventFiringLimits'):
+			for eventTypeId in self.eventsTypeDict:
+				firingLimits = self.getEventFiringLimits(eventTypeId)
+				if firingLimits is not None:
+					self.triggerRegistry.setFiringLimits(eventTypeId, firingLimits[u'debounce'], firingLimits[u'edge'], firingLimits[u'maxRate'])
 		
 		# this plugin uses a Queue to communicate with the background thread, passing actions
 		# to it via this Queue. If your needs require, switch this to a PriorityQueue and
 		# retrieval of items will be the lowest value specified via a sort of the entries:
 		#	sorted(list(entries))[0]. The standard use is for each entry to be of the form:
-		#	(priority_number, data).  Here we are just using a standard queue so only the
-		# data element will be used. you must have this line at the top of the file:
+		#	(priority_number, data).  Here we are using a Queue subclass (see commandQueue.py)
+		# that allows the background thread to sleep until a command arrives rather than
+		# polling the queue; a standard Queue.Queue() requires this line at the top of the file:
 		# import Queue
-		self.commandQueue = Queue.Queue()
+		self.commandQueue = PluginCommandQueue()
+
+		# commands may optionally be rate limited (commands per second, 0 = no limit) for
+		# devices that cannot accept commands as fast as the user or scripts can send them
+		self.commandRateLimit = float(pluginPrefs.get("commandRateLimit", "0") or 0)
+		self.lastCommandExecutionTime = 0.0
+
+		# commands may optionally be executed by a pool of worker threads, one "shard" per
+		# worker; all of the commands for a device go to the same worker so that they run in
+		# order, but a slow device does not hold up the devices on the other workers. The
+		# pool is created by runConcurrentThread when more than one worker is configured
+		self.commandWorkerCount = int(pluginPrefs.get("commandWorkerCount", "1"))
+		self.commandPool = None
+
+		# enqueue-to-execution latency of the commands, see logPerformanceStatistics
+		self.commandLatencyCount = 0
+		self.commandLatencyTotal = 0.0
+		self.commandLatencyMax = 0.0
+		self.commandLatencyLock = threading.Lock()
+		self.commandsMerged = 0
+
+		# local copies of this plugin's devices, kept current by the device callbacks, so
+		# that executing a command does not need to fetch the device from the server; it
+		# is filled in startup since the devices are not ready yet (see deviceCache.py)
+		self.deviceCache = PluginDeviceCache(pluginId)
+
+		# device state changes are posted to a writer which sends all of the changes for a
+		# device in one updateStatesOnServer call every stateUpdateInterval milliseconds
+		# (see stateWriter.py); its thread is started in startup
+		self.stateWriter = DeviceStateWriter(self.deviceCache, self.exceptionLog, float(pluginPrefs.get("stateUpdateInterval", "100") or 0) / 1000.0)
+
+		# the lifecycle callbacks below may be timed (see callbackProfiler.py) to find the ones
+		# that keep the host waiting; enabled in the plugin preferences and reported from the
+		# plugin menu. It is installed before the change filter so that the notifications the
+		# filter drops are not counted as calls
+		self.callbackProfiler = CallbackProfiler()
+		self.callbackProfiler.enabled = pluginPrefs.get("profileCallbacks", False)
+		self.callbackProfiler.install(self, indigo.PluginBase)
+
+		# the most recent lifecycle calls may also be kept in a fixed size ring buffer (see
+		# callRecorder.py) to be dumped from the plugin menu or the interactive shell, a
+		# much cheaper record than a debug log line per call
+		self.configureCallRecorder(pluginPrefs)
+
+		# when subscribed to all device (or variable) changes, the notifications pass through
+		# a filter that drops those the plugin has no interest in before any of the callbacks
+		# below run (see changeFilter.py); the filter is configured in the plugin preferences
+		self.changeFilter = ChangeNotificationFilter(pluginId)
+		self.configureChangeFilter(pluginPrefs)
+		self.changeFilter.install(self)
 		
 		# Indigo Plugins use standard Python based logging and provide a default instance
 		# available to the plugin via the self.logger property
@@ -87,12 +157,13 @@ class Plugin(indigo.PluginBase):
 		#
 		# Indigo includes a new logging level called THREADDEBUG (logger level 5) that,
 		# by default, logs to a plugin-specific file that is not normally sent to the
-		# Indigo Log:
-		self.indigo_log_handler.setLevel(logging.DEBUG)
+		# Indigo Log. The levels of the two handlers (indigo_log_handler for the Indigo Log
+		# and plugin_file_handler for the plugin.log file) determine what is actually
+		# written; see setDebugLoggingEnabled below for how this plugin controls them
+		self.setDebugLoggingEnabled(pluginPrefs.get("debugLoggingEnabled", True))
 		self.logger.threaddebug(u'A ton of logging information here that might be used for debugging by the developer!')
 		self.debugLogWithLineNum(u'Called __init__(self, pluginId, pluginDisplayName, pluginVersion, pluginPrefs):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ("{0}", "{1}", "{2}", {3})'.format(pluginId, pluginDisplayName, pluginVersion, pluginPrefs))
+		self.debugLogMethodParams(u'     ("{0}", "{1}", "{2}", {3})', pluginId, pluginDisplayName, pluginVersion, pluginPrefs)
 
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	# Destructor... normally need not do anything here...
@@ -142,13 +213,27 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def validatePrefsConfigUi(self, valuesDict):
 		self.debugLogWithLineNum(u'Called validatePrefsConfigUi(self, valuesDict):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0})'.format(valuesDict))
+		self.debugLogMethodParams(u'     ({0})', valuesDict)
 
 		# possible to do real validation and return an error if it fails, such as:		
-		#errorMsgDict = indigo.Dict()
-		#errorMsgDict[u"requiredFieldChk"] = u"You must check this box to continue"
-		#return (False, valuesDict, errorMsgDict)
+		errorMsgDict = indigo.Dict()
+		try:
+			if float(valuesDict.get(u'commandRateLimit', u'0') or 0) < 0:
+				raise ValueError()
+		except ValueError:
+			errorMsgDict[u'commandRateLimit'] = u'Enter the maximum number of commands per second or 0 for no limit'
+		try:
+			if float(valuesDict.get(u'stateUpdateInterval', u'100') or 0) < 0:
+				raise ValueError()
+		except ValueError:
+			errorMsgDict[u'stateUpdateInterval'] = u'Enter the number of milliseconds between state updates or 0 to update immediately'
+		for filterIdsKey in (u'changeFilterDeviceFolderIds', u'changeFilterDeviceIds', u'changeFilterVariableFolderIds', u'changeFilterVariableIds'):
+			try:
+				self.getPrefsIdList(valuesDict, filterIdsKey)
+			except ValueError:
+				errorMsgDict[filterIdsKey] = u'Enter a comma separated list of numeric IDs or leave blank'
+		if len(errorMsgDict) > 0:
+			return (False, valuesDict, errorMsgDict)
 		
 		# if no errors, return True and the values as a tuple
 		return (True, valuesDict)
@@ -158,12 +243,18 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def closedPrefsConfigUi(self, valuesDict, userCancelled):
 		self.debugLogWithLineNum(u'Called closedPrefsConfigUi(self, valuesDict, userCancelled):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0}, {1})'.format(valuesDict, userCancelled))
+		self.debugLogMethodParams(u'     ({0}, {1})', valuesDict, userCancelled)
 			
 		# if the user saved his/her preferences, update our member variables now
 		if userCancelled == False:
 			self.logMethodParams = valuesDict.get("logMethodParams", False)
+			self.setDebugLoggingEnabled(valuesDict.get("debugLoggingEnabled", True))
+			self.commandRateLimit = float(valuesDict.get("commandRateLimit", "0") or 0)
+			self.commandWorkerCount = int(valuesDict.get("commandWorkerCount", "1"))
+			self.stateWriter.flushInterval = float(valuesDict.get("stateUpdateInterval", "100") or 0) / 1000.0
+			self.configureChangeFilter(valuesDict)
+			self.callbackProfiler.enabled = valuesDict.get("profileCallbacks", False)
+			self.configureCallRecorder(valuesDict)
 			if self.pluginPrefs.get("registerForDevicesChanges", False) == True:
 				indigo.devices.subscribeToChanges()
 			if self.pluginPrefs.get("registerForVariableChanges", False) == True:
@@ -193,8 +284,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def getMenuActionConfigUiXml(self, menuId):
 		self.debugLogWithLineNum(u'Called getMenuActionConfigUiXml(self, menuId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0})'.format(menuId))
+		self.debugLogMethodParams(u'     ({0})', menuId)
 
 		if menuId == u'dynamicUIDemonstration':
 			self.logger.debug(u'Providing dynamic ConfigUI for menu item')
@@ -210,8 +300,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def getMenuActionConfigUiValues(self, menuId):
 		self.debugLogWithLineNum(u'Called getMenuActionConfigUiValues(self, menuId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0})'.format(menuId))
+		self.debugLogMethodParams(u'     ({0})', menuId)
 		valuesDict = indigo.Dict()
 		errorMsgDict = indigo.Dict()
 		return (valuesDict, errorMsgDict)
@@ -234,8 +323,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def getDeviceStateList(self, dev):
 		self.debugLogWithLineNum(u'Called getDeviceStateList(self, dev):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0})'.format(dev))
+		self.debugLogMethodParams(u'     ({0})', dev)
 		return super(Plugin, self).getDeviceStateList(dev)
 		
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -244,8 +332,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def getDeviceDisplayStateId(self, dev):
 		self.debugLogWithLineNum(u'Called getDeviceDisplayStateId(self, dev):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0})'.format(dev))
+		self.debugLogMethodParams(u'     ({0})', dev)
 		return super(Plugin, self).getDeviceDisplayStateId(dev)
 
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -254,8 +341,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def getDeviceTypeClassName(self, typeId):
 		self.debugLogWithLineNum(u'Called getDeviceTypeClassName(self, typeId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0})'.format(typeId))
+		self.debugLogMethodParams(u'     ({0})', typeId)
 		return super(Plugin, self).getDeviceTypeClassName(typeId)
 		
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -266,8 +352,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def getDeviceConfigUiXml(self, typeId, devId):
 		self.debugLogWithLineNum(u'Called getDeviceConfigUiXml(self, typeId, devId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0}, {1})'.format(typeId, devId))
+		self.debugLogMethodParams(u'     ({0}, {1})', typeId, devId)
 		return super(Plugin, self).getDeviceConfigUiXml(typeId, devId)
 		
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -276,8 +361,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def getDeviceConfigUiValues(self, pluginProps, typeId, devId):
 		self.debugLogWithLineNum(u'Called getDeviceConfigUiValues(self, pluginProps, typeId, devId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0}, {1}, {2})'.format(pluginProps, typeId, devId))
+		self.debugLogMethodParams(u'     ({0}, {1}, {2})', pluginProps, typeId, devId)
 		return super(Plugin, self).getDeviceConfigUiValues(pluginProps, typeId, devId)
 
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -286,8 +370,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def validateDeviceConfigUi(self, valuesDict, typeId, devId):
 		self.debugLogWithLineNum(u'Called validateDeviceConfigUi(self, valuesDict, typeId, devId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0}, {1}, {2})'.format(valuesDict, typeId, devId))
+		self.debugLogMethodParams(u'     ({0}, {1}, {2})', valuesDict, typeId, devId)
 			
 		# we may also change the values, here we will set the value of the address
 		# to the time
@@ -306,8 +389,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def closedDeviceConfigUi(self, valuesDict, userCancelled, typeId, devId):
 		self.debugLogWithLineNum(u'Called closedDeviceConfigUi(self, valuesDict, userCancelled, typeId, devId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0}, {1}, {2}, {3})'.format(valuesDict, userCancelled, typeId, devId))
+		self.debugLogMethodParams(u'     ({0}, {1}, {2}, {3})', valuesDict, userCancelled, typeId, devId)
 		return
 		
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -324,8 +406,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def didDeviceCommPropertyChange(self, origDev, newDev):
 		self.debugLogWithLineNum(u'Called didDeviceCommPropertyChange(self, origDev, newDev):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0}, {1})'.format(origDev, newDev))
+		self.debugLogMethodParams(u'     ({0}, {1})', origDev, newDev)
 
 		# example of customizing the call:
 		# if origDev.pluginProps.get('ipAddress', '') != newDev.pluginProps.get('ipAddress', ''):
@@ -352,8 +433,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def getDeviceFactoryUiValues(self, devIdList):
 		self.debugLogWithLineNum(u'Called getDeviceFactoryUiValues(self, devIdList):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0})'.format(devIdList))
+		self.debugLogMethodParams(u'     ({0})', devIdList)
 		return super(Plugin, self).getDeviceFactoryUiValues(devIdList)
 
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -362,8 +442,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def validateDeviceFactoryUi(self, valuesDict, devIdList):
 		self.debugLogWithLineNum(u'Called validateDeviceFactoryUi(self, valuesDict, devIdList):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0}, {1})'.format(valuesDict, devIdList))
+		self.debugLogMethodParams(u'     ({0}, {1})', valuesDict, devIdList)
 		# errorMsgDict = indigo.Dict()
 		# errorMsgDict[u"someUiFieldId"] = u"sorry but you MUST check this checkbox!"
 		# return (False, valuesDict, errorMsgDict)
@@ -375,8 +454,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def closedDeviceFactoryUi(self, valuesDict, userCancelled, devIdList):
 		self.debugLogWithLineNum(u'Called closedDeviceFactoryUi(self, valuesDict, userCancelled, devIdList):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0}, {1}, {2})'.format(valuesDict, userCancelled, devIdList))
+		self.debugLogMethodParams(u'     ({0}, {1}, {2})', valuesDict, userCancelled, devIdList)
 		return
 		
 		
@@ -397,8 +475,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def getActionCallbackMethod(self, typeId):
 		self.debugLogWithLineNum(u'Called getActionCallbackMethod(self, typeId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0})'.format(typeId))
+		self.debugLogMethodParams(u'     ({0})', typeId)
 		return super(Plugin, self).getActionCallbackMethod(typeId)
 		
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -408,8 +485,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def getActionConfigUiXml(self, typeId, devId):
 		self.debugLogWithLineNum(u'Called getActionConfigUiXml(self, typeId, devId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0}, {1})'.format(typeId, devId))
+		self.debugLogMethodParams(u'     ({0}, {1})', typeId, devId)
 		return super(Plugin, self).getActionConfigUiXml(typeId, devId)
 
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -418,8 +494,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def getActionConfigUiValues(self, pluginProps, typeId, devId):
 		self.debugLogWithLineNum(u'Called getActionConfigUiValues(self, pluginProps, typeId, devId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0}, {1}, {2})'.format(pluginProps, typeId, devId))
+		self.debugLogMethodParams(u'     ({0}, {1}, {2})', pluginProps, typeId, devId)
 		return super(Plugin, self).getActionConfigUiValues(pluginProps, typeId, devId)
 
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -428,8 +503,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def validateActionConfigUi(self, valuesDict, typeId, devId):
 		self.debugLogWithLineNum(u'Called validateActionConfigUi(self, valuesDict, typeId, devId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0}, {1}, {2})'.format(valuesDict, typeId, devId))
+		self.debugLogMethodParams(u'     ({0}, {1}, {2})', valuesDict, typeId, devId)
 		
 		# If validation fails, return False and an error dictionary such as:
 		# errorMsgDict = indigo.Dict()
@@ -443,8 +517,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def closedActionConfigUi(self, valuesDict, userCancelled, typeId, devId):
 		self.debugLogWithLineNum(u'Called closedActionConfigUi(self, valuesDict, userCancelled, typeId, devId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0}, {1}, {2}, {3})'.format(valuesDict, userCancelled, typeId, devId))
+		self.debugLogMethodParams(u'     ({0}, {1}, {2}, {3})', valuesDict, userCancelled, typeId, devId)
 		return
 
 	
@@ -462,6 +535,9 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def startup(self):
 		self.debugLogWithLineNum(u'Called startup(self):')
+		self.deviceCache.load()
+		self.stateWriter.start()
+		self.triggerRegistry.start()
 		if self.pluginPrefs.get("registerForDevicesChanges", False) == True:
 			indigo.devices.subscribeToChanges()
 		if self.pluginPrefs.get("registerForVariableChanges", False) == True:
@@ -482,6 +558,12 @@ class Plugin(indigo.PluginBase):
 	# background thread at all, or a combination of the two.
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def runConcurrentThread(self):
+		# the worker count is read once here; changes to it take effect when the plugin
+		# is restarted
+		if self.commandWorkerCount > 1:
+			self.commandPool = ShardedCommandPool(self.commandWorkerCount, self.executeCommand, self.exceptionLog, self.getMinCommandInterval)
+			self.commandPool.start()
+
 		try:
 			# this will create an infinite loop which exits via exception or you could
 			# implement your own method/scheme to exit
@@ -490,52 +572,39 @@ class Plugin(indigo.PluginBase):
 				# from callbacks to your plugin or whatever your particular plugin needs.
 				# we will process items found in the command queue
 				while not self.commandQueue.empty():
-					lenQueue = self.commandQueue.qsize()
-					self.debugLogWithLineNum(u'Command queue has {0} command(s) waiting'.format(lenQueue))
-					
-					# you get the next item in the queue via a get() call
-					command = self.commandQueue.get()
-					
-					# here you would process the command which could be whatever you put in the queue
-					# via your actions... this might be a tuple, a class, or anything. here we are
-					# just passing in a tuple... the command and a parameter
-					self.debugLogWithLineNum(u'Command executed: {0}'.format(command[0]))
-					
-					if command[0] == "incrementDeviceState":
-						# we added the device ID as the second parameter of the tuple...
-						deviceForAction = indigo.devices[command[1]]
-						currentValue = int(deviceForAction.states.get('exampleNumberState', '0'))
-						currentValue += 1
-						deviceForAction.updateStateOnServer(key='exampleNumberState', value=currentValue)
-						
-						# you may want to sleep after certain commands - this would be specific to your plugin
-						# and possibly command... for instance, after a power-on command, might want to sleep
-						# a time to be sure the device powers up
-						self.sleep(0.4)
-						
-					elif command[0] == "decrementDeviceState":
-						# we added the device ID as the second parameter of the tuple...
-						deviceForAction = indigo.devices[command[1]]
-						currentValue = int(deviceForAction.states.get('exampleNumberState', '0'))
-						currentValue -= 1
-						deviceForAction.updateStateOnServer(key='exampleNumberState', value=currentValue)
-		
-						# each command might have a different (or no) sleep requirement...
-						self.sleep(0.2)
+					# you could get the next item in the queue via a get() call; here we take
+					# everything that is waiting so that multiple commands for the same device
+					# may be merged into a single update of that device (see commandQueue.py)
+					queuedCommands = self.commandQueue.getAllWaiting()
+					(commands, mergedCount) = coalesceDeviceCommands(queuedCommands)
+					self.commandsMerged += mergedCount
+					self.debugLogWithLineNum(u'Command queue had {0} command(s) waiting, {1} merged', len(queuedCommands), mergedCount)
+
+					for command in commands:
+						if self.commandPool is not None:
+							# the worker pool spaces out the commands of all of its workers
+							self.commandPool.dispatch(self.getCommandDeviceId(command), command)
+						else:
+							# you may want to space out commands to the device(s) - this would be specific to
+							# your plugin and possibly command... for instance, after a power-on command, you
+							# might want to wait a time to be sure the device powers up
+							self.waitForCommandRateLimit()
+							self.executeCommand(command)
 					
-					# complete the dequeuing of the command, allowing the next
-					# command in queue to rise to the top
-					self.commandQueue.task_done()
+					# complete the dequeuing of the commands, allowing a caller blocked
+					# on commandQueue.join() to continue
+					for command in queuedCommands:
+						self.commandQueue.task_done()
 				
 				# the queue is now empty... you need to sleep on each iteration lest you eat up all
-				# of the CPU cycles on the server! this custom sleep command may be interrupted and
-				# is provided on the plugin base class; parameter is in seconds. If you want to
-				# explore queueing up commands to see how it works "stacked up", increase this time to
-				# a larger number of seconds
+				# of the CPU cycles on the server! rather than sleeping for a fixed time and then
+				# checking the queue again (which delays a new command by up to the sleep time), this
+				# waits until either a command is queued or the plugin is asked to stop. You may pass
+				# a timeout (in seconds) if your plugin also needs to poll for information
 				#
-				# NOTE: prefer this sleep method over the default Python thread sleep call as it has
-				# proper interrupts in place
-				self.sleep(0.5)
+				# NOTE: like self.sleep, this is interrupted by the plugin stopping and raises the
+				# StopThread exception in that case
+				self.waitForQueuedCommands()
 				
 		except self.StopThread:
 			# if needed, you could do any cleanup here, or could exit via another flag
@@ -547,6 +616,11 @@ class Plugin(indigo.PluginBase):
 			#    [device].setErrorStateOnServer("Error")
 			# you may also wish to schedule a re-connection attempt, if appropriate for the device
 			self.exceptionLog()
+		finally:
+			# let the workers finish the commands already handed to them before exiting
+			if self.commandPool is not None:
+				self.commandPool.stop()
+				self.commandPool = None
 
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	# shutdown is called by Indigo whenever the entire plugin is being shut down from
@@ -558,6 +632,11 @@ class Plugin(indigo.PluginBase):
 	def shutdown(self):
 		self.debugLogWithLineNum(u'Called shutdown(self):')
 
+		# write any device state changes that are still waiting and execute any triggers
+		# that have been fired
+		self.stateWriter.stop()
+		self.triggerRegistry.stop()
+
 
 	#/////////////////////////////////////////////////////////////////////////////////////
 	# Indigo Device Lifecycle Callback Routines
@@ -572,8 +651,8 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def deviceCreated(self, dev):
 		self.debugLogWithLineNum(u'Called deviceCreated(self, dev):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0})'.format(dev))
+		self.debugLogMethodParams(u'     ({0})', dev)
+		self.deviceCache.deviceChanged(dev)
 		super(Plugin, self).deviceCreated(dev)
 	
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -584,8 +663,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def deviceStartComm(self, dev):
 		self.debugLogWithLineNum(u'Called deviceStartComm(self, dev):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0})'.format(dev))
+		self.debugLogMethodParams(u'   ({0})', dev)
 		
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	# This routine is called whenever a device has been updated; if you override it, be
@@ -593,8 +671,8 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def deviceUpdated(self, origDev, newDev):
 		self.debugLogWithLineNum(u'Called deviceUpdated(self, origDev, newDev):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0}, {1})'.format(origDev, newDev))
+		self.debugLogMethodParams(u'     ({0}, {1})', origDev, newDev)
+		self.deviceCache.deviceChanged(newDev)
 		super(Plugin, self).deviceUpdated(origDev, newDev)
 		
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -603,8 +681,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def deviceStopComm(self, dev):
 		self.debugLogWithLineNum(u'Called deviceStopComm(self, dev):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0})'.format(dev))
+		self.debugLogMethodParams(u'   ({0})', dev)
 	
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	# This routine is called whenever a device has been deleted... be sure to call the
@@ -613,8 +690,8 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def deviceDeleted(self, dev):
 		self.debugLogWithLineNum(u'Called deviceDeleted(self, dev):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'     ({0})'.format(dev))
+		self.debugLogMethodParams(u'     ({0})', dev)
+		self.deviceCache.removeDevice(dev.id)
 		super(Plugin, self).deviceDeleted(dev)
 		
 		
@@ -628,8 +705,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def triggerCreated(self, trigger):
 		self.debugLogWithLineNum(u'Called triggerCreated(self, trigger):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0})'.format(trigger))
+		self.debugLogMethodParams(u'   ({0})', trigger)
 		super(Plugin, self).triggerCreated(trigger)
 	
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -638,15 +714,11 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def triggerStartProcessing(self, trigger):
 		self.debugLogWithLineNum(u'Called triggerStartProcessing(self, trigger):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0})'.format(trigger))
+		self.debugLogMethodParams(u'   ({0})', trigger)
 		
-		# store the trigger in a member variable so that it may be called back whenever
-		# our triggering action occurs
-		triggerType = trigger.pluginTypeId
-		if not (triggerType in self.indigoEvents):
-			self.indigoEvents[triggerType] = dict()
-		self.indigoEvents[triggerType][trigger.id] = trigger
+		# store the trigger so that it may be called back whenever our triggering action
+		# occurs
+		self.triggerRegistry.addTrigger(trigger)
 		
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	# This routine is called whenever a trigger is updated; if you override it, be sure to
@@ -655,8 +727,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def triggerUpdated(self, origTrigger, newTrigger):
 		self.debugLogWithLineNum(u'Called triggerUpdated(self, origTrigger, newTrigger):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0}, {1})'.format(origTrigger, newTrigger))
+		self.debugLogMethodParams(u'   ({0}, {1})', origTrigger, newTrigger)
 		super(Plugin, self).triggerUpdated(origTrigger, newTrigger)
 		
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -664,14 +735,10 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def triggerStopProcessing(self, trigger):
 		self.debugLogWithLineNum(u'Called triggerStopProcessing(self, trigger):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0})'.format(trigger))
+		self.debugLogMethodParams(u'   ({0})', trigger)
 		
 		# if the trigger exists within our list, go ahead and delete it out now
-		triggerType = trigger.pluginTypeId
-		if triggerType in self.indigoEvents:
-			if trigger.id in self.indigoEvents[triggerType]:
-				del self.indigoEvents[triggerType][trigger.id]
+		self.triggerRegistry.removeTrigger(trigger)
 				
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	# This routine is called whenever a trigger is deleted; if you override it, be sure to
@@ -680,8 +747,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def triggerDeleted(self, trigger):
 		self.debugLogWithLineNum(u'Called triggerDeleted(self, trigger):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0})'.format(trigger))
+		self.debugLogMethodParams(u'   ({0})', trigger)
 		super(Plugin, self).triggerDeleted(trigger)
 		
 		
@@ -698,7 +764,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def customMenuItem1Executed(self):
 		self.debugLogWithLineNum(u'Called customMenuItem1Executed(self):')
-		self.commandQueue.put((u'Queued action from customMenuItem1Executed', 0))
+		self.queueCommand(u'Queued action from customMenuItem1Executed', 0)
 		
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	# This callback originates from the menu item that should trigger the custom event
@@ -706,17 +772,14 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def triggerEventFromMenu(self):
 		self.debugLogWithLineNum(u'Called triggerEventFromMenu(self):')
-		if 'samplePluginEvent' in self.indigoEvents:
-			for trigger in self.indigoEvents['samplePluginEvent'].values():
-				indigo.trigger.execute(trigger)
+		self.triggerRegistry.fire(u'samplePluginEvent')
 
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	# This callback originates from the menu item with a UI
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def customMenuItem2Executed(self, valuesDict, typeId):
 		self.debugLogWithLineNum(u'Called customMenuItem2Executed(self, valuesDict, typeId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0}, {1})'.format(valuesDict, typeId))
+		self.debugLogMethodParams(u'   ({0}, {1})', valuesDict, typeId)
 			
 		# you may return an error dictionary here like other UI validation routines
 		# errorsDict = indigo.Dict()
@@ -724,7 +787,7 @@ class Plugin(indigo.PluginBase):
 		# return (False, valuesDict, errorsDict)
 		
 		# queue up an action as a demonstration
-		self.commandQueue.put((u'Queued action from customMenuItem2Executed', 0))
+		self.queueCommand(u'Queued action from customMenuItem2Executed', 0)
 		
 		return (True, valuesDict)
 		
@@ -733,9 +796,8 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def changeCustomDeviceCounterState(self, action):
 		self.debugLogWithLineNum(u'Called changeCustomDeviceCounterState(self, action):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0})'.format(action))
-		self.commandQueue.put((action.pluginTypeId, action.deviceId))
+		self.debugLogMethodParams(u'   ({0})', action)
+		self.queueCommand(action.pluginTypeId, action.deviceId)
 		
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	# Called whenever the user has submitted a custom message to be broadcast to all
@@ -743,8 +805,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def sendIntraPluginBroadcast(self, valuesDict, typeId):
 		self.debugLogWithLineNum(u'Called sendIntraPluginBroadcast(self, valuesDict, typeId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0}, {1})'.format(valuesDict, typeId))
+		self.debugLogMethodParams(u'   ({0}, {1})', valuesDict, typeId)
 
 		indigo.server.broadcastToSubscribers(valuesDict.get(u'message', u''))
 		return True
@@ -754,25 +815,26 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def setCustomDeviceState(self, action):
 		self.debugLogWithLineNum(u'Called setCustomDeviceState(self, action):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0})'.format(action))
-		deviceForAction = indigo.devices[action.deviceId]
+		self.debugLogMethodParams(u'   ({0})', action)
+
+		# the state is updated from the background thread; if the action is executed
+		# several times before the thread gets to it, only the last value is sent
+		newStateValue = action.props.get('newStateValue', '')
 		if action.props.get('addSymbolToState', False) == True:
-			deviceForAction.updateStateOnServer(key='exampleDisplayState', value=action.props.get('newStateValue', ''), uiValue=action.props.get('newStateValue', '') + u'°')
+			self.queueCommand(action.pluginTypeId, action.deviceId, (newStateValue, newStateValue + u'°'))
 		else:
-			deviceForAction.updateStateOnServer(key='exampleDisplayState', value=action.props.get('newStateValue', ''))
+			self.queueCommand(action.pluginTypeId, action.deviceId, (newStateValue, None))
 			
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	# This routine is a callback for an action and demonstrates updating multiple states
 	# for the device in one call. This is far more efficient on the server than calling
-	# updateStateOnServer multiple times.
+	# updateStateOnServer multiple times. The states are posted to the state writer, which
+	# normally sends them on its next tick along with any other changes to the device
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def setMultipleDeviceStates(self, action):
 		self.debugLogWithLineNum(u'Called setMultipleDeviceStates(self, action):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0})'.format(action))
+		self.debugLogMethodParams(u'   ({0})', action)
 
-		deviceForUpdates = indigo.devices[action.deviceId]
 		textStateVal = action.props.get(u'newStringState', '')
 		numericStateValOption = action.props.get(u'newNumberState', 'option1')
 		numericStateVal = int(numericStateValOption.replace('option', ''))
@@ -781,7 +843,11 @@ class Plugin(indigo.PluginBase):
 				{'key' : u'exampleDisplayState', 'value' : textStateVal},
 				{'key' : u'exampleNumberState', 'value' : numericStateVal}
 			]
-		deviceForUpdates.updateStatesOnServer(updatedStates)
+		self.stateWriter.updateStates(action.deviceId, updatedStates)
+
+		# the next action in an action group may read the states, so write them now rather
+		# than waiting for the tick
+		self.stateWriter.flush()
 
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	# This routine is called when the user clicks the button on the device configuration
@@ -789,8 +855,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def customDeviceConfigCallback(self, valuesDict, typeId, devId):
 		self.debugLogWithLineNum(u'Called customDeviceConfigCallback(self, valuesDict, typeId, devId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0}, {1}, {2})'.format(valuesDict, typeId, devId))
+		self.debugLogMethodParams(u'   ({0}, {1}, {2})', valuesDict, typeId, devId)
 		return valuesDict
 		
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -799,8 +864,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def getCustomDeviceConfigMenu(self, filter="", valuesDict=None, typeId="", targetId=0):
 		self.debugLogWithLineNum(u'Called getCustomDeviceConfigMenu(self, filter, valuesDict, typeId, targetId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0}, {1}, {2}, {3})'.format(filter, valuesDict, typeId, targetId))
+		self.debugLogMethodParams(u'   ({0}, {1}, {2}, {3})', filter, valuesDict, typeId, targetId)
 		optionsArray = [("option1", "First Option"),("option2","Second Option")]
 		return optionsArray
 		
@@ -810,8 +874,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def getCustomDeviceConfigReloadingMenu(self, filter="", valuesDict=None, typeId="", targetId=0):
 		self.debugLogWithLineNum(u'Called getCustomDeviceConfigReloadingMenu(self, filter, valuesDict, typeId, targetId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0}, {1}, {2}, {3})'.format(filter, valuesDict, typeId, targetId))
+		self.debugLogMethodParams(u'   ({0}, {1}, {2}, {3})', filter, valuesDict, typeId, targetId)
 		optionsArray = [("option3", "Dyna First Option"),("option4","Dyna Second Option")]
 		return optionsArray
 		
@@ -821,8 +884,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def subscribeToPluginBroadcast(self, valuesDict, typeId):
 		self.debugLogWithLineNum(u'Called subscribeToPluginBroadcast from menu item')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0}, {1})'.format(valuesDict, typeId))
+		self.debugLogMethodParams(u'   ({0}, {1})', valuesDict, typeId)
 		
 		pluginId = valuesDict.get(u'pluginId')
 		broadcastKey = valuesDict.get(u'broadcastKey')
@@ -834,8 +896,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def dynamicPopupListExample(self, filter="", valuesDict=None, typeId="", targetId=0):
 		self.debugLogWithLineNum(u'Called dynamicPopupListExample(self, filter, valuesDict, typeId, targetId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0}, {1}, {2}, {3})'.format(filter, valuesDict, typeId, targetId))
+		self.debugLogMethodParams(u'   ({0}, {1}, {2}, {3})', filter, valuesDict, typeId, targetId)
 		listOptions = [("option1", "First Option"),("option2","Second Option"),("option3","Third Option")]
 		return listOptions
 
@@ -856,8 +917,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def dynamicPopupListReloadExample(self, filter="", valuesDict=None, typeId="", targetId=0):
 		self.debugLogWithLineNum(u'Called dynamicPopupListReloadExample(self, filter, valuesDict, typeId, targetId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0}, {1}, {2}, {3})'.format(filter, valuesDict, typeId, targetId))
+		self.debugLogMethodParams(u'   ({0}, {1}, {2}, {3})', filter, valuesDict, typeId, targetId)
 		
 		maxListItem = int(valuesDict.get(u'dynamicReloadCurr', '1'))
 		listOptions = []
@@ -872,8 +932,7 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def pollingConfigUICallback(self, valuesDict, typeId="", devId=None):
 		self.debugLogWithLineNum(u'Called pollingConfigUICallback(self, valuesDict, typeId, devId):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0}, {1}, {2})'.format(valuesDict, typeId, devId))
+		self.debugLogMethodParams(u'   ({0}, {1}, {2})', valuesDict, typeId, devId)
 
 		errorsDict = indigo.Dict()
 
@@ -925,24 +984,21 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def scheduleCreated(self, schedule):
 		self.debugLogWithLineNum(u'Called scheduleCreated(self, schedule):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0})'.format(schedule))
+		self.debugLogMethodParams(u'   ({0})', schedule)
 		
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	# This routine is called whenever a schedule has been updated
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def scheduleUpdated(self, origSchedule, newSchedule):
 		self.debugLogWithLineNum(u'Called scheduleUpdated(self, origSchedule, newSchedule):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0}, {1})'.format(origSchedule, newSchedule))
+		self.debugLogMethodParams(u'   ({0}, {1})', origSchedule, newSchedule)
 
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	# This routine is called whenever a schedule has been deleted
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def scheduleDeleted(self, schedule):
 		self.debugLogWithLineNum(u'Called scheduleDeleted(self, schedule):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0})'.format(schedule))
+		self.debugLogMethodParams(u'   ({0})', schedule)
 
 	
 	#/////////////////////////////////////////////////////////////////////////////////////
@@ -963,24 +1019,21 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def actionGroupCreated(self, group):
 		self.debugLogWithLineNum(u'Called actionGroupCreated(self, group):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0})'.format(group))
+		self.debugLogMethodParams(u'   ({0})', group)
 		
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	# This routine is called whenever an action group has been updated
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def actionGroupUpdated(self, origGroup, newGroup):
 		self.debugLogWithLineNum(u'Called actionGroupUpdated(self, origGroup, newGroup):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0}, {1})'.format(origGroup, newGroup))
+		self.debugLogMethodParams(u'   ({0}, {1})', origGroup, newGroup)
 
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	# This routine is called whenever an action group has been deleted
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def actionGroupDeleted(self, group):
 		self.debugLogWithLineNum(u'Called actionGroupDeleted(self, group):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0})'.format(group))
+		self.debugLogMethodParams(u'   ({0})', group)
 
 	
 	#/////////////////////////////////////////////////////////////////////////////////////
@@ -1000,24 +1053,21 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def controlPageCreated(self, page):
 		self.debugLogWithLineNum(u'Called controlPageCreated(self, page):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0})'.format(page))
+		self.debugLogMethodParams(u'   ({0})', page)
 		
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	# This routine is called whenever a control page has been updated
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def controlPageUpdated(self, origPage, newPage):
 		self.debugLogWithLineNum(u'Called controlPageUpdated(self, origPage, newPage):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0}, {1})'.format(origPage, newPage))
+		self.debugLogMethodParams(u'   ({0}, {1})', origPage, newPage)
 
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	# This routine is called whenever a control page has been deleted
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def controlPageDeleted(self, page):
 		self.debugLogWithLineNum(u'Called controlPageDeleted(self, page):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0})'.format(page))
+		self.debugLogMethodParams(u'   ({0})', page)
 
 	
 	#/////////////////////////////////////////////////////////////////////////////////////
@@ -1034,24 +1084,24 @@ class Plugin(indigo.PluginBase):
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def variableCreated(self, var):
 		self.debugLogWithLineNum(u'Called variableCreated(self, var):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0})'.format(var))
+		self.debugLogMethodParams(u'   ({0})', var)
 
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
-	# This routine is called whenever an Indigo variable has been updated
+	# This routine is called whenever an Indigo variable has been updated; if you override
+	# it, be sure to call the base class processing so that any substitutions registered
+	# with registerSubstitution are kept up to date
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def variableUpdated(self, origVar, newVar):
 		self.debugLogWithLineNum(u'Called variableUpdated(self, origVar, newVar):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0}, {1})'.format(origVar, newVar))
+		self.debugLogMethodParams(u'   ({0}, {1})', origVar, newVar)
+		super(Plugin, self).variableUpdated(origVar, newVar)
 		
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	# This routine is called whenever an Indigo variable has been deleted
 	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 	def variableDeleted(self, var):
 		self.debugLogWithLineNum(u'Called variableDeleted(self, var):')
-		if self.logMethodParams == True:
-			self.debugLogWithLineNum(u'   ({0})'.format(var))
+		self.debugLogMethodParams(u'   ({0})', var)
 			
 
 	#/////////////////////////////////////////////////////////////////////////////////////
@@ -1071,8 +1121,287 @@ class Plugin(indigo.PluginBase):
 		self.logger.debug(u'Received publish from a subscribed plugin: {0}'.format(arg))
 
 		
+	#/////////////////////////////////////////////////////////////////////////////////////
+	# Command Queue Processing
+	#	These routines are used by the callbacks above to hand work off to the background
+	#	thread (runConcurrentThread) and by that thread to execute it
+	#/////////////////////////////////////////////////////////////////////////////////////
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Places a command on the queue for the background thread; each entry is a tuple of
+	# the command, its parameter (here, the device ID), the time it was queued and any
+	# additional data needed by the command
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def queueCommand(self, commandName, commandParam, commandData=None):
+		self.commandQueue.put((commandName, commandParam, time.time(), commandData))
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Blocks the background thread until a command is queued; the plugin's stop pipe
+	# (the one used by self.sleep) is watched as well so that a stop request wakes the
+	# thread immediately
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def waitForQueuedCommands(self, timeout=None):
+		if self.stopThread:
+			raise self.StopThread
+		self.commandQueue.waitForCommands(self._stopThreadPipeIn, timeout)
+		if self.stopThread:
+			raise self.StopThread
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Sleeps only as long as needed to honor the commands per second limit set in the
+	# plugin preferences; does nothing if no limit has been set
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def waitForCommandRateLimit(self):
+		minCommandInterval = self.getMinCommandInterval()
+		if minCommandInterval > 0.0:
+			self.sleep(self.lastCommandExecutionTime + minCommandInterval - time.time())
+		self.lastCommandExecutionTime = time.time()
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Returns the minimum number of seconds between two commands for the current commands
+	# per second limit (0 if there is none); also called by the worker pool for each
+	# command so that a new limit saved in the preferences applies right away
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def getMinCommandInterval(self):
+		commandRateLimit = self.commandRateLimit
+		if commandRateLimit > 0.0:
+			return 1.0 / commandRateLimit
+		return 0.0
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Executes a single command taken from the queue on the background thread
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def executeCommand(self, command):
+		# here you would process the command which could be whatever you put in the queue
+		# via your actions... this might be a tuple, a class, or anything. here we are
+		# just passing in a tuple... the command, a parameter, the time it was queued and
+		# the command's data. The counter and display state commands for a device have been
+		# merged into a single CoalescedDeviceCommand by coalesceDeviceCommands
+		if isinstance(command, CoalescedDeviceCommand):
+			self.recordCommandLatency(command.queuedTime)
+			self.debugLogWithLineNum(u'Command executed: {0}', command)
+			self.executeDeviceCommand(command)
+		else:
+			self.recordCommandLatency(command[2])
+			self.debugLogWithLineNum(u'Command executed: {0}', command[0])
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Applies the net result of all the merged commands for a device; the states are
+	# posted to the state writer, which sends them to the server in a single call
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def executeDeviceCommand(self, command):
+		updatedStates = []
+		if command.counterDelta != 0:
+			currentValue = int(self.deviceCache.getState(command.deviceId, 'exampleNumberState', '0'))
+			updatedStates.append({'key' : u'exampleNumberState', 'value' : currentValue + command.counterDelta})
+		if command.displayState is not None:
+			(stateValue, stateUiValue) = command.displayState
+			if stateUiValue is None:
+				updatedStates.append({'key' : u'exampleDisplayState', 'value' : stateValue})
+			else:
+				updatedStates.append({'key' : u'exampleDisplayState', 'value' : stateValue, 'uiValue' : stateUiValue})
+		if len(updatedStates) > 0:
+			self.stateWriter.updateStates(command.deviceId, updatedStates)
+
+	def recordCommandLatency(self, queuedTime):
+		latency = time.time() - queuedTime
+		with self.commandLatencyLock:
+			self.commandLatencyCount += 1
+			self.commandLatencyTotal += latency
+			self.commandLatencyMax = max(self.commandLatencyMax, latency)
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Returns the ID of the device targeted by a queued command (0 for plugin-level
+	# commands); used to pick the worker that executes the command
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def getCommandDeviceId(self, command):
+		if isinstance(command, CoalescedDeviceCommand):
+			return command.deviceId
+		return command[1]
+
+
 	#/////////////////////////////////////////////////////////////////////////////////////
 	# Utility Routines
 	#/////////////////////////////////////////////////////////////////////////////////////
-	def debugLogWithLineNum(self, message):
-		self.logger.debug(u'[{0}] {1}'.format(inspect.currentframe().f_back.f_lineno, message))
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Sets up the change notification filter from the comma separated lists entered in
+	# the plugin preferences; an empty list does not filter
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def configureChangeFilter(self, prefs):
+		try:
+			self.changeFilter.configure(
+				pluginIds=self.getPrefsList(prefs, "changeFilterPluginIds"),
+				deviceTypeIds=self.getPrefsList(prefs, "changeFilterDeviceTypeIds"),
+				deviceFolderIds=self.getPrefsIdList(prefs, "changeFilterDeviceFolderIds"),
+				deviceIds=self.getPrefsIdList(prefs, "changeFilterDeviceIds"),
+				stateKeys=self.getPrefsList(prefs, "changeFilterStateKeys"),
+				variableFolderIds=self.getPrefsIdList(prefs, "changeFilterVariableFolderIds"),
+				variableIds=self.getPrefsIdList(prefs, "changeFilterVariableIds"))
+		except ValueError:
+			self.logger.error(u'Invalid ID in the change filter preferences; change notifications are not being filtered')
+			self.changeFilter.configure()
+
+	def getPrefsList(self, prefs, key):
+		return [value.strip() for value in prefs.get(key, u'').split(u',') if len(value.strip()) > 0]
+
+	def getPrefsIdList(self, prefs, key):
+		return [int(value) for value in self.getPrefsList(prefs, key)]
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Turns debug logging on or off for both of the handlers provided by the base class;
+	# when off, only INFO and above is written to the Indigo Log and the plugin.log file
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def setDebugLoggingEnabled(self, enabled):
+		if enabled == True:
+			self.indigo_log_handler.setLevel(logging.DEBUG)
+			self.plugin_file_handler.setLevel(logging.THREADDEBUG)
+		else:
+			self.indigo_log_handler.setLevel(logging.INFO)
+			self.plugin_file_handler.setLevel(logging.INFO)
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Returns True if a DEBUG message would be written by at least one of the handlers;
+	# the base class sets the logger itself to THREADDEBUG, so logger.isEnabledFor is
+	# always True and it is the handler levels that actually filter the output
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def isDebugLoggingEnabled(self):
+		for handler in self.logger.handlers:
+			if handler.level <= logging.DEBUG:
+				return True
+		return False
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Writes a debug message prefixed with the line number of the caller. Pass any values
+	# as additional arguments rather than formatting the message yourself: the message is
+	# only formatted (and the caller's frame only inspected) when DEBUG is enabled, so a
+	# call costs little more than the level check when debug logging is turned off
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def debugLogWithLineNum(self, message, *args):
+		if self.isDebugLoggingEnabled():
+			self._writeDebugLogWithLineNum(sys._getframe(1).f_lineno, message, args)
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Same as debugLogWithLineNum, but only logs when the user has asked for the method
+	# parameter values to be logged; the (possibly large) str() of each argument is only
+	# built once both checks pass
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def debugLogMethodParams(self, message, *args):
+		if self.logMethodParams == True and self.isDebugLoggingEnabled():
+			self._writeDebugLogWithLineNum(sys._getframe(1).f_lineno, message, args)
+
+	def _writeDebugLogWithLineNum(self, lineNum, message, args):
+		if len(args) > 0:
+			message = message.format(*args)
+		self.logger.debug(u'[{0}] {1}'.format(lineNum, message))
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Micro-benchmark of the debug logging routines above; logs the cost per call with
+	# the handlers set to THREADDEBUG, DEBUG and INFO. The real handlers are swapped for
+	# a NullHandler while timing so that the log is not flooded. May be run from the
+	# plugin's menu or the interactive shell: self.benchmarkDebugLogging(50000)
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def benchmarkDebugLogging(self, iterations=20000):
+		sampleParam = dict((u'key{0}'.format(x), u'value {0}'.format(x)) for x in range(50))
+		origLogMethodParams = self.logMethodParams
+		origHandlers = list(self.logger.handlers)
+		benchmarkHandler = logging.NullHandler()
+		results = []
+		try:
+			self.logMethodParams = True
+			self.logger.handlers = [benchmarkHandler]
+			for level in (logging.THREADDEBUG, logging.DEBUG, logging.INFO):
+				benchmarkHandler.setLevel(level)
+
+				startTime = time.time()
+				for x in xrange(iterations):
+					self.debugLogWithLineNum(u'Called benchmarkDebugLogging(self, iterations):')
+				lineNumCost = (time.time() - startTime) / iterations
+
+				startTime = time.time()
+				for x in xrange(iterations):
+					self.debugLogMethodParams(u'     ({0}, {1})', sampleParam, iterations)
+				paramsCost = (time.time() - startTime) / iterations
+
+				results.append((logging.getLevelName(level), lineNumCost, paramsCost))
+		finally:
+			self.logger.handlers = origHandlers
+			self.logMethodParams = origLogMethodParams
+
+		for (levelName, lineNumCost, paramsCost) in results:
+			self.logger.info(u'Handler level {0}: debugLogWithLineNum {1:.2f} usec/call, debugLogMethodParams {2:.2f} usec/call'.format(levelName, lineNumCost * 1000000.0, paramsCost * 1000000.0))
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Writes the timings of the lifecycle callbacks to the Indigo log, the callback with
+	# the most total time first; called from the plugin menu or the interactive shell:
+	# self.logCallbackTimings(). The percentiles are accurate to within a factor of two
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def logCallbackTimings(self):
+		if not self.callbackProfiler.enabled:
+			self.logger.info(u'Callback profiling is turned off; enable it in the plugin preferences')
+		report = self.callbackProfiler.getReport()
+		if len(report) == 0:
+			self.logger.info(u'No callback timings have been recorded')
+		for (name, count, totalTime, minTime, p50Time, p99Time, maxTime) in report:
+			self.logger.info(u'{0}: {1} call(s), {2:.1f} ms total; min {3:.3f} / p50 {4:.3f} / p99 {5:.3f} / max {6:.3f} ms'.format(name, count, totalTime * 1000.0, minTime * 1000.0, p50Time * 1000.0, p99Time * 1000.0, maxTime * 1000.0))
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Attaches a call recorder to the callback profiler when the preferences ask for one
+	# (keeping the records of one already attached) and detaches it otherwise
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def configureCallRecorder(self, prefs):
+		if prefs.get("recordCallbacks", False) == True:
+			if self.callbackProfiler.recorder is None:
+				self.callbackProfiler.recorder = CallRecorder()
+		else:
+			self.callbackProfiler.recorder = None
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Writes the last count lifecycle calls held by the call recorder to the Indigo log,
+	# oldest first; called from the plugin menu or the interactive shell:
+	# self.logRecentCallbacks(500)
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def logRecentCallbacks(self, count=50):
+		recorder = self.callbackProfiler.recorder
+		if recorder is None:
+			self.logger.info(u'Lifecycle calls are not being recorded; enable it in the plugin preferences')
+			return
+		histograms = self.callbackProfiler.histograms
+		records = recorder.getRecords(count)
+		self.logger.info(u'Last {0} of {1} recorded lifecycle call(s):'.format(len(records), recorder.recordedCount))
+		for (timestamp, callbackId, threadId, duration, argDigest) in records:
+			timeText = time.strftime(u'%H:%M:%S', time.localtime(timestamp))
+			self.logger.info(u'{0}.{1:06d} {2} ({3}) {4:.3f} ms on thread {5:x}'.format(timeText, int((timestamp % 1.0) * 1000000.0), histograms[callbackId].name, argDigest, duration * 1000.0, threadId))
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Writes the plugin's performance counters to the Indigo log; called from the plugin
+	# menu or the interactive shell: self.logPerformanceStatistics()
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def logPerformanceStatistics(self):
+		if self.commandLatencyCount > 0:
+			averageLatency = self.commandLatencyTotal / self.commandLatencyCount
+		else:
+			averageLatency = 0.0
+		self.logger.info(u'Command queue: {0} command(s) executed, latency from queued to executed avg {1:.1f} ms / max {2:.1f} ms, {3} waiting, {4} merged into other commands'.format(self.commandLatencyCount, averageLatency * 1000.0, self.commandLatencyMax * 1000.0, self.commandQueue.qsize(), self.commandsMerged))
+
+		commandPool = self.commandPool
+		if commandPool is not None:
+			for (shardIndex, queueDepth, maxQueueDepth, executedCount) in commandPool.getShardStatistics():
+				self.logger.info(u'Command worker {0}: {1} waiting (most waiting: {2}), {3} executed'.format(shardIndex, queueDepth, maxQueueDepth, executedCount))
+
+		(cachedDevices, devicesWithWrites) = self.deviceCache.getSizes()
+		self.logger.info(u'Device cache: {0} device(s) cached, {1} hit(s), {2} miss(es), {3} expired, {4} refreshed by callbacks, {5} device(s) with unconfirmed writes'.format(cachedDevices, self.deviceCache.hitCount, self.deviceCache.missCount, self.deviceCache.expiredCount, self.deviceCache.refreshCount, devicesWithWrites))
+
+		self.logger.info(u'Change filter: {0} device notification(s) delivered, {1} dropped, {2} for the plugin\'s own devices; {3} variable notification(s) delivered, {4} dropped'.format(self.changeFilter.deviceDeliveredCount, self.changeFilter.deviceDroppedCount, self.changeFilter.ownDeviceCount, self.changeFilter.variableDeliveredCount, self.changeFilter.variableDroppedCount))
+		for (stageName, valueCount, deliveredCount, droppedCount) in self.changeFilter.getStageStatistics():
+			self.logger.info(u'Change filter {0} ({1} value(s)): {2} passed, {3} dropped'.format(stageName, valueCount, deliveredCount, droppedCount))
+
+		(triggerCount, pendingTriggerCount) = self.triggerRegistry.getSizes()
+		self.logger.info(u'Trigger registry: {0} trigger(s), {1} event(s) fired matching {2} trigger(s), {3} executed in {4} batch(es), {5} waiting'.format(triggerCount, self.triggerRegistry.firedCount, self.triggerRegistry.matchedCount, self.triggerRegistry.executedCount, self.triggerRegistry.batchCount, pendingTriggerCount))
+		if self.triggerRegistry.suppressedCount > 0:
+			noisiestSources = u', '.join([u'{0}/{1}: {2}'.format(eventTypeId, indexValue, count) for ((eventTypeId, indexValue), count) in self.triggerRegistry.getNoisiestSources()])
+			self.logger.info(u'Trigger registry: {0} firing(s) suppressed by debounce/rate limits; noisiest: {1}'.format(self.triggerRegistry.suppressedCount, noisiestSources))
+
+		self.logger.info(u'State writer: {0} state change(s) posted, {1} replaced by a later change, {2} written in {3} server call(s), {4} waiting'.format(self.stateWriter.postedCount, self.stateWriter.replacedCount, self.stateWriter.writtenCount, self.stateWriter.serverCallCount, self.stateWriter.pendingCount))
+
+		logHandler = self.indigo_log_handler
+		if hasattr(logHandler, 'queuedCount'):
+			self.logger.info(u'Indigo log handler: {0} record(s) queued, {1} sent, {2} dropped, {3} pending'.format(logHandler.queuedCount, logHandler.sentCount, logHandler.droppedCount, logHandler.pendingCount))
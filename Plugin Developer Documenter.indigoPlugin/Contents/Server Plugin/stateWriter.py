@@ -0,0 +1,160 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Plugin Developer Documenter by RogueProeliator <rp@rogueproeliator.com>
+# 	Supporting module that batches device state updates. Updating several states with
+#	one call to updateStatesOnServer is far cheaper for the server than calling
+#	updateStateOnServer for each state; the writer below lets any thread of the plugin
+#	post state changes, which are collected per device and written on a short tick
+#	(or sooner once enough changes are waiting). When the same state of a device is
+#	changed more than once between ticks only the last value is written.
+#
+#	Written values are reported to the PluginDeviceCache (deviceCache.py) as they are
+#	posted so that states read from the cache include changes that are still waiting.
+#
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Python imports
+#/////////////////////////////////////////////////////////////////////////////////////////
+import collections
+import threading
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# DeviceStateWriter
+#	Collects (deviceId, key, value, uiValue) updates and writes them with a single
+#	updateStatesOnServer call per device
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+class DeviceStateWriter(object):
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# flushInterval is the tick in seconds (0 writes each update as soon as it is
+	# posted); maxPendingStates forces a write before the tick once that many states are
+	# waiting. errorFunc is called from within the except block if a write fails
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def __init__(self, deviceCache, errorFunc, flushInterval=0.1, maxPendingStates=200):
+		self.deviceCache = deviceCache
+		self.errorFunc = errorFunc
+		self.flushInterval = flushInterval
+		self.maxPendingStates = maxPendingStates
+
+		self._condition = threading.Condition(threading.Lock())
+		self._pendingStates = collections.OrderedDict()
+		self._pendingCount = 0
+		self._stopping = False
+		self._thread = None
+
+		# only one thread at a time writes to the server so that the writes for a device
+		# cannot be reordered between the tick thread and a caller of flush()
+		self._writeLock = threading.Lock()
+
+		self.postedCount = 0
+		self.replacedCount = 0
+		self.writtenCount = 0
+		self.serverCallCount = 0
+
+	def start(self):
+		self._thread = threading.Thread(target=self._tickThreadRun)
+		self._thread.setName("deviceStateWriter")
+		self._thread.setDaemon(True)
+		self._thread.start()
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Writes everything still waiting and stops the tick thread
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def stop(self, timeout=5.0):
+		with self._condition:
+			self._stopping = True
+			self._condition.notify()
+		if self._thread is not None:
+			self._thread.join(timeout)
+			self._thread = None
+		self.flush()
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Posts a change to a single state; a uiValue of None lets Indigo format the value
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def updateState(self, devId, key, value, uiValue=None):
+		self.updateStates(devId, [{'key' : key, 'value' : value, 'uiValue' : uiValue}])
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Posts changes to several states of a device, given in the same list of dictionaries
+	# format accepted by updateStatesOnServer
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def updateStates(self, devId, updatedStates):
+		self.deviceCache.noteStatesWritten(devId, updatedStates)
+		with self._condition:
+			wasEmpty = (self._pendingCount == 0)
+			deviceStates = self._pendingStates.get(devId, None)
+			if deviceStates is None:
+				deviceStates = collections.OrderedDict()
+				self._pendingStates[devId] = deviceStates
+			for updatedState in updatedStates:
+				key = updatedState['key']
+				if key in deviceStates:
+					self.replacedCount += 1
+				else:
+					self._pendingCount += 1
+				deviceStates[key] = (updatedState['value'], updatedState.get('uiValue', None))
+				self.postedCount += 1
+			# the tick thread sleeps while nothing is waiting; the first change starts its
+			# tick and reaching the threshold cuts the tick short
+			if wasEmpty or self._pendingCount >= self.maxPendingStates:
+				self._condition.notify()
+
+		if self.flushInterval <= 0.0 or self._thread is None:
+			self.flush()
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Writes all waiting changes on the calling thread and returns once they have been
+	# sent to the server; use this when the new values must be visible right away
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def flush(self):
+		with self._writeLock:
+			with self._condition:
+				pendingStates = self._pendingStates
+				self._pendingStates = collections.OrderedDict()
+				self._pendingCount = 0
+			for (devId, deviceStates) in pendingStates.iteritems():
+				self._writeDeviceStates(devId, deviceStates)
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Returns the number of states currently waiting to be written
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	@property
+	def pendingCount(self):
+		with self._condition:
+			return self._pendingCount
+
+	def _writeDeviceStates(self, devId, deviceStates):
+		updatedStates = []
+		for (key, (value, uiValue)) in deviceStates.iteritems():
+			if uiValue is None:
+				updatedStates.append({'key' : key, 'value' : value})
+			else:
+				updatedStates.append({'key' : key, 'value' : value, 'uiValue' : uiValue})
+		try:
+			self.deviceCache.getDevice(devId).updateStatesOnServer(updatedStates)
+			self.writtenCount += len(updatedStates)
+			self.serverCallCount += 1
+		except:
+			# a device that fails (for instance, one deleted since the update was posted)
+			# must not keep the other devices from being written
+			self.errorFunc()
+
+	def _tickThreadRun(self):
+		while True:
+			with self._condition:
+				while self._pendingCount == 0 and not self._stopping:
+					self._condition.wait()
+				if self._pendingCount < self.maxPendingStates and not self._stopping:
+					self._condition.wait(self.flushInterval)
+				if self._stopping:
+					return
+			self.flush()
@@ -0,0 +1,322 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Plugin Developer Documenter by RogueProeliator <rp@rogueproeliator.com>
+# 	Supporting module that keeps track of the plugin's triggers (those using the events
+#	defined in Events.xml) and executes them. Triggers are added and removed as Indigo
+#	calls triggerStartProcessing and triggerStopProcessing; each trigger is indexed by
+#	its event type and, when an index has been set up for the event type, by the value
+#	of one of its properties (for instance the device it watches, or a threshold rounded
+#	into a bucket) so that firing an event only looks at the triggers that match.
+#
+#	Matching triggers are not executed on the caller's thread; they are handed to a
+#	dispatcher thread which executes everything that is waiting in batches, so that
+#	firing an event from a device callback or the command thread never waits on the
+#	round trips to the server.
+#
+#	Firing limits may be set per event type (see setFiringLimits; the plugin takes them
+#	from the <FiringLimits> elements of Events.xml); they apply separately to each index
+#	value, so that one noisy device does not hold back the events of another:
+#		debounce	firings less than this many seconds apart are treated as one; with the
+#					leading edge the first firing executes the triggers, with the trailing
+#					edge they are executed once no firing has followed for the debounce
+#					time, and with both edges the first and (if there were more) the last
+#		maxRate		at most this many executions per second; firings beyond it are dropped
+#	Suppressed firings are counted by event type and index value so that noisy event
+#	sources may be found (see getNoisiestSources).
+#
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+# Python imports
+#/////////////////////////////////////////////////////////////////////////////////////////
+import collections
+import threading
+import time
+
+import indigo
+
+
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+# TriggerRegistry
+#	Thread-safe registry of the plugin's triggers, keyed by event type ID and index value
+#/////////////////////////////////////////////////////////////////////////////////////////
+#/////////////////////////////////////////////////////////////////////////////////////////
+class TriggerRegistry(object):
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# errorFunc is called from within the except block if executing a trigger (or finding
+	# the index value of one being added) fails; maxBatchSize limits the number of
+	# triggers executed before the dispatcher checks for a stop request
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def __init__(self, errorFunc, maxBatchSize=100):
+		self.errorFunc = errorFunc
+		self.maxBatchSize = maxBatchSize
+
+		self._lock = threading.Lock()
+		self._indexes = dict()
+		self._triggers = dict()
+		self._indexedTriggers = dict()
+		self._triggerIndexValues = dict()
+
+		self._condition = threading.Condition(threading.Lock())
+		self._pendingTriggers = collections.deque()
+
+		# firing limit state, keyed by (event type ID, index value); protected by _condition
+		self._firingLimits = dict()
+		self._lastFiringTimes = dict()
+		self._lastExecutionTimes = dict()
+		self._trailingFiringTimes = dict()
+		self._suppressedCounts = collections.Counter()
+		self._stopping = False
+		self._thread = None
+
+		self.firedCount = 0
+		self.matchedCount = 0
+		self.executedCount = 0
+		self.batchCount = 0
+		self.suppressedCount = 0
+
+	def start(self):
+		self._thread = threading.Thread(target=self._dispatcherThreadRun)
+		self._thread.setName("triggerDispatcher")
+		self._thread.setDaemon(True)
+		self._thread.start()
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Executes the triggers still waiting (including trailing edge firings that are not
+	# yet due) and stops the dispatcher thread
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def stop(self, timeout=5.0):
+		with self._condition:
+			self._stopping = True
+			self._condition.notify()
+		if self._thread is not None:
+			self._thread.join(timeout)
+			self._thread = None
+		self._queueDueFirings(None)
+		self._executePending()
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Limits how often the triggers of an event type are executed (see the module notes);
+	# edge is "leading", "trailing" or "both" and a debounce or maxRate of 0 turns that
+	# limit off
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def setFiringLimits(self, eventTypeId, debounce=0.0, edge=u"leading", maxRate=0.0):
+		if edge not in (u"leading", u"trailing", u"both"):
+			raise ValueError(u"edge must be leading, trailing or both")
+		minInterval = 1.0 / maxRate if maxRate > 0.0 else 0.0
+		with self._condition:
+			if debounce > 0.0 or minInterval > 0.0:
+				self._firingLimits[eventTypeId] = (debounce, edge, minInterval)
+			else:
+				self._firingLimits.pop(eventTypeId, None)
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Indexes the triggers of an event type by the value of one of their properties;
+	# keyFunc, if given, turns the property value into the index value (for example to
+	# round a threshold into a bucket). Set up indexes before triggers are added
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def setIndex(self, eventTypeId, propKey, keyFunc=None):
+		with self._lock:
+			self._indexes[eventTypeId] = (propKey, keyFunc)
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Called from triggerStartProcessing and triggerStopProcessing. A trigger whose index
+	# value cannot be found (its keyFunc raised, e.g. int() of a blank property) is not
+	# added; the error is passed to errorFunc and any earlier entry for it is removed
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def addTrigger(self, trigger):
+		eventTypeId = trigger.pluginTypeId
+		with self._lock:
+			index = self._indexes.get(eventTypeId, None)
+		indexValue = None
+		if index is not None:
+			try:
+				indexValue = self._getIndexValue(index, trigger)
+			except:
+				self.errorFunc()
+				self.removeTrigger(trigger)
+				return
+
+		with self._lock:
+			self._removeTrigger(trigger.id)
+			self._triggers.setdefault(eventTypeId, dict())[trigger.id] = trigger
+			if index is not None:
+				self._indexedTriggers.setdefault(eventTypeId, dict()).setdefault(indexValue, dict())[trigger.id] = trigger
+			self._triggerIndexValues[trigger.id] = (eventTypeId, indexValue)
+
+	def removeTrigger(self, trigger):
+		with self._lock:
+			self._removeTrigger(trigger.id)
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Returns the triggers of the event type; for an indexed event type, only those with
+	# the given index value unless it is None
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def getTriggers(self, eventTypeId, indexValue=None):
+		with self._lock:
+			if indexValue is not None and eventTypeId in self._indexes:
+				triggers = self._indexedTriggers.get(eventTypeId, {}).get(indexValue, None)
+			else:
+				triggers = self._triggers.get(eventTypeId, None)
+			if triggers is None:
+				return []
+			return triggers.values()
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Queues the matching triggers (see getTriggers) for execution and returns how many
+	# there were; they are executed by the dispatcher thread, or right away when it has
+	# not been started
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def fire(self, eventTypeId, indexValue=None):
+		with self._condition:
+			self.firedCount += 1
+			firingLimits = self._firingLimits.get(eventTypeId, None)
+			if firingLimits is not None and not self._passFiringLimits(firingLimits, (eventTypeId, indexValue), time.time()):
+				return 0
+		return self._queueTriggers(eventTypeId, indexValue)
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Returns the (event type ID, index value) pairs with the most suppressed firings, as
+	# a list of ((event type ID, index value), count), most suppressed first
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def getNoisiestSources(self, count=5):
+		with self._condition:
+			return self._suppressedCounts.most_common(count)
+
+	def _queueTriggers(self, eventTypeId, indexValue):
+		triggers = self.getTriggers(eventTypeId, indexValue)
+		with self._condition:
+			self.matchedCount += len(triggers)
+			if len(triggers) == 0:
+				return 0
+			wasEmpty = (len(self._pendingTriggers) == 0)
+			self._pendingTriggers.extend(triggers)
+			if wasEmpty:
+				self._condition.notify()
+
+		if self._thread is None:
+			self._executePending()
+		return len(triggers)
+
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	# Returns the number of triggers registered and the number waiting to be executed
+	#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+	def getSizes(self):
+		with self._lock:
+			triggerCount = len(self._triggerIndexValues)
+		with self._condition:
+			return (triggerCount, len(self._pendingTriggers))
+
+	# returns True if the triggers should be executed now; the caller must hold _condition
+	def _passFiringLimits(self, firingLimits, key, now):
+		(debounce, edge, minInterval) = firingLimits
+		if debounce > 0.0:
+			lastFiringTime = self._lastFiringTimes.get(key, None)
+			self._lastFiringTimes[key] = now
+			quiet = (lastFiringTime is None or now - lastFiringTime >= debounce)
+			if edge == u"trailing" or (edge == u"both" and not quiet):
+				# (re)schedule the trailing edge; a firing it replaces is suppressed
+				if key in self._trailingFiringTimes:
+					self._countSuppressed(key)
+				self._trailingFiringTimes[key] = now + debounce
+				self._condition.notify()
+				return False
+			if not quiet:
+				self._countSuppressed(key)
+				return False
+		return self._passMaxRate(key, minInterval, now)
+
+	def _passMaxRate(self, key, minInterval, now):
+		if minInterval > 0.0:
+			lastExecutionTime = self._lastExecutionTimes.get(key, None)
+			if lastExecutionTime is not None and now - lastExecutionTime < minInterval:
+				self._countSuppressed(key)
+				return False
+			self._lastExecutionTimes[key] = now
+		return True
+
+	def _countSuppressed(self, key):
+		self.suppressedCount += 1
+		self._suppressedCounts[key] += 1
+
+	# queues the triggers of the trailing edge firings due by dueTime (all of them if it
+	# is None)
+	def _queueDueFirings(self, dueTime):
+		with self._condition:
+			dueKeys = []
+			for (key, firingTime) in self._trailingFiringTimes.items():
+				if dueTime is None or firingTime <= dueTime:
+					del self._trailingFiringTimes[key]
+					if self._passMaxRate(key, self._firingLimits.get(key[0], (0.0, None, 0.0))[2], time.time()):
+						dueKeys.append(key)
+		for (eventTypeId, indexValue) in dueKeys:
+			self._queueTriggers(eventTypeId, indexValue)
+
+	# the caller must hold the lock
+	def _removeTrigger(self, triggerId):
+		indexInfo = self._triggerIndexValues.pop(triggerId, None)
+		if indexInfo is None:
+			return
+		(eventTypeId, indexValue) = indexInfo
+		triggers = self._triggers[eventTypeId]
+		del triggers[triggerId]
+		if len(triggers) == 0:
+			del self._triggers[eventTypeId]
+		indexedTriggers = self._indexedTriggers.get(eventTypeId, None)
+		if indexedTriggers is not None and indexValue in indexedTriggers:
+			triggers = indexedTriggers[indexValue]
+			triggers.pop(triggerId, None)
+			if len(triggers) == 0:
+				del indexedTriggers[indexValue]
+
+	def _getIndexValue(self, index, trigger):
+		(propKey, keyFunc) = index
+		value = trigger.pluginProps.get(propKey, None)
+		if keyFunc is not None:
+			value = keyFunc(value)
+		return value
+
+	def _executePending(self):
+		while self._executeBatch():
+			pass
+
+	# executes up to maxBatchSize of the waiting triggers; returns False if none were
+	# waiting
+	def _executeBatch(self):
+		with self._condition:
+			batchSize = min(len(self._pendingTriggers), self.maxBatchSize)
+			if batchSize == 0:
+				return False
+			batch = [self._pendingTriggers.popleft() for index in xrange(batchSize)]
+			self.batchCount += 1
+		for trigger in batch:
+			try:
+				indigo.trigger.execute(trigger)
+				self.executedCount += 1
+			except:
+				# a trigger that fails (for instance, one deleted since the event was
+				# fired) must not keep the rest of the batch from being executed
+				self.errorFunc()
+		return True
+
+	def _dispatcherThreadRun(self):
+		while True:
+			with self._condition:
+				while len(self._pendingTriggers) == 0 and not self._stopping:
+					if len(self._trailingFiringTimes) == 0:
+						self._condition.wait()
+					else:
+						delay = min(self._trailingFiringTimes.itervalues()) - time.time()
+						if delay <= 0.0:
+							break
+						self._condition.wait(delay)
+				if self._stopping:
+					return
+			self._queueDueFirings(time.time())
+			self._executeBatch()